@@ -20,7 +20,7 @@ VERSION = None  # get this from __version__.py
 REQUIRED = [line.rstrip('\n') for line in open('requirements.txt')]
 
 # What packages are optional?
-EXTRAS = {"prod": ["mod_wsgi"]}
+EXTRAS = {"prod": ["mod_wsgi"], "test": ["pytest"], "archive": ["pyarrow"]}
 
 # get the absolute path to this file
 here = os.path.abspath(os.path.dirname(__file__))
@@ -78,7 +78,15 @@ setup(
     scripts=["bin/run-fitly-prod"],
     entry_points={
         "console_scripts": [
-            "run-fitly-dev=fitly.dev_cli:main"
+            "run-fitly-dev=fitly.dev_cli:main",
+            "fitly-rebuild-power-curves=fitly.dev_cli:rebuild_power_curves",
+            "fitly-rebuild-training-load=fitly.dev_cli:rebuild_training_load",
+            "fitly-compact-samples=fitly.dev_cli:compact_samples",
+            "fitly-archive-samples=fitly.dev_cli:archive_activity_samples",
+            "fitly-import-time=fitly.dev_cli:import_time",
+            "fitly-bench-zones=fitly.dev_cli:bench_zones",
+            "fitly-bench-bulk-insert=fitly.dev_cli:bench_bulk_insert",
+            "fitly-bench-streams=fitly.dev_cli:bench_streams"
         ]
     },
 )
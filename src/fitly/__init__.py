@@ -2,9 +2,10 @@ from flask import Flask
 from dash import Dash
 
 from .__version__ import __version__
-from .utils import get_dash_args_from_flask_config
+from .utils import get_dash_args_from_flask_config, config
 from sqlalchemy.orm import scoped_session
 from .api.database import SessionLocal, engine
+from .api.migrations import migrate
 from .api.sqlalchemy_declarative import *
 from datetime import datetime
 
@@ -26,7 +27,7 @@ def create_flask(config_object=f"{__package__}.settings"):
 
 
 def create_dash(server):
-    Base.metadata.create_all(bind=engine)
+    migrate(engine)
 
     """Create the Dash instance for this application"""
     app = Dash(
@@ -71,10 +72,32 @@ def db_startup(app):
             oura_status='System Startup',
             strava_status='System Startup',
             withings_status='System Startup',
-            fitbod_status='System Startup')
+            fitbod_status='System Startup',
+            stryd_status='System Startup')
         app.session.add(dummy_db_refresh_record)
         app.session.commit()
 
+    # Backfill power_curve_bests for databases created before it existed
+    if app.session.query(powerCurveBests).first() is None and app.session.query(stravaBestSamples).first() is not None:
+        from .api.power_curves import rebuild_power_curve_bests
+        rebuild_power_curve_bests()
+
+    # Backfill daily_training_load for databases created before it existed
+    if app.session.query(dailyTrainingLoad).first() is None and app.session.query(stravaSummary).first() is not None:
+        from .api.training_load import rebuild_daily_training_load
+        rebuild_daily_training_load()
+
+    # Databases created before strava_samples_compact existed keep their samples in strava_samples (where
+    # load_samples() still reads them from) until they are moved, either by fitly-compact-samples or on startup when
+    # [database] compact_samples_on_startup is set
+    from .api.samples import compact_strava_samples, legacy_samples_exist
+    if legacy_samples_exist():
+        if config.get('database', 'compact_samples_on_startup', fallback='False').lower() == 'true':
+            compact_strava_samples()
+        else:
+            app.server.logger.info('strava_samples has not been moved into strava_samples_compact yet, run '
+                                   'fitly-compact-samples to reclaim its space')
+
     # If fitbod_muslces table not populated create
     fitbod_muscles_table = True if len(app.session.query(fitbod_muscles).all()) > 0 else False
     if not fitbod_muscles_table:
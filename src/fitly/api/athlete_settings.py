@@ -0,0 +1,55 @@
+import threading
+import time
+from dataclasses import make_dataclass, fields
+from typing import Optional
+
+from sqlalchemy import select
+
+from .database import engine
+from .sqlalchemy_declarative import athlete
+from ..utils import config
+
+# Read only snapshot of an athlete row, one typed field per athlete column
+AthleteSettings = make_dataclass(
+    'AthleteSettings', [(column.key, Optional[column.type.python_type]) for column in athlete.__table__.columns],
+    frozen=True)
+
+# Saves invalidate the cache of the process serving them, the ttl bounds how stale other worker processes can be
+athlete_settings_ttl = float(config.get('cache', 'athlete_settings_ttl', fallback=60))
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def athlete_settings(athlete_id=1):
+    '''
+    Cached settings of an athlete, shared across callbacks and threads
+    :param athlete_id: Athlete to look up
+    :return: AthleteSettings, or None if the athlete does not exist
+    '''
+    cached = _cache.get(athlete_id)
+    if cached is not None and time.monotonic() - cached[0] < athlete_settings_ttl:
+        return cached[1]
+
+    # Own short lived connection so a lookup never leaves a transaction open on the caller's session
+    with engine.connect() as connection:
+        row = connection.execute(select(athlete.__table__).where(athlete.athlete_id == athlete_id)).first()
+    if row is None:
+        return None
+
+    settings = AthleteSettings(**{field.name: row._mapping[field.name] for field in fields(AthleteSettings)})
+    with _cache_lock:
+        _cache[athlete_id] = (time.monotonic(), settings)
+    return settings
+
+
+def invalidate_athlete_settings(athlete_id=None):
+    '''
+    Drop cached settings after athlete values are saved
+    :param athlete_id: Athlete whose settings changed (all athletes if None)
+    '''
+    with _cache_lock:
+        if athlete_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(athlete_id, None)
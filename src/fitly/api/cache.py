@@ -0,0 +1,160 @@
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from sqlalchemy import select, func, case
+
+from .database import engine
+from .sqlalchemy_declarative import dbRefreshStatus, dataGeneration
+from ..utils import config
+
+# off, memory (per gunicorn worker) or disk (shared by every gunicorn worker on the host)
+backend = config.get('cache', 'dataframe_cache', fallback='memory').lower()
+cache_dir = config.get('cache', 'dataframe_cache_dir', fallback='./config/cache')
+budget_bytes = float(config.get('cache', 'dataframe_cache_mb', fallback=256)) * 1024 * 1024
+
+
+def data_generation():
+    '''
+    Identity of the data currently in the db: the last completed refresh and the last time the processing flag was
+    cleared, which also moves forward when a refresh fails after committing some of its data
+    :return: Tuple of both timestamps, or None while a refresh is still writing to the db
+    '''
+    with engine.connect() as connection:
+        processing, generation = connection.execute(select(
+            func.sum(case((dbRefreshStatus.refresh_method == 'processing', 1), else_=0)),
+            func.max(case((dbRefreshStatus.strava_status.isnot(None), dbRefreshStatus.timestamp_utc))))).first()
+        if processing:
+            return None
+        updated = connection.execute(select(func.max(dataGeneration.updated_utc))).scalar()
+    return generation, updated
+
+
+def value_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class MemoryCache:
+    '''
+    Per process LRU, evicting least recently used values once their total size goes over the budget
+    '''
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.values = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.values:
+                return None
+            self.values.move_to_end(key)
+            # Callers are free to modify what they get back
+            return self.values[key][0].copy()
+
+    def set(self, key, value):
+        size = value_size(value)
+        if size > self.budget:
+            return
+        with self.lock:
+            if key in self.values:
+                self.size -= self.values.pop(key)[1]
+            self.values[key] = (value.copy(), size)
+            self.size += size
+            while self.size > self.budget:
+                self.size -= self.values.popitem(last=False)[1][1]
+
+
+class DiskCache:
+    '''
+    Pickle file per value in a directory shared by every gunicorn worker. Reads refresh the file's mtime, and writes
+    evict the least recently read files once the directory goes over the budget
+    '''
+
+    def __init__(self, directory, budget):
+        self.directory = directory
+        self.budget = budget
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + '.pkl')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+            return value
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        # Write to a temp file and rename so other processes never read a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(file[1] for file in files)
+        for mtime, file_size, path in sorted(files):
+            if size <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= file_size
+
+
+store = None
+if backend == 'memory':
+    store = MemoryCache(budget_bytes)
+elif backend == 'disk':
+    store = DiskCache(cache_dir, budget_bytes)
+
+
+def cached_on_refresh(loader):
+    '''
+    Memoize a DataFrame loader until the data in the db changes. The key is the loader, its arguments and
+    data_generation(), nothing is cached while a refresh is running
+    '''
+
+    @functools.wraps(loader)
+    def wrapper(*args, **kwargs):
+        if store is None:
+            return loader(*args, **kwargs)
+        generation = data_generation()
+        if generation is None:
+            return loader(*args, **kwargs)
+
+        key = (loader.__module__, loader.__qualname__, args, tuple(sorted(kwargs.items())), generation)
+        value = store.get(key)
+        if value is None:
+            value = loader(*args, **kwargs)
+            store.set(key, value)
+        return value
+
+    return wrapper
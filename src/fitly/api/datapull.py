@@ -1,16 +1,25 @@
-from ..api.stravaApi import get_strava_client, strava_connected
+from ..api.stravaApi import get_strava_client, strava_connected, strava_scheduler, strava_client_cache
 from ..api.ouraAPI import pull_oura_data
 from ..api.api_withings import pull_withings_data
 from ..api.fitbodAPI import pull_fitbod_data
 from ..api.pelotonApi import get_peloton_class_names
 from ..api.strydAPI import pull_stryd_data
 from ..api.sqlalchemy_declarative import *
-from sqlalchemy import func, delete
+from sqlalchemy import func, delete, select
 import datetime
 from ..api.fitlyAPI import *
+from ..api.power_curves import rebuild_power_curve_bests
+from ..api.training_load import update_daily_training_load, rebuild_daily_training_load
+from ..api.database import bulk_write
+from ..api.strava_sync import list_new_activities, save_sync_cursor
+from ..api.samples_archive import delete_archive, clear_archive
+from ..api.athlete_settings import athlete_settings
+from ..api.pipeline_timings import span, save_timings
 import pandas as pd
 from ..app import app
 from ..utils import config, withings_credentials_supplied, oura_credentials_supplied, nextcloud_credentials_supplied
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import perf_counter
 
 
 def latest_refresh():
@@ -20,9 +29,154 @@ def latest_refresh():
     return latest_date
 
 
+def scrape_activity(fitly_act, athlete_id):
+    # Fetch streams and compute metrics without writing, writes are done by the single writer in ingest_activities()
+    try:
+        fitly_act.stravaScrape(athlete_id=athlete_id, dbinsert=False)
+    finally:
+        app.session.remove()
+    return fitly_act
+
+
+def write_activities(futures):
+    failed = 0
+    for future in futures:
+        try:
+            fitly_act = future.result()
+            if hasattr(fitly_act, 'df_samples'):
+                fitly_act.write_dfs_to_db()
+        except Exception as e:
+            app.server.logger.error('Error ingesting strava activity: {}'.format(e))
+            failed += 1
+    return failed
+
+
+def ingest_activities(new_activities, athlete_id):
+    '''
+    Scrape activities on a bounded pool of [strava] ingest_workers threads while the calling thread is the only one
+    writing to the db. Each activity is committed in its own transaction, so a failed or interrupted run just picks
+    up the remaining activities on the next refresh
+    '''
+    workers = max(int(config.get('strava', 'ingest_workers', fallback=1)), 1)
+    failed = 0
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Pop activities as they are submitted so written activities (and their samples) can be garbage collected
+        while new_activities:
+            fitly_act = new_activities.pop(0)
+            pending.add(executor.submit(scrape_activity, fitly_act, athlete_id))
+            # Later rides take their ftp from the latest 'ftp test' in strava_summary, so let it land before moving on
+            if 'ftp test' in str(fitly_act.name).lower():
+                failed += write_activities(wait(pending).done)
+                pending = set()
+            # Cap scraped activities waiting on the writer at 2 per worker
+            elif len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                failed += write_activities(done)
+        failed += write_activities(wait(pending).done)
+
+    if failed:
+        raise Exception('{} strava activities failed to import'.format(failed))
+
+
+def pull_oura():
+    status = pull_oura_data()
+    return 'Successful' if status else 'Oura cloud not yet updated'
+
+
+def pull_strava(oura='No Credentials', **statuses):
+    '''
+    :param oura: Status of this refresh's oura pull
+    :param statuses: Statuses of the other sources strava waited on
+    '''
+    # Only pull strava data if oura cloud has been updated with latest day, or no oura credentials so strava will use athlete static resting hr
+    if oura not in ['Successful', 'No Credentials']:
+        app.server.logger.info('Oura cloud not yet updated. Waiting to pull Strava data')
+        return 'Awaiting oura cloud update'
+
+    if strava_connected():
+        athlete_id = 1  # TODO: Make this dynamic if ever expanding to more users
+        client = get_strava_client()
+        # Only activities newer than the sync cursor are listed, apart from periodic full passes
+        activities, full_sync, newest = list_new_activities(client, athlete_id=athlete_id)
+        app.server.logger.debug('Strava {} sync listed {} new activities'.format(
+            'full' if full_sync else 'incremental', len(activities)))
+
+        athlete_info = athlete_settings(athlete_id)
+        min_non_warmup_workout_time = athlete_info.min_non_warmup_workout_time
+        new_activities = []
+        for act in activities:
+            new_activities.append(FitlyActivity(act))
+            app.server.logger.info('New Workout found: "{}"'.format(act.name))
+        # If new workouts found, analyze and insert
+        if len(new_activities) > 0:
+            ingest_activities(new_activities, athlete_id=athlete_id)
+        # Every listed activity is now stored (ingest_activities raises otherwise)
+        with bulk_write() as connection:
+            save_sync_cursor(connection, newest, full_sync, athlete_id=athlete_id)
+        # Only run hrv training workflow if oura connection available to use hrv data or readiness score
+        if oura == 'Successful':
+            training_workflow(min_non_warmup_workout_time=min_non_warmup_workout_time,
+                              metric=athlete_settings().recovery_metric)
+
+    app.server.logger.debug('stravaScrape() complete...')
+    app.server.logger.debug('Strava client cache: {}'.format(strava_client_cache.stats()))
+    return 'Successful'
+
+
+def run_pull(source, pull, **statuses):
+    '''
+    Pull one source, timing it and turning any error into its status
+    :return: Tuple of (status, seconds)
+    '''
+    start = perf_counter()
+    try:
+        app.server.logger.info('Pulling {} data...'.format(source))
+        with span('pull.' + source):
+            status = pull(**statuses)
+        # Pulls that don't report a status (i.e. return what they inserted) succeeded if they didn't raise
+        status = status if isinstance(status, str) else 'Successful'
+    except BaseException as e:
+        app.server.logger.error('Error pulling {} data: {}'.format(source, e))
+        status = str(e)
+    finally:
+        app.session.remove()
+    seconds = perf_counter() - start
+    app.server.logger.debug('Pulled {} data in {:.1f}s: {}'.format(source, seconds, status))
+    return status, seconds
+
+
+def run_pulls(sources):
+    '''
+    Pull sources concurrently on a thread pool, starting each one once the sources it waits on are done. The pulls
+    are network bound, so the pull stage takes about as long as its slowest chain
+    :param sources: Dict of source name to (pull function, names of the sources it waits on). Pull functions get
+    the status of each source they wait on as a keyword argument named after the source
+    :return: Dict of source name to (status, seconds)
+    '''
+    for source, (pull, after) in sources.items():
+        if not set(after) <= set(sources) or source in after:
+            raise ValueError('{} waits on a source that is not pulled: {}'.format(source, after))
+
+    results, running, pending = {}, {}, dict(sources)
+    with ThreadPoolExecutor(max_workers=max(len(sources), 1)) as executor:
+        while pending or running:
+            for source, (pull, after) in list(pending.items()):
+                if all(name in results for name in after):
+                    running[executor.submit(run_pull, source, pull,
+                                            **{name: results[name][0] for name in after})] = source
+                    del pending[source]
+            if not running:
+                raise ValueError('Sources wait on each other: {}'.format(list(pending)))
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+
 def refresh_database(refresh_method='system', truncate=False, truncateDate=None):
     run_time = datetime.utcnow()
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     processing = app.session.query(dbRefreshStatus).filter(dbRefreshStatus.refresh_method == 'processing').first()
     # Add record for refresh audit trail
     refresh_record = dbRefreshStatus(timestamp_utc=run_time, refresh_method=refresh_method,
@@ -43,12 +197,18 @@ def refresh_database(refresh_method='system', truncate=False, truncateDate=None)
                     # If only truncating past a certain date
                     if truncateDate:
                         try:
+                            app.server.logger.debug('Truncating strava_samples_compact')
+                            # Samples are keyed on activity, so go by the start of the activities being truncated
+                            truncated = select(stravaSummary.activity_id).where(
+                                stravaSummary.start_date_utc >= truncateDate)
+                            # Files of re-ingested activities would otherwise be served instead of their new samples
+                            for activity_id in app.session.execute(truncated).scalars():
+                                delete_archive(activity_id)
+                            app.session.execute(delete(stravaSamplesCompact).where(
+                                stravaSamplesCompact.activity_id.in_(truncated)))
                             app.server.logger.debug('Truncating strava_summary')
                             app.session.execute(
                                 delete(stravaSummary).where(stravaSummary.start_date_utc >= truncateDate))
-                            app.server.logger.debug('Truncating strava_samples')
-                            app.session.execute(
-                                delete(stravaSamples).where(stravaSamples.timestamp_local >= truncateDate))
                             app.server.logger.debug('Truncating strava_best_samples')
                             app.session.execute(
                                 delete(stravaBestSamples).where(stravaBestSamples.timestamp_local >= truncateDate))
@@ -76,6 +236,8 @@ def refresh_database(refresh_method='system', truncate=False, truncateDate=None)
                                 workoutStepLog.date >= (truncateDate - timedelta(days=1))))
                             app.server.logger.debug('Truncating withings')
                             app.session.execute(delete(withings).where(withings.date_utc >= truncateDate))
+                            app.server.logger.debug('Resetting strava_sync')
+                            app.session.execute(delete(stravaSync))
                             app.session.commit()
                         except BaseException as e:
                             app.session.rollback()
@@ -84,8 +246,9 @@ def refresh_database(refresh_method='system', truncate=False, truncateDate=None)
                         try:
                             app.server.logger.debug('Truncating strava_summary')
                             app.session.execute(delete(stravaSummary))
-                            app.server.logger.debug('Truncating strava_samples')
-                            app.session.execute(delete(stravaSamples))
+                            app.server.logger.debug('Truncating strava_samples_compact')
+                            app.session.execute(delete(stravaSamplesCompact))
+                            clear_archive()
                             app.server.logger.debug('Truncating strava_best_samples')
                             app.session.execute(delete(stravaBestSamples))
                             app.server.logger.debug('Truncating oura_readiness_summary')
@@ -104,6 +267,8 @@ def refresh_database(refresh_method='system', truncate=False, truncateDate=None)
                             app.session.execute(delete(withings))
                             app.server.logger.debug('Truncating fitbod')
                             app.session.execute(delete(fitbod))
+                            app.server.logger.debug('Resetting strava_sync')
+                            app.session.execute(delete(stravaSync))
                             app.session.commit()
                         except BaseException as e:
                             app.session.rollback()
@@ -111,52 +276,37 @@ def refresh_database(refresh_method='system', truncate=False, truncateDate=None)
 
                     app.session.remove()
 
-                ### Pull Weight Data ###
+                    # Bucket bests may belong to deleted best samples
+                    app.server.logger.debug('Rebuilding power_curve_bests')
+                    rebuild_power_curve_bests()
 
-                # If withings credentials in config.ini, populate withings table
+                    app.server.logger.debug('Refreshing daily_training_load')
+                    if truncateDate:
+                        # strava_summary is truncated on utc start, so also redo the local day before
+                        with bulk_write() as connection:
+                            update_daily_training_load((truncateDate - timedelta(days=1)).date(), connection)
+                    else:
+                        rebuild_daily_training_load()
+
+                ### Pull Data ###
+
+                # Each source is pulled as soon as the sources it waits on are done, sources without credentials
+                # are left out
+                sources = {}
                 if withings_credentials_supplied:
-                    try:
-                        app.server.logger.info('Pulling withings data...')
-                        pull_withings_data()
-                        withings_status = 'Successful'
-                    except BaseException as e:
-                        app.server.logger.error('Error pulling withings data: {}'.format(e))
-                        withings_status = str(e)
-                else:
-                    withings_status = 'No Credentials'
-
-                ### Pull Fitbod Data ###
-
-                # If nextcloud credentials in config.ini, pull fitbod data from nextcloud location
+                    sources['withings'] = (pull_withings_data, [])
                 if nextcloud_credentials_supplied:
-                    try:
-                        app.server.logger.info('Pulling fitbod data...')
-                        pull_fitbod_data()
-                        fitbod_status = 'Successful'
-                    except BaseException as e:
-                        app.server.logger.error('Error pulling fitbod data: {}'.format(e))
-                        fitbod_status = str(e)
-                else:
-                    fitbod_status = 'No Credentials'
-
-                ### Pull Oura Data ###
-
-                if oura_credentials_supplied:
-                    # Pull Oura Data before strava because resting heart rate used in strava sample heart rate zones
-                    try:
-                        app.server.logger.info('Pulling oura data...')
-                        oura_status = pull_oura_data()
-                        oura_status = 'Successful' if oura_status else 'Oura cloud not yet updated'
-                    except BaseException as e:
-                        app.server.logger.error('Error pulling oura data: {}'.format(e))
-                        oura_status = str(e)
-                else:
-                    oura_status = 'No Credentials'
-
-                ### Pull Stryd Data ###
+                    # Pull fitbod data from nextcloud location
+                    sources['fitbod'] = (pull_fitbod_data, [])
                 if stryd_credentials_supplied:
-                    app.server.logger.info('Pulling stryd data...')
-                    pull_stryd_data()
+                    sources['stryd'] = (pull_stryd_data, [])
+                if oura_credentials_supplied:
+                    sources['oura'] = (pull_oura, [])
+                # Strava goes last: activities are only scraped once, and their resting hr (oura), weight (withings),
+                # ftp (stryd) and wSS (fitbod) come from the other sources' tables
+                sources['strava'] = (pull_strava, list(sources))
+                with span('pull'):
+                    results = run_pulls(sources)
 
                 ### This has been moved to crontab as spotify refresh is required more frequently than hourly ###
                 # ### Pull Spotify Data ###
@@ -164,65 +314,22 @@ def refresh_database(refresh_method='system', truncate=False, truncateDate=None)
                 #     app.server.logger.info('Pulling spotify play history...')
                 #     save_spotify_play_history()
 
-                ### Pull Strava Data ###
-
-                # Only pull strava data if oura cloud has been updated with latest day, or no oura credentials so strava will use athlete static resting hr
-                if oura_status == 'Successful' or oura_status == 'No Credentials':
-                    try:
-                        app.server.logger.info('Pulling strava data...')
-
-                        if strava_connected():
-                            athlete_id = 1  # TODO: Make this dynamic if ever expanding to more users
-                            client = get_strava_client()
-                            after = config.get('strava', 'activities_after_date')
-                            activities = client.get_activities(after=after,
-                                                               limit=0)  # Use after to sort from oldest to newest
-
-                            athlete_info = app.session.query(athlete).filter(athlete.athlete_id == athlete_id).first()
-                            min_non_warmup_workout_time = athlete_info.min_non_warmup_workout_time
-                            # Loop through the activities, and create a dict of the dataframe stream data of each activity
-                            db_activities = pd.read_sql(
-                                sql=app.session.query(stravaSummary.activity_id).filter(
-                                    stravaSummary.athlete_id == athlete_id).distinct(
-                                    stravaSummary.activity_id).statement,
-                                con=engine)
-
-                            app.session.remove()
-                            new_activities = []
-                            for act in activities:
-                                # If not already in db, parse and insert
-                                if act.id not in db_activities['activity_id'].unique():
-                                    new_activities.append(FitlyActivity(act))
-                                    app.server.logger.info('New Workout found: "{}"'.format(act.name))
-                            # If new workouts found, analyze and insert
-                            if len(new_activities) > 0:
-                                for fitly_act in new_activities:
-                                    fitly_act.stravaScrape(athlete_id=athlete_id)
-                            # Only run hrv training workflow if oura connection available to use hrv data or readiness score
-                            if oura_status == 'Successful':
-                                training_workflow(min_non_warmup_workout_time=min_non_warmup_workout_time,
-                                                  metric=app.session.query(athlete).filter(
-                                                      athlete.athlete_id == 1).first().recovery_metric)
-
-                        app.server.logger.debug('stravaScrape() complete...')
-                        strava_status = 'Successful'
-                    except BaseException as e:
-                        app.server.logger.error('Error pulling strava data: {}'.format(e))
-                        strava_status = str(e)
-                else:
-                    app.server.logger.info('Oura cloud not yet updated. Waiting to pull Strava data')
-                    strava_status = 'Awaiting oura cloud update'
-
                 app.server.logger.debug('Updating db refresh record with status...')
                 refresh_record = app.session.query(dbRefreshStatus).filter(
                     dbRefreshStatus.timestamp_utc == run_time).first()
-                refresh_record.oura_status = oura_status
-                refresh_record.fitbod_status = fitbod_status
-                refresh_record.strava_status = strava_status
-                refresh_record.withings_status = withings_status
+                for source in ['withings', 'fitbod', 'stryd', 'oura', 'strava']:
+                    status, seconds = results.get(source, ('No Credentials', None))
+                    setattr(refresh_record, source + '_status', status)
+                    setattr(refresh_record, source + '_seconds', seconds)
+                refresh_record.strava_api_budget = strava_scheduler.status()
                 refresh_record.refresh_method = refresh_method
                 app.session.commit()
 
+                try:
+                    save_timings(run_time)
+                except BaseException as e:
+                    app.server.logger.warning('Could not save pipeline timings: {}'.format(e))
+
                 # Refresh peloton class types local json file
                 if peloton_credentials_supplied:
                     get_peloton_class_names()
@@ -1,24 +1,34 @@
 from datetime import datetime, timedelta
 import numpy as np
 from ..api.sqlalchemy_declarative import ouraSleepSummary, ouraReadinessSummary, withings, athlete, stravaSummary, \
-    strydSummary, fitbod, workoutStepLog, dbRefreshStatus
-from sqlalchemy import func, cast, Date
+    strydSummary, fitbod, workoutStepLog, dbRefreshStatus, dataGeneration
+from sqlalchemy import func, cast, Date, update
 from sweat.io.models.dataframes import WorkoutDataFrame, Athlete
 from sweat.pdm import critical_power
 from sweat.metrics.core import weighted_average_power
 from sweat.metrics.power import *
 import stravalib
 from ..api.stravaApi import get_strava_client
+from ..api.zones import zone_thresholds, classify_zones, sport_family, zone_intensity_seconds
 from ..api.spotifyAPI import generate_recommendation_playlists
 from stravalib import unithelper
 from ..api.pelotonApi import peloton_mapping_df, roundTime, set_peloton_workout_recommendations
 from dateutil.relativedelta import relativedelta
 from ..app import app
-from .database import engine
+from .database import engine, bulk_write, bulk_insert
+from .power_curves import update_power_curve_bests
+from .training_load import update_daily_training_load
+from .athlete_settings import athlete_settings
+from .streams import normalize_streams
+from .samples import compact_samples
+from .samples_archive import archive_enabled, write_archive, delete_archive
+from .pipeline_timings import span
 from ..utils import peloton_credentials_supplied, stryd_credentials_supplied, config
 import os
+import threading
 import pandas as pd
-from ..pages.performance import get_hrv_df, readiness_score_recommendation
+
+peloton_cache_lock = threading.Lock()
 
 types = ['time', 'latlng', 'distance', 'altitude', 'velocity_smooth', 'heartrate', 'cadence', 'watts', 'temp',
          'moving', 'grade_smooth']
@@ -41,36 +51,32 @@ def db_process_flag(flag):
 
     else:
         app.session.query(dbRefreshStatus).filter(dbRefreshStatus.refresh_method == 'processing').delete()
+        # Whatever the outcome, data may have been committed, so cached DataFrames have to be reloaded
+        app.session.merge(dataGeneration(id=1, updated_utc=datetime.utcnow()))
         app.session.commit()
         app.server.logger.debug('Processing complete')
 
     app.session.remove()
 
 
-def calctime(time_sec, startdate):
-    try:
-        timestamp = startdate + timedelta(seconds=int(time_sec))
-    except BaseException as e:
-        timestamp = startdate
-    return timestamp
-
-
 def get_peloton_workout_summary_cache(act_start_date_utc):
     pelton_cache_dir = os.path.join(os.getcwd(), 'peloton-cache.csv')
-    # Check if there is already a file
-    cache_exists = os.path.isfile(pelton_cache_dir)
-    # Parse through max date
-    if not cache_exists:
-        app.server.logger.debug('Fetching new peloton worokout summary cache')
-        peloton_mapping_df().to_csv(pelton_cache_dir, sep=',')
-    else:
-        # If latest workout is more than 15 minutes newer than max workout in cache, refresh the cache
-        if (pd.to_datetime(act_start_date_utc).tz_localize(None) - pd.to_datetime(
-                pd.read_csv(pelton_cache_dir)['start']).max()).total_seconds() > (60 * 15):
-            app.server.logger.debug('Fetching new peloton cache')
+    # Activities can be scraped concurrently (see ingest_workers), only let one thread check/refresh the cache file
+    with peloton_cache_lock:
+        # Check if there is already a file
+        cache_exists = os.path.isfile(pelton_cache_dir)
+        # Parse through max date
+        if not cache_exists:
+            app.server.logger.debug('Fetching new peloton worokout summary cache')
             peloton_mapping_df().to_csv(pelton_cache_dir, sep=',')
+        else:
+            # If latest workout is more than 15 minutes newer than max workout in cache, refresh the cache
+            if (pd.to_datetime(act_start_date_utc).tz_localize(None) - pd.to_datetime(
+                    pd.read_csv(pelton_cache_dir)['start']).max()).total_seconds() > (60 * 15):
+                app.server.logger.debug('Fetching new peloton cache')
+                peloton_mapping_df().to_csv(pelton_cache_dir, sep=',')
 
-    return pd.read_csv(pelton_cache_dir)
+        return pd.read_csv(pelton_cache_dir)
 
 
 class FitlyActivity(stravalib.model.Activity):
@@ -79,56 +85,65 @@ class FitlyActivity(stravalib.model.Activity):
         activity.__class__ = FitlyActivity
         return activity
 
-    def stravaScrape(self, athlete_id):
-        # # Set up athlete for the workout
-        app.server.logger.debug('Activity id "{}": Assigning athlete id {}'.format(self.id, athlete_id))
-        self.assign_athlete(athlete_id)
-        # Update strava names of peloton workouts
-        if peloton_credentials_supplied:
-            app.server.logger.debug('Activity id "{}": Pulling peloton title'.format(self.id))
-            self.get_peloton_workout_title()
-        # Build activity samples df
-        app.server.logger.debug('Activity id "{}": Building df_samples'.format(self.id))
-        self.build_df_samples()
-
-        # Only import strava workout if there is stream data
-        if hasattr(self, 'df_samples'):
-            # Build activity summary df
-            app.server.logger.debug('Activity id "{}": Building df_summary'.format(self.id))
-            self.build_df_summary()
-            # Get FTP
-            app.server.logger.debug('Activity id "{}": Pulling ftp'.format(self.id))
-            self.get_ftp()
-            # Get most recent resting heart rate
-            app.server.logger.debug('Activity id "{}": Pulling resting hr'.format(self.id))
-            self.get_rest_hr()
-            # Get most recent weight
-            app.server.logger.debug('Activity id "{}": Pulling weight'.format(self.id))
-            self.get_weight()
-            # Calculate power zones
-            app.server.logger.debug('Activity id "{}": Calculating power zones'.format(self.id))
-            self.calculate_power_zones()
-            # Calculate heartrate zones
-            app.server.logger.debug('Activity id "{}": Calculating heartrate zones'.format(self.id))
-            self.calculate_heartate_zones()
-            # Calculate zone intensities
-            app.server.logger.debug('Activity id "{}": Calculating zones intensities'.format(self.id))
-            self.calculate_zone_intensities()
-            # Get summary analytics
-            app.server.logger.debug('Activity id "{}": Calculating summary analytics'.format(self.id))
-            self.get_summary_analytics()
-            # Write strava_best_samples
-            app.server.logger.debug('Activity id "{}": Writing mean max power to DB'.format(self.id))
-            self.compute_mean_max_power(dbinsert=True)
-            # Write df_summary and df_samples to db
-            app.server.logger.debug('Activity id "{}": Writing df_summary and df_samples to DB'.format(self.id))
-            self.write_dfs_to_db()
-        else:
-            app.server.logger.degubg(f'No streams data returned for activity {self.id}')
+    def stravaScrape(self, athlete_id, dbinsert=True):
+        # Each stage is timed into pipeline_timings
+        with span('scrape', activity_id=self.id):
+            # # Set up athlete for the workout
+            app.server.logger.debug('Activity id "{}": Assigning athlete id {}'.format(self.id, athlete_id))
+            self.assign_athlete(athlete_id)
+            # Update strava names of peloton workouts
+            if peloton_credentials_supplied:
+                app.server.logger.debug('Activity id "{}": Pulling peloton title'.format(self.id))
+                with span('peloton'):
+                    self.get_peloton_workout_title()
+            # Build activity samples df
+            app.server.logger.debug('Activity id "{}": Building df_samples'.format(self.id))
+            self.build_df_samples()
+
+            # Only import strava workout if there is stream data
+            if hasattr(self, 'df_samples'):
+                with span('summary'):
+                    # Build activity summary df
+                    app.server.logger.debug('Activity id "{}": Building df_summary'.format(self.id))
+                    self.build_df_summary()
+                    # Get FTP
+                    app.server.logger.debug('Activity id "{}": Pulling ftp'.format(self.id))
+                    self.get_ftp()
+                    # Get most recent resting heart rate
+                    app.server.logger.debug('Activity id "{}": Pulling resting hr'.format(self.id))
+                    self.get_rest_hr()
+                    # Get most recent weight
+                    app.server.logger.debug('Activity id "{}": Pulling weight'.format(self.id))
+                    self.get_weight()
+                with span('zones'):
+                    # Calculate power zones
+                    app.server.logger.debug('Activity id "{}": Calculating power zones'.format(self.id))
+                    self.calculate_power_zones()
+                    # Calculate heartrate zones
+                    app.server.logger.debug('Activity id "{}": Calculating heartrate zones'.format(self.id))
+                    self.calculate_heartate_zones()
+                # Calculate zone intensities
+                app.server.logger.debug('Activity id "{}": Calculating zones intensities'.format(self.id))
+                with span('intensities'):
+                    self.calculate_zone_intensities()
+                # Get summary analytics
+                app.server.logger.debug('Activity id "{}": Calculating summary analytics'.format(self.id))
+                with span('analytics'):
+                    self.get_summary_analytics()
+                # Build strava_best_samples
+                app.server.logger.debug('Activity id "{}": Calculating mean max power'.format(self.id))
+                with span('mmp'):
+                    self.compute_mean_max_power(dbinsert=True)
+                # Write df_summary, df_samples and df_best_samples to db
+                if dbinsert:
+                    app.server.logger.debug('Activity id "{}": Writing dfs to DB'.format(self.id))
+                    self.write_dfs_to_db()
+            else:
+                app.server.logger.debug(f'No streams data returned for activity {self.id}')
 
     def assign_athlete(self, athlete_id):
 
-        self.Athlete = app.session.query(athlete).filter(athlete.athlete_id == athlete_id).first()
+        self.Athlete = athlete_settings(athlete_id)
 
         app.session.remove()
 
@@ -224,6 +239,7 @@ class FitlyActivity(stravalib.model.Activity):
     def get_ftp(
             self):  # TODO: Update with auto calculated critical power so users do not have to flag (or take) FTP tests
         self.stryd_metrics = []
+        self.stryd_start_date_local = None
         if 'run' in self.type.lower() or 'walk' in self.type.lower():
             # If stryd credentials in config, grab ftp
             if stryd_credentials_supplied:
@@ -236,14 +252,11 @@ class FitlyActivity(stravalib.model.Activity):
                     (stryd_df['start_date_local'] >= (start - timedelta(minutes=5))) & (
                             stryd_df['start_date_local'] <= (start + timedelta(minutes=5)))]
 
-                # If we match a strava workout to stryd workout, insert strava activity id into stryd table
+                # If we match a strava workout to stryd workout, write_dfs_to_db() inserts strava activity id into
+                # stryd table along with the activity
                 if len(self.stryd_metrics) > 0:
-                    stryd_workout = app.session.query(strydSummary).filter(
-                        strydSummary.start_date_local == pd.to_datetime(
-                            self.stryd_metrics['start_date_local'].values[0]))
-                    stryd_workout.update({'strava_activity_id': self.id})
-                    app.session.commit()
-                    app.session.remove()
+                    self.stryd_start_date_local = pd.to_datetime(self.stryd_metrics['start_date_local'].values[0])
+                app.session.remove()
 
                 try:
                     self.ftp = self.stryd_metrics.iloc[0].stryd_ftp
@@ -472,82 +485,22 @@ class FitlyActivity(stravalib.model.Activity):
         self.df_summary.set_index(['start_date_utc'], inplace=True)
 
     def build_df_samples(self):
-        seconds = 1
-        streams = get_strava_client().get_activity_streams(self.id, types=types)
+        with span('streams', activity_id=self.id):
+            streams = get_strava_client().get_activity_streams(self.id, types=types)
         # Only create df_samples if there is a response from the strava streams api
         if streams:
-            self.df_samples = pd.DataFrame(columns=types)
-            # Write each row to a dataframe
-            for item in types:
-                if item in streams.keys():
-                    self.df_samples[item] = pd.Series(streams[item].data, index=None)
-            self.df_samples['start_date_local'] = self.start_date_local
-            self.df_samples['timestamp_local'] = pd.Series(
-                map(calctime, self.df_samples['time'], self.df_samples['start_date_local']))
-            self.df_samples.set_index('timestamp_local', inplace=True)
-
-            # Parse latlngs into seperate columns
-            try:
-                self.df_samples['latitude'] = self.df_samples['latlng'].apply(
-                    lambda x: x[0] if isinstance(x, list) else None).apply(
-                    pd.to_numeric,
-                    errors='coerce')
-                self.df_samples['longitude'] = self.df_samples['latlng'].apply(
-                    lambda x: x[1] if isinstance(x, list) else None).apply(
-                    pd.to_numeric,
-                    errors='coerce')
-            except KeyError:
-                self.df_samples['latitude'] = None
-                self.df_samples['longitude'] = None
-
-            # Interpolate samples - each workout in samples data should already be at 1s intervals, calling resample fills in gaps so mean() does not matter
-            self.df_samples = self.df_samples.resample(str(seconds) + 'S').mean()
-            self.df_samples = self.df_samples.interpolate(
-                limit_direction='both')  # TODO: Consider if interpolating of nans is skuing data too much
-
-            # Add Utc timestamp
-            self.df_samples.reset_index(inplace=True)
-            self.df_samples['start_date_utc'] = self.start_date.replace(tzinfo=None)
-            self.df_samples['timestamp_utc'] = pd.Series(
-                map(calctime, self.df_samples['time'], self.df_samples['start_date_utc']))
-            self.df_samples.drop(columns=['start_date_utc'], inplace=True)
-            self.df_samples.set_index('timestamp_local', inplace=True)
-
-            try:  # Indoor activity samples wont have altitudes
-                self.df_samples['altitude'] = self.df_samples['altitude'] * 3.28084
-            except KeyError:
-                self.df_samples['altitude'] = None
-
-            try:
-                # Convert celcius to farenheit
-                self.df_samples['temp'] = (self.df_samples['temp'] * (9 / 5)) + 32
-            except:
-                pass
-
-            try:
-                # Convert meter per second to mph
-                # self.df_samples['velocity_smooth'] = unithelper.mph(self.df_samples['velocity_smooth']).num
-                self.df_samples['velocity_smooth'] = self.df_samples['velocity_smooth'] * 2.23694
-            except BaseException as e:
-                pass
-
-            try:
-                # Convert meters to feet
-                # self.df_samples['distance'] = unithelper.feet(self.df_samples['distance']).num
-                self.df_samples['distance'] = self.df_samples['distance'] * 3.28084
-            except:
-                pass
-
-            # Add Time Interval
-            epoch = pd.to_datetime('1970-01-01')
-            self.df_samples['time_interval'] = self.df_samples['time'].astype('int').apply(
-                lambda x: epoch + timedelta(seconds=x))
-
-            # Add date column
-            self.df_samples['date'] = self.df_samples.index.date
+            # Resample to 1s, interpolate and convert units on the raw stream arrays
+            with span('df_build', activity_id=self.id):
+                df_samples = normalize_streams(
+                    {item: streams[item].data for item in types if item in streams.keys()}, self.start_date_local,
+                    self.start_date.replace(tzinfo=None))
+            if df_samples is None:
+                app.server.logger.warning('Activity id "{}": time stream has no samples, skipping'.format(self.id))
+                return
             # Add activity id and name back in
-            self.df_samples['activity_id'] = self.id
-            self.df_samples['act_name'] = self.name
+            df_samples['activity_id'] = self.id
+            df_samples['act_name'] = self.name
+            self.df_samples = df_samples
 
     def calculate_power_zones(self):
         if self.max_watts is not None:
@@ -556,27 +509,9 @@ class FitlyActivity(stravalib.model.Activity):
                     pz_5, pz_6 = self.power_zones[5], self.power_zones[6]
                 elif 'run' in self.type.lower() or 'walk' in self.type.lower():
                     pz_5, pz_6 = 99, 99
-                self.df_samples['power_zone'] = np.nan
-
-                for i in self.df_samples.index:
-                    watts = self.df_samples.loc[i].watts
-                    if watts is not None:
-                        if watts <= round(self.ftp * self.power_zones[1]):
-                            self.df_samples.at[i, 'power_zone'] = 1
-                        elif watts <= round(self.ftp * self.power_zones[2]):
-                            self.df_samples.at[i, 'power_zone'] = 2
-                        elif watts <= round(self.ftp * self.power_zones[3]):
-                            self.df_samples.at[i, 'power_zone'] = 3
-                        elif watts <= round(self.ftp * self.power_zones[4]):
-                            self.df_samples.at[i, 'power_zone'] = 4
-                        elif watts <= round(self.ftp * pz_5):
-                            self.df_samples.at[i, 'power_zone'] = 5
-                        elif watts <= round(self.ftp * pz_6):
-                            self.df_samples.at[i, 'power_zone'] = 6
-                        else:
-                            self.df_samples.at[i, 'power_zone'] = 7
-                    else:
-                        return np.nan
+                thresholds = zone_thresholds(self.ftp, [self.power_zones[1], self.power_zones[2],
+                                                        self.power_zones[3], self.power_zones[4], pz_5, pz_6])
+                self.df_samples['power_zone'] = classify_zones(self.df_samples['watts'], thresholds)
 
     def calculate_heartate_zones(self):
         if self.max_heartrate is not None:
@@ -584,27 +519,9 @@ class FitlyActivity(stravalib.model.Activity):
             self.athlete_max_hr = 220 - age
             self.rhr = self.hr_lowest
             self.hrr = self.athlete_max_hr - self.rhr
-            z1 = round((self.hrr * self.hearrate_zones[1]) + self.rhr)
-            z2 = round((self.hrr * self.hearrate_zones[2]) + self.rhr)
-            z3 = round((self.hrr * self.hearrate_zones[3]) + self.rhr)
-            z4 = round((self.hrr * self.hearrate_zones[4]) + self.rhr)
-
-            self.df_samples['hr_zone'] = np.nan
-            for i in self.df_samples.index:
-                heartrate = self.df_samples.loc[i].heartrate
-                if heartrate is not None:
-                    if heartrate <= z1:
-                        self.df_samples.at[i, 'hr_zone'] = 1
-                    elif heartrate <= z2:
-                        self.df_samples.at[i, 'hr_zone'] = 2
-                    elif heartrate <= z3:
-                        self.df_samples.at[i, 'hr_zone'] = 3
-                    elif heartrate <= z4:
-                        self.df_samples.at[i, 'hr_zone'] = 4
-                    else:
-                        self.df_samples.at[i, 'hr_zone'] = 5
-                else:
-                    return np.nan
+            thresholds = zone_thresholds(self.hrr, [self.hearrate_zones[1], self.hearrate_zones[2],
+                                                    self.hearrate_zones[3], self.hearrate_zones[4]], offset=self.rhr)
+            self.df_samples['hr_zone'] = classify_zones(self.df_samples['heartrate'], thresholds)
 
     # https://www.movescount.com/apps/app10925786-Strava_Suffer_Score
     # def strava_suffer_score(self):
@@ -626,50 +543,21 @@ class FitlyActivity(stravalib.model.Activity):
     #             return np.nan
 
     def calculate_zone_intensities(self):
-        df_zone_intensities = self.df_samples.copy()
-        df_zone_intensities = df_zone_intensities[df_zone_intensities['time'] != 0]
         # Check if power data, if not use heartrate data
         metric = 'power' if self.max_watts is not None and self.ftp is not None else 'heartrate' if self.max_heartrate is not None else 'none'
+        zone_column = {'power': 'power_zone', 'heartrate': 'hr_zone'}.get(metric)
+        moving = self.df_samples['time'] != 0
 
-        for i in df_zone_intensities.index:
-            # Check if power or heartrate data
-            if metric == 'power':
-                # If power data, check if run zones or ride zones should be used
-                if 'run' in self.type.lower() or 'walk' in self.type.lower():
-                    df_zone_intensities.at[i, 'intensity'] = 'low' if df_zone_intensities.at[
-                                                                          i, 'power_zone'] in [1,
-                                                                                               2] else 'med' if \
-                        df_zone_intensities.at[i, 'power_zone'] == 3 else 'high' if \
-                        df_zone_intensities.at[
-                            i, 'power_zone'] in [4, 5] else None
-                elif 'ride' in self.type.lower():
-                    df_zone_intensities.at[i, 'intensity'] = 'low' if df_zone_intensities.at[
-                                                                          i, 'power_zone'] in [1, 2,
-                                                                                               3] else 'med' if \
-                        df_zone_intensities.at[i, 'power_zone'] == 4 else 'high' if \
-                        df_zone_intensities.at[
-                            i, 'power_zone'] in [5, 6, 7] else None
-            elif metric == 'heartrate':
-                df_zone_intensities.at[i, 'intensity'] = 'low' if df_zone_intensities.at[
-                                                                      i, 'hr_zone'] in [1,
-                                                                                        2] else 'med' if \
-                    df_zone_intensities.at[i, 'hr_zone'] == 3 else 'high' if df_zone_intensities.at[
-                                                                                 i, 'hr_zone'] in [4,
-                                                                                                   5] else None
-        if 'intensity' in df_zone_intensities.columns:
-            intensity_seconds = df_zone_intensities['intensity'].value_counts()
-            try:
-                self.df_summary['low_intensity_seconds'] = [intensity_seconds.low]
-            except AttributeError:
-                self.df_summary['low_intensity_seconds'] = np.nan
-            try:
-                self.df_summary['mod_intensity_seconds'] = [intensity_seconds.med]
-            except AttributeError:
-                self.df_summary['mod_intensity_seconds'] = np.nan
-            try:
-                self.df_summary['high_intensity_seconds'] = [intensity_seconds.high]
-            except AttributeError:
-                self.df_summary['high_intensity_seconds'] = np.nan
+        if zone_column is not None and moving.any():
+            intensity_seconds = zone_intensity_seconds(self.df_samples.loc[moving, zone_column],
+                                                       family=sport_family(self.type), metric=metric)
+        else:
+            intensity_seconds = None
+
+        if intensity_seconds is not None:
+            self.df_summary['low_intensity_seconds'] = [intensity_seconds.get('low', np.nan)]
+            self.df_summary['mod_intensity_seconds'] = [intensity_seconds.get('med', np.nan)]
+            self.df_summary['high_intensity_seconds'] = [intensity_seconds.get('high', np.nan)]
 
             self.df_summary['workout_intensity'] = self.df_summary[
                 ['low_intensity_seconds', 'mod_intensity_seconds', 'high_intensity_seconds']].idxmax(
@@ -698,7 +586,9 @@ class FitlyActivity(stravalib.model.Activity):
                 df['athlete_id'] = self.Athlete.athlete_id
                 df['ftp'] = self.ftp
                 df.set_index(['activity_id', 'interval'], inplace=True)
-                df.to_sql('strava_best_samples', engine, if_exists='append', index=True)
+                # Written in write_dfs_to_db() (and folded into power_curve_bests) along with summary and samples so the
+                # activity is committed as a whole
+                self.df_best_samples = df
 
     def sweatpy_cp_model(self, model='3_parameter_non_linear'):
         # Models that can be passed = '2_parameter_non_linear', '3_parameter_non_linear', 'extended_5_3','extended_7_3'
@@ -717,12 +607,29 @@ class FitlyActivity(stravalib.model.Activity):
         self.df_summary['variability_index'] = [self.variability_index]
         self.df_summary['weighted_average_power'] = [self.wap]
         self.df_summary['weight'] = [self.weight]
-        # Add other columns to samples df
-        self.df_samples['type'] = self.type
-        self.df_samples['athlete_id'] = self.Athlete.athlete_id
 
-        self.df_summary.fillna(np.nan).to_sql('strava_summary', engine, if_exists='append', index=True)
-        self.df_samples.fillna(np.nan).to_sql('strava_samples', engine, if_exists='append', index=True)
+        df_compact = compact_samples(self.df_samples.fillna(np.nan))
+        # A file left from an earlier import of the activity would be served instead of the samples written here
+        delete_archive(self.id)
+        # Single transaction so an activity only counts as imported (it has a strava_summary record) once its
+        # samples and best samples have been committed too
+        with span('write', activity_id=self.id), bulk_write() as connection:
+            if hasattr(self, 'df_best_samples'):
+                bulk_insert(self.df_best_samples, 'strava_best_samples', connection)
+                update_power_curve_bests(self.df_best_samples, connection)
+            bulk_insert(df_compact, 'strava_samples_compact', connection, index=False)
+            self.df_summary.fillna(np.nan).to_sql('strava_summary', connection, if_exists='append', index=True)
+            update_daily_training_load(self.start_date_local.date(), connection, athlete_id=self.Athlete.athlete_id)
+            if getattr(self, 'stryd_start_date_local', None) is not None:
+                connection.execute(update(strydSummary).where(
+                    strydSummary.start_date_local == self.stryd_start_date_local).values(strava_activity_id=self.id))
+
+        if archive_enabled:
+            # The db stays the source of truth, activities without a file are read from strava_samples_compact
+            try:
+                write_archive(self.id, df_compact)
+            except BaseException as e:
+                app.server.logger.warning('Could not archive samples of activity {}: {}'.format(self.id, e))
 
 
 def training_workflow(min_non_warmup_workout_time, metric='hrv_baseline', athlete_id=1):
@@ -731,6 +638,9 @@ def training_workflow(min_non_warmup_workout_time, metric='hrv_baseline', athlet
     Once stored, continuously check if workout has been completed and fill in 'Compelted' field
     '''
 
+    # Imported here so the refresh (and the cron that schedules it) doesn't import the pages at startup
+    from ..pages.performance import get_hrv_df, readiness_score_recommendation
+
     # https://www.alancouzens.com/blog/Training_prescription_guided_by_HRV_in_cycling.pdf
     try:
         db_process_flag(flag=True)
@@ -957,7 +867,7 @@ def training_workflow(min_non_warmup_workout_time, metric='hrv_baseline', athlet
                     df.to_sql('workout_step_log', engine, if_exists='append', index=False)
 
                     # Create spotify playlist based on workout intensity recommendation
-                    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+                    athlete_info = athlete_settings()
                     app.session.remove()
                     if athlete_info.spotify_playlists_switch == True:
                         generate_recommendation_playlists(
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+
+def interval_join(points, starts, ends):
+    '''
+    Match every point to each closed interval [start, end] that contains it, with a sorted sweep instead of a cross
+    join. Intervals are sorted on start once, then each point only looks at the intervals that start between
+    (point - longest interval) and the point, so the cost is O((n + m) log m) plus the number of candidates
+    :param points: Array-like of values to place (i.e. timestamps)
+    :param starts: Array-like of interval starts
+    :param ends: Array-like of interval ends, same length as starts. Intervals missing either bound never match
+    :return: Tuple of (point positions, interval positions) of every match, ordered by interval then point
+    '''
+    points, starts, ends = np.asarray(points), np.asarray(starts), np.asarray(ends)
+    empty = np.array([], dtype='int64')
+
+    valid = np.flatnonzero(~(pd.isnull(starts) | pd.isnull(ends)))
+    if len(valid) == 0 or len(points) == 0:
+        return empty, empty
+    order = valid[np.argsort(starts[valid], kind='mergesort')]
+    sorted_starts = starts[order]
+    longest = max((ends[order] - sorted_starts).max(), (ends[order] - sorted_starts).dtype.type(0))
+
+    # Range of intervals (by sorted start) that could cover each point
+    hi = np.searchsorted(sorted_starts, points, side='right')
+    lo = np.searchsorted(sorted_starts, points - longest, side='left')
+    counts = np.where(pd.isnull(points), 0, np.maximum(hi - lo, 0))
+
+    point_positions = np.repeat(np.arange(len(points)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    interval_positions = order[np.repeat(lo, counts) + offsets]
+
+    covered = ends[interval_positions] >= points[point_positions]
+    point_positions, interval_positions = point_positions[covered], interval_positions[covered]
+    sort = np.lexsort((point_positions, interval_positions))
+    return point_positions[sort], interval_positions[sort]
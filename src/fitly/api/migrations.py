@@ -0,0 +1,58 @@
+from sqlalchemy import inspect, text, Index, Table, MetaData
+from .sqlalchemy_declarative import Base
+
+
+def add_missing_columns(engine):
+    '''
+    Base.metadata.create_all() only creates missing tables, so add any columns that were added to
+    sqlalchemy_declarative after an existing db was first created. New columns are nullable so this is safe to run
+    on every startup
+    '''
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = [column['name'] for column in inspector.get_columns(table.name)]
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    connection.execute(text('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                        table.name, column.name, column.type.compile(dialect=engine.dialect))))
+
+
+def add_missing_indexes(engine):
+    '''
+    create_all() only creates indexes along with new tables, so create any indexes that are missing from existing
+    tables. This can take a while the first time on a large strava_samples table, after that it is a no-op
+    '''
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_indexes = [index['name'] for index in inspector.get_indexes(table.name)]
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=connection)
+
+
+def index_legacy_samples(engine):
+    '''
+    Until strava_samples is moved into strava_samples_compact its activities are read from it by activity_id, index
+    that so the workout charts don't scan it
+    '''
+    inspector = inspect(engine)
+    if not inspector.has_table('strava_samples'):
+        return
+    if 'ix_strava_samples_activity_id' not in [index['name'] for index in inspector.get_indexes('strava_samples')]:
+        legacy = Table('strava_samples', MetaData(), autoload_with=engine)
+        Index('ix_strava_samples_activity_id', legacy.c.activity_id).create(bind=engine)
+
+
+def migrate(engine):
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    index_legacy_samples(engine)
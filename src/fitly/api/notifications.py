@@ -1,8 +1,9 @@
-from ..api.sqlalchemy_declarative import withings, stravaSummary, athlete
+from ..api.sqlalchemy_declarative import withings, stravaSummary
 from sqlalchemy import func
 from datetime import datetime, timedelta
 import dash_bootstrap_components as dbc
 from ..app import app
+from ..api.athlete_settings import athlete_settings
 
 
 def last_body_measurement_notification():
@@ -25,8 +26,7 @@ def last_ftp_test_notification(ftp_type):
         app.session.query(func.max(stravaSummary.start_date_utc)).filter(
             (stravaSummary.name.ilike('%ftp test%')) & (stravaSummary.type.ilike(ftp_type))
         )[0][0]
-    ftp_week_threshold = app.session.query(athlete).filter(
-        athlete.athlete_id == 1).first().ftp_test_notification_week_threshold
+    ftp_week_threshold = athlete_settings().ftp_test_notification_week_threshold
 
     app.session.remove()
 
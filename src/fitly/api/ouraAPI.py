@@ -10,6 +10,7 @@ from ..app import app
 import ast
 from ..utils import config
 from functools import reduce
+from .cache import cached_on_refresh
 
 client_id = config.get('oura', 'client_id')
 client_secret = config.get('oura', 'client_secret')
@@ -315,10 +316,44 @@ def insert_sleep_data(df_sleep_summary, df_sleep_samples, days_back=7):
         app.server.logger.error(e)
 
 
-def generate_oura_correlations(lookback_days=180):
+# Display names of the metrics that are correlated
+friendly_names = {'Activity_average_met': 'Average METs',
+                  'Activity_cal_active': 'Activity burn',
+                  'Activity_cal_total': 'Total burn',
+                  'Activity_daily_movement': 'Walking equivalent',
+                  'Activity_high': 'High activity time',
+                  'Activity_inactive': 'Inactive time',
+                  'Activity_low': 'Low activity time',
+                  'Activity_medium': 'Med activity time',
+                  'Activity_non_wear': 'Non-wear time',
+                  'Activity_rest': 'Rest time',
+                  'Activity_score': 'Activity score',
+                  'Activity_steps': 'Steps',
+                  'Activity_total': 'Total activity time',
+                  'Readiness_score': 'Readiness score',
+                  'Sleep_awake': 'Time awake in bed',
+                  'Sleep_bedtime_start_delta': 'Late to bedtime',
+                  'Sleep_breath_average': 'Respiratory rate',
+                  'Sleep_deep': 'Deep sleep',
+                  'Sleep_duration': 'Time in bed',
+                  'Sleep_efficiency': 'Sleep efficiency',
+                  'Sleep_hr_average': 'Average HR',
+                  'Sleep_hr_lowest': 'Lowest HR',
+                  'Sleep_light': 'Light sleep',
+                  'Sleep_midpoint_time': 'Sleep midpoint',
+                  'Sleep_onset_latency': 'Sleep latency',
+                  'Sleep_rem': 'REM sleep',
+                  'Sleep_restless': 'Restlessness',
+                  'Sleep_rmssd': 'Average HRV',
+                  'Sleep_score': 'Sleep score',
+                  'Sleep_temperature_deviation': 'Temp. deviation',
+                  'Sleep_total': 'Total sleep'}
+
+
+@cached_on_refresh
+def oura_daily_metrics(lookback_days=180):
     '''
-    Generates correlations of oura metrics
-
+    Daily oura sleep, readiness and activity metrics, each with its previous and next day's value alongside
     '''
     lookback = pd.to_datetime(datetime.today() - timedelta(days=lookback_days)).date()
 
@@ -362,61 +397,44 @@ def generate_oura_correlations(lookback_days=180):
 
     sleep = sleep.add_prefix('Sleep_')
 
-    friendly_names = {'Activity_average_met': 'Average METs',
-                      'Activity_cal_active': 'Activity burn',
-                      'Activity_cal_total': 'Total burn',
-                      'Activity_daily_movement': 'Walking equivalent',
-                      'Activity_high': 'High activity time',
-                      'Activity_inactive': 'Inactive time',
-                      'Activity_low': 'Low activity time',
-                      'Activity_medium': 'Med activity time',
-                      'Activity_non_wear': 'Non-wear time',
-                      'Activity_rest': 'Rest time',
-                      'Activity_score': 'Activity score',
-                      'Activity_steps': 'Steps',
-                      'Activity_total': 'Total activity time',
-                      'Readiness_score': 'Readiness score',
-                      'Sleep_awake': 'Time awake in bed',
-                      'Sleep_bedtime_start_delta': 'Late to bedtime',
-                      'Sleep_breath_average': 'Respiratory rate',
-                      'Sleep_deep': 'Deep sleep',
-                      'Sleep_duration': 'Time in bed',
-                      'Sleep_efficiency': 'Sleep efficiency',
-                      'Sleep_hr_average': 'Average HR',
-                      'Sleep_hr_lowest': 'Lowest HR',
-                      'Sleep_light': 'Light sleep',
-                      'Sleep_midpoint_time': 'Sleep midpoint',
-                      'Sleep_onset_latency': 'Sleep latency',
-                      'Sleep_rem': 'REM sleep',
-                      'Sleep_restless': 'Restlessness',
-                      'Sleep_rmssd': 'Average HRV',
-                      'Sleep_score': 'Sleep score',
-                      'Sleep_temperature_deviation': 'Temp. deviation',
-                      'Sleep_total': 'Total sleep'}
-
     dfs = [sleep, readiness, activity]
     df = reduce(lambda left, right: pd.merge(left, right, left_index=True, right_index=True), dfs)
 
     df.columns = df.columns.to_series().map(friendly_names)
 
-    # Create Prev/Next day for all columns
-    for col in friendly_names.values():
-        df[col + ' (prev)'] = df[col].shift(1)
-        df[col + ' (next)'] = df[col].shift(-1)
+    app.session.remove()
+
+    # Create Prev/Next day for all columns, in one concat instead of inserting them a column at a time
+    prev_day, next_day = df.shift(1), df.shift(-1)
+    return pd.concat([df] + [lag for col in friendly_names.values() for lag in (
+        prev_day[col].rename(col + ' (prev)'), next_day[col].rename(col + ' (next)'))], axis=1)
+
 
-    df = df.corr().replace(1, np.nan)
+@cached_on_refresh
+def generate_oura_correlations(lookback_days=180, method='pearson', min_periods=1):
+    '''
+    Generates correlations of oura metrics. Every variant is computed from the same cached daily metrics, and each
+    matrix is cached until the next refresh so all correlation tables are served from it
+    :param lookback_days: Days of history to correlate over
+    :param method: pearson, or spearman for rank correlations
+    :param min_periods: Days two metrics need in common to be correlated. Each pair is always correlated over the
+    days both have values (pairwise complete)
+    :return: DataFrame of correlations between every pair of metrics
+    '''
+    df = oura_daily_metrics(lookback_days=lookback_days)
+
+    df = df.corr(method=method, min_periods=min_periods).replace(1, np.nan)
     # Store lookback days that was used for filtering historic data to run correlation on
     df['rolling_days'] = lookback_days
     df.index.name = 'Metric'
 
     # df.to_sql('correlations', engine, if_exists='replace', index=True)
 
-    app.session.remove()
     return df
 
 
-def top_n_correlations(n, column, days=180):
-    df = generate_oura_correlations(lookback_days=days)
+def top_n_correlations(n, column, days=180, method='pearson', min_periods=1):
+    df = generate_oura_correlations(lookback_days=days, method=method, min_periods=min_periods)
     positive = df[column].nlargest(n).reset_index()
     positive.columns = ['Positive', 'Pos Corr Coef.']
 
@@ -7,7 +7,8 @@ import decimal
 from datetime import datetime, timezone, date, timedelta
 from ..utils import config
 import pandas as pd
-from .sqlalchemy_declarative import workoutStepLog, athlete, stravaSummary
+from .sqlalchemy_declarative import workoutStepLog, stravaSummary
+from .athlete_settings import athlete_settings
 from ..app import app
 import json
 import os
@@ -817,8 +818,7 @@ def get_bookmarks():
 def set_peloton_workout_recommendations():
     app.server.logger.info('Bookmarking peloton recommendations...')
     # Query worktypes by effort level settings
-    athlete_bookmarks = json.loads(app.session.query(athlete.peloton_auto_bookmark_ids).filter(
-        athlete.athlete_id == 1).first().peloton_auto_bookmark_ids)
+    athlete_bookmarks = json.loads(athlete_settings().peloton_auto_bookmark_ids)
     # Get recommended effort based on workflow
     effort_recommendation = app.session.query(workoutStepLog.workout_step_desc).order_by(
         workoutStepLog.date.desc()).first().workout_step_desc
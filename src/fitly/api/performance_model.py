@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+# Default Banister time constants (days) for fitness and fatigue
+ctl_days = 42
+atl_days = 7
+
+
+def load_decay(time_constant):
+    '''
+    Daily decay factor of an exponentially weighted training load
+    :param time_constant: Time constant of the load in days (42 for CTL, 7 for ATL, etc.)
+    :return: Fraction of yesterday's load carried into today
+    '''
+    return np.exp(-1 / time_constant)
+
+
+def exponential_load(stress, time_constant, initial=0):
+    '''
+    Exponentially weighted training load of a daily stress series in a single pass:
+    load[i] = stress[i] * (1 - decay) + load[i - 1] * decay, with load[-1] = initial
+    :param stress: Daily stress scores (one row per day, no gaps, no missing values). Forecast days are just
+    trailing rows of 0 stress, so the load decays through them
+    :param time_constant: Time constant of the load in days
+    :param initial: Load carried in from before the first day
+    :return: Series of loads on the same index as stress
+    '''
+    decay = load_decay(time_constant)
+    # Seed the recursion with the initial load so ewm's first output is the loop's load[-1], then drop it
+    seeded = pd.Series(np.concatenate(([initial], np.asarray(stress, dtype='float64'))))
+    load = seeded.ewm(alpha=1 - decay, adjust=False).mean().values[1:]
+    return pd.Series(load, index=stress.index, name=stress.name)
+
+
+def fitness(stress, time_constant=ctl_days, initial=0):
+    '''
+    Chronic training load (CTL)
+    '''
+    return exponential_load(stress, time_constant, initial)
+
+
+def fatigue(stress, time_constant=atl_days, initial=0):
+    '''
+    Acute training load (ATL)
+    '''
+    return exponential_load(stress, time_constant, initial)
+
+
+def form(ctl, atl, initial_ctl=np.nan, initial_atl=np.nan):
+    '''
+    Training stress balance (TSB), based off of yesterday's fitness and fatigue
+    :param ctl: Daily fitness series
+    :param atl: Daily fatigue series on the same index
+    :param initial_ctl: Fitness the day before the first day
+    :param initial_atl: Fatigue the day before the first day
+    :return: Series of form values
+    '''
+    return ctl.shift(1, fill_value=initial_ctl) - atl.shift(1, fill_value=initial_atl)
+
+
+def ramp_rate(ctl, days=7):
+    '''
+    Change in fitness over the trailing number of days
+    '''
+    return ctl - ctl.shift(days)
+
@@ -0,0 +1,79 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import select, delete
+
+from .database import engine, bulk_write, bulk_insert
+from .sqlalchemy_declarative import pipelineTiming
+from ..utils import config
+
+# Days of spans kept in pipeline_timings
+retention_days = float(config.get('logger', 'pipeline_timings_days', fallback=90))
+
+# Spans open on the current thread, innermost last
+_local = threading.local()
+# Finished spans waiting for save_timings()
+_spans = []
+_lock = threading.Lock()
+
+
+@contextmanager
+def span(stage, activity_id=None):
+    '''
+    Time a stage of the refresh pipeline. A span opened inside another one on the same thread records it as its
+    parent and takes its activity. Finished spans (including ones that raised) are kept in memory until save_timings()
+    :param stage: Name of the stage, i.e. 'streams'
+    :param activity_id: Activity the stage is processing
+    '''
+    stack = _local.__dict__.setdefault('stack', [])
+    parent, parent_activity_id = stack[-1] if stack else (None, None)
+    activity_id = parent_activity_id if activity_id is None else activity_id
+    stack.append((stage, activity_id))
+    started = datetime.utcnow()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        with _lock:
+            _spans.append({'stage': stage, 'parent': parent, 'activity_id': activity_id, 'started_utc': started,
+                           'seconds': seconds})
+
+
+def save_timings(run_utc):
+    '''
+    Write the finished spans to pipeline_timings and drop the ones older than retention_days
+    :param run_utc: timestamp_utc of the refresh the spans were recorded in
+    '''
+    with _lock:
+        spans = _spans[:]
+        _spans.clear()
+    with bulk_write() as connection:
+        if spans:
+            bulk_insert(pd.DataFrame(spans).assign(run_utc=run_utc), 'pipeline_timings', connection, index=False)
+        connection.execute(delete(pipelineTiming).where(
+            pipelineTiming.started_utc < datetime.utcnow() - timedelta(days=retention_days)))
+
+
+def stage_percentiles(days=30):
+    '''
+    p50/p95 seconds of each stage over the last days, slowest p95 first
+    :return: DataFrame of Stage, Runs, p50 (s), p95 (s), Max (s) and the activity of the slowest run
+    '''
+    df = pd.read_sql(sql=select(pipelineTiming.stage, pipelineTiming.activity_id, pipelineTiming.seconds).where(
+        pipelineTiming.started_utc >= datetime.utcnow() - timedelta(days=days)), con=engine)
+    columns = ['Stage', 'Runs', 'p50 (s)', 'p95 (s)', 'Max (s)', 'Slowest activity']
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    seconds = df.groupby('stage')['seconds']
+    stats = pd.DataFrame({'Runs': seconds.size(), 'p50 (s)': seconds.quantile(.5), 'p95 (s)': seconds.quantile(.95),
+                          'Max (s)': seconds.max()})
+    # Activity of each stage's slowest run, so slow activities can be looked into
+    stats['Slowest activity'] = df.loc[seconds.idxmax(), ['stage', 'activity_id']].set_index('stage')['activity_id']
+    stats = stats.sort_values('p95 (s)', ascending=False).rename_axis('Stage').reset_index()
+    return stats[columns]
@@ -0,0 +1,289 @@
+import math
+from datetime import datetime, timedelta, date
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, literal, null, union_all, Float, select, delete, and_, or_, bindparam
+
+from ..app import app
+from .database import engine, bulk_write, bulk_insert
+from .sqlalchemy_declarative import stravaBestSamples, stravaSummary, powerCurveBests
+
+curve_columns = ['mmp', 'activity_id', 'act_name', 'ftp', 'time_interval', 'date', 'timestamp_local',
+                 'watts_per_kg', 'weight']
+
+# power_curve_bests periods, every best sample is folded into one bucket of each. Day buckets would be about as
+# large as strava_best_samples itself (one activity a day), so partial months are read from the best samples
+periods = ['M', 'Y', 'all']
+all_time_bucket = date(1970, 1, 1)
+bucket_key = ['athlete_id', 'type', 'interval', 'period', 'bucket']
+bucket_columns = bucket_key + ['mmp', 'activity_id', 'ftp', 'watts_per_kg', 'timestamp_local', 'time_interval',
+                               'date', 'act_name']
+
+
+def curve_intervals(max_interval):
+    '''
+    Intervals plotted on the power curve
+    :param max_interval: Longest interval on file for the sport
+    :return: List of interval lengths in seconds
+    '''
+    # 1 second intervals from 0-60 seconds
+    interval_lengths = [i for i in range(1, 61)]
+    # 5 second intervals from 1:15 - 20:00 mins
+    interval_lengths += [i for i in range(65, 1201, 5)]
+    # 30 second intervals for everything after 20 mins
+    interval_lengths += [i for i in range(1230, (int(math.floor(max_interval / 10.0)) * 10) + 1, 30)]
+    return interval_lengths
+
+
+def bucket_bests(df_best_samples, periods=periods):
+    '''
+    Best row per athlete, type and interval within each period bucket
+    :param df_best_samples: strava_best_samples rows (as columns, not index)
+    :param periods: Periods to bucket on
+    :return: DataFrame of power_curve_bests rows
+    '''
+    df = df_best_samples.dropna(subset=['mmp']).sort_values(by='mmp', ascending=False, kind='mergesort')
+    timestamps = pd.to_datetime(df['timestamp_local'])
+    frames = []
+    for period in periods:
+        buckets = df.assign(
+            period=period,
+            bucket=all_time_bucket if period == 'all' else timestamps.dt.to_period(period).dt.start_time.dt.date)
+        frames.append(buckets.drop_duplicates(subset=bucket_key))
+    return pd.concat(frames)[bucket_columns]
+
+
+def update_power_curve_bests(df_best_samples, connection):
+    '''
+    Fold a new activity's best samples into power_curve_bests, only replacing the bucket bests it beats
+    :param df_best_samples: strava_best_samples rows of the activity, indexed on (activity_id, interval)
+    :param connection: Connection of the transaction the activity is being written on
+    '''
+    new = bucket_bests(df_best_samples.reset_index())
+    if len(new) == 0:
+        return
+
+    buckets = new[['athlete_id', 'type', 'period', 'bucket']].drop_duplicates()
+    existing = pd.read_sql(
+        sql=select(powerCurveBests.athlete_id, powerCurveBests.type, powerCurveBests.interval, powerCurveBests.period,
+                   powerCurveBests.bucket, powerCurveBests.mmp.label('existing_mmp')).where(or_(*[
+            and_(powerCurveBests.athlete_id == row.athlete_id, powerCurveBests.type == row.type,
+                 powerCurveBests.period == row.period, powerCurveBests.bucket == row.bucket)
+            for row in buckets.itertuples()])), con=connection)
+    existing['bucket'] = pd.to_datetime(existing['bucket']).dt.date
+
+    new = new.merge(existing, how='left', on=bucket_key)
+    beaten = new['existing_mmp'].notnull() & (new['mmp'] > new['existing_mmp'])
+    new = new[new['existing_mmp'].isnull() | beaten]
+
+    if beaten.any():
+        connection.execute(
+            delete(powerCurveBests).where(powerCurveBests.athlete_id == bindparam('b_athlete_id'),
+                                          powerCurveBests.type == bindparam('b_type'),
+                                          powerCurveBests.interval == bindparam('b_interval'),
+                                          powerCurveBests.period == bindparam('b_period'),
+                                          powerCurveBests.bucket == bindparam('b_bucket')),
+            [{'b_' + key: value for key, value in zip(bucket_key, row)}
+             for row in new.loc[beaten[beaten].index, bucket_key].itertuples(index=False)])
+
+    bulk_insert(new[bucket_columns], 'power_curve_bests', connection, index=False)
+
+
+def rebuild_power_curve_bests():
+    '''
+    Recompute power_curve_bests from strava_best_samples, a year of best samples at a time.
+    Needed whenever strava_best_samples is deleted from (truncates) rather than appended to
+    '''
+    with bulk_write() as connection:
+        connection.execute(delete(powerCurveBests))
+
+        first, last = connection.execute(
+            select(func.min(stravaBestSamples.timestamp_local), func.max(stravaBestSamples.timestamp_local))).first()
+        if first is None:
+            return
+
+        yearly_bests = []
+        for year in range(pd.Timestamp(first).year, pd.Timestamp(last).year + 1):
+            df = pd.read_sql(
+                sql=select(*[stravaBestSamples.__table__.c[column] for column in bucket_columns
+                             if column not in ['period', 'bucket']]).where(
+                    stravaBestSamples.timestamp_local >= datetime(year, 1, 1),
+                    stravaBestSamples.timestamp_local < datetime(year + 1, 1, 1)), con=connection)
+            if len(df) == 0:
+                continue
+            df = bucket_bests(df, periods=['M', 'Y'])
+            bulk_insert(df, 'power_curve_bests', connection, index=False)
+            yearly_bests.append(df[df['period'] == 'Y'])
+
+        # All time best is the best of the yearly bests
+        if yearly_bests:
+            bulk_insert(bucket_bests(pd.concat(yearly_bests), periods=['all']), 'power_curve_bests', connection,
+                        index=False)
+
+
+def best_intervals_query(window, table, filters, join_summary=False):
+    '''
+    Best row per interval (MAX(mmp) ... GROUP BY interval, the other columns come from the max row)
+    :param window: Label identifying the window in the combined result
+    :param table: stravaBestSamples or powerCurveBests
+    :param filters: Filters applied before grouping
+    :param join_summary: Join strava_summary for the weight at time of workout and intensity filters
+    :return: Select statement
+    '''
+    query = app.session.query(
+        literal(window).label('window'), func.max(table.mmp).label('mmp'), table.activity_id, table.act_name,
+        table.ftp, table.interval, table.time_interval, table.date, table.timestamp_local, table.watts_per_kg,
+        stravaSummary.weight if join_summary else null().cast(Float).label('weight'))
+    if join_summary:
+        query = query.join(stravaSummary, table.activity_id == stravaSummary.activity_id, isouter=True)
+    return query.filter(*filters).group_by(table.interval).statement
+
+
+class PowerCurveSamples:
+    '''
+    Fetches every power curve window (all time, L90D, L6W, L30D, time comparison, single workout and the training
+    distribution) with one combined statement.
+
+    Windows are answered from power_curve_bests: all time from its 'all' buckets, and the last n days from the
+    month buckets the window fully covers plus the best samples of the (partial) month it starts in.
+    Intensity filtered windows and single workouts are read from strava_best_samples.
+    '''
+
+    def __init__(self, activity_type='ride', windows=((None, 'all'), (90, 'all'), (42, 'all'), (30, 'all')),
+                 last_id=None, lookback=90):
+        '''
+        :param activity_type: Strava activity type to match ('ride', 'run', ...)
+        :param windows: (days, workout_intensity) of each window the chart needs. days of None is all time
+        :param last_id: Optional activity to load for a single workout curve
+        :param lookback: Days for which every interval (not just the plotted ones) is returned, for the
+                         training distribution. None to skip
+        '''
+        self.activity_type = '%' + activity_type + '%'
+        self.lookback = lookback
+        self.now = datetime.now()
+
+        self.max_interval = app.session.query(func.max(powerCurveBests.interval)).filter(
+            powerCurveBests.period == 'all', powerCurveBests.type.ilike(self.activity_type)).scalar() or 0
+        self.intervals = curve_intervals(self.max_interval) if self.max_interval else []
+
+        queries = {}
+        if lookback:
+            queries['td'] = self.days_queries('td', lookback, curve_only=False)
+        for days, intensity in dict.fromkeys(windows):
+            window = self.window_label(days, intensity)
+            if intensity != 'all':
+                filters = [stravaBestSamples.interval.in_(self.intervals),
+                           stravaBestSamples.type.ilike(self.activity_type),
+                           stravaSummary.workout_intensity == intensity]
+                if days is not None:
+                    filters.append(stravaBestSamples.timestamp_local >= (self.now - timedelta(days=days)))
+                queries[window] = [best_intervals_query(window, stravaBestSamples, filters, join_summary=True)]
+            elif days is None:
+                queries[window] = [best_intervals_query(window, powerCurveBests, [
+                    powerCurveBests.period == 'all', powerCurveBests.interval.in_(self.intervals),
+                    powerCurveBests.type.ilike(self.activity_type)])]
+            else:
+                queries[window] = self.days_queries(window, days)
+        if last_id:
+            queries['workout'] = [best_intervals_query('workout', stravaBestSamples, [
+                stravaBestSamples.activity_id == last_id, stravaBestSamples.interval.in_(self.intervals)])]
+
+        self.windows = list(queries)
+        self.samples = pd.read_sql(sql=union_all(*[query for window in queries.values() for query in window]),
+                                   con=engine)
+
+        app.session.remove()
+
+        # Windows made of several buckets return a best per bucket, keep the best of each window
+        self.samples = self.samples.sort_values(by='mmp', ascending=False, kind='mergesort').drop_duplicates(
+            subset=['window', 'interval'])
+
+    def days_queries(self, window, days, curve_only=True):
+        '''
+        Queries for the last n days: the month buckets the window fully covers, and the best samples of the
+        (partial) month it starts in
+        '''
+        start = self.now - timedelta(days=days)
+        next_month = start.date().replace(day=1) + relativedelta(months=1)
+        bucket_filters = [powerCurveBests.type.ilike(self.activity_type)]
+        sample_filters = [stravaBestSamples.type.ilike(self.activity_type), stravaBestSamples.timestamp_local >= start,
+                          stravaBestSamples.timestamp_local < datetime.combine(next_month, datetime.min.time())]
+        if curve_only:
+            bucket_filters.append(powerCurveBests.interval.in_(self.intervals))
+            sample_filters.append(stravaBestSamples.interval.in_(self.intervals))
+        else:
+            # Without an interval list the best samples index can't be seeked, so find the activities first from
+            # their 1 second rows (an activity can't have started more than max_interval seconds before the window)
+            sample_filters.append(stravaBestSamples.activity_id.in_(
+                select(stravaBestSamples.activity_id).where(
+                    stravaBestSamples.interval == 1,
+                    stravaBestSamples.timestamp_local >= start - timedelta(seconds=self.max_interval),
+                    stravaBestSamples.timestamp_local < datetime.combine(next_month, datetime.min.time()))))
+        join_summary = window == 'td'
+        return [
+            best_intervals_query(window, powerCurveBests, bucket_filters + [
+                powerCurveBests.period == 'M', powerCurveBests.bucket >= next_month], join_summary=join_summary),
+            best_intervals_query(window, stravaBestSamples, sample_filters, join_summary=join_summary)]
+
+    @staticmethod
+    def window_label(days, intensity):
+        return '{}_{}'.format(days, intensity)
+
+    def best(self, days=None, intensity='all', activity_id=None, curve_only=True):
+        '''
+        Best row per interval for one window
+        :param days: Only include workouts from the last n days (None for all time)
+        :param intensity: Only include workouts with this workout_intensity ('all' for no filter)
+        :param activity_id: Single workout curve (the one passed as last_id)
+        :param curve_only: Only return plotted intervals. Every interval is only loaded for the lookback window
+        :return: DataFrame indexed on interval
+        '''
+        if activity_id:
+            window = 'workout'
+        elif not curve_only and days == self.lookback and intensity == 'all':
+            window = 'td'
+        else:
+            window = self.window_label(days, intensity)
+        if window not in self.windows:
+            raise ValueError('Window {} was not loaded'.format(window))
+
+        return self.samples[self.samples['window'] == window].set_index('interval')[curve_columns].sort_index()
+
+    def all_time_best(self, intervals):
+        '''
+        All time best row for specific intervals, plotted or not
+        :param intervals: List of interval lengths
+        :return: DataFrame indexed on interval
+        '''
+        df = pd.read_sql(sql=best_intervals_query('all_time', powerCurveBests, [
+            powerCurveBests.period == 'all', powerCurveBests.type.ilike(self.activity_type),
+            powerCurveBests.interval.in_([int(i) for i in intervals])]), con=engine)
+
+        app.session.remove()
+
+        return df.set_index('interval')[curve_columns].sort_index()
+
+
+def interval_bests(interval, activity_type='ride', period='M', power_unit='mmp'):
+    '''
+    Best rows of an interval for grouping by day, week, month or year. Months and years of watts are read from
+    power_curve_bests, everything else from strava_best_samples
+    :param interval: Interval length in seconds
+    :param activity_type: Strava activity type to match ('ride', 'run', ...)
+    :param period: 'D', 'W', 'M' or 'Y'
+    :param power_unit: 'mmp' or 'watts_per_kg', the value the rows will be ranked on
+    :return: DataFrame indexed on timestamp_local
+    '''
+    # power_curve_bests keeps the highest watts effort of each bucket, which is not the best W/kg once weight changed
+    table = powerCurveBests if period in ['M', 'Y'] and power_unit == 'mmp' else stravaBestSamples
+    filters = [table.type.ilike('%' + activity_type + '%'), table.interval == interval]
+    if table is powerCurveBests:
+        filters.append(powerCurveBests.period == period)
+
+    df = pd.read_sql(sql=app.session.query(table).filter(*filters).statement, con=engine,
+                     index_col=['timestamp_local'])
+
+    app.session.remove()
+
+    return df
@@ -0,0 +1,172 @@
+import functools
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from flask import request, g, jsonify
+from sqlalchemy import event
+
+from .database import engine
+from ..utils import config
+
+# Time every dash callback (wall time, db queries and payload size), served on /_fitly/perf and the settings page
+profiler_enabled = config.get('logger', 'callback_profiler', fallback='False').lower() == 'true'
+# Invocations of each callback the profiles are computed over
+profiler_samples = int(config.get('logger', 'callback_profiler_samples', fallback=500))
+# Upper bounds (ms) of the wall time histogram buckets, the last bucket takes everything slower
+histogram_buckets_ms = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Queries executed by the current thread while a callback is being tracked (None when not tracking)
+_local = threading.local()
+
+
+@event.listens_for(engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'queries', None) is not None:
+        _local.queries += 1
+    if getattr(_local, 'profile', None) is not None:
+        _local.profile['queries'] += 1
+        _local.query_started = time.perf_counter()
+
+
+@event.listens_for(engine, 'after_cursor_execute')
+def time_query(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'profile', None) is not None and getattr(_local, 'query_started', None) is not None:
+        _local.profile['query_ms'] += (time.perf_counter() - _local.query_started) * 1000
+        _local.query_started = None
+
+
+def is_callback_request():
+    return request.path.endswith('_dash-update-component')
+
+
+def callback_name():
+    '''
+    Outputs of the Dash callback being served, which identify the callback
+    '''
+    body = request.get_json(silent=True) or {}
+    return body.get('output', request.path)
+
+
+def track_callback_queries(server):
+    '''
+    Log the number of db queries and wall time of every Dash callback served by the flask server
+    :param server: Flask instance of the Dash app
+    '''
+
+    @server.before_request
+    def start_callback_tracking():
+        if is_callback_request():
+            _local.queries = 0
+            g.callback_started = time.perf_counter()
+
+    @server.after_request
+    def log_callback_queries(response):
+        if is_callback_request() and getattr(_local, 'queries', None) is not None:
+            server.logger.info('Callback {}: {} db queries in {:.0f} ms'.format(
+                callback_name(), _local.queries, (time.perf_counter() - g.callback_started) * 1000))
+            _local.queries = None
+        return response
+
+
+class CallbackProfiles:
+    '''
+    Rolling window of the last profiler_samples invocations of every callback
+    '''
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.invocations = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def add(self, callback, function, wall_ms, queries, query_ms, payload_bytes):
+        with self.lock:
+            if callback not in self.invocations:
+                self.invocations[callback] = (function, deque(maxlen=self.samples))
+                self.counts[callback] = 0
+            self.invocations[callback][1].append((wall_ms, queries, query_ms, payload_bytes))
+            self.counts[callback] += 1
+
+    def summary(self):
+        '''
+        :return: List of a dict per callback, slowest p95 first
+        '''
+        with self.lock:
+            windows = {callback: (function, np.array(window, dtype='float64'))
+                       for callback, (function, window) in self.invocations.items()}
+            counts = dict(self.counts)
+        profiles = []
+        for callback, (function, window) in windows.items():
+            wall_ms, queries, query_ms, payload_bytes = window.T
+            histogram = np.bincount(np.searchsorted(histogram_buckets_ms, wall_ms),
+                                    minlength=len(histogram_buckets_ms) + 1)
+            profiles.append({
+                'callback': callback,
+                'function': function,
+                'invocations': counts[callback],
+                'window': len(window),
+                'wall_ms_p50': float(np.percentile(wall_ms, 50)),
+                'wall_ms_p95': float(np.percentile(wall_ms, 95)),
+                'wall_ms_max': float(wall_ms.max()),
+                'queries_mean': float(queries.mean()),
+                'query_ms_mean': float(query_ms.mean()),
+                'payload_bytes_p50': float(np.percentile(payload_bytes, 50)),
+                'payload_bytes_max': float(payload_bytes.max()),
+                # Buckets in order, the last one (le_ms None) is everything slower than the last bound
+                'wall_ms_histogram': [{'le_ms': bound, 'count': count} for bound, count in
+                                      zip(histogram_buckets_ms + [None], histogram.tolist())]})
+        return sorted(profiles, key=lambda profile: profile['wall_ms_p95'], reverse=True)
+
+
+callback_profiles = CallbackProfiles(profiler_samples)
+
+
+def profile_callbacks(app):
+    '''
+    Wrap every function registered with app.callback from now on to count its db queries and their time. Wall time
+    (including serializing the response) and payload size are taken around the request, and the profiles are served
+    as json on /_fitly/perf
+    :param app: Dash instance, before any page registers its callbacks
+    '''
+    register = app.callback
+
+    @functools.wraps(register)
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+
+        def wrap(function):
+            name = '{}.{}'.format(function.__module__.split('.')[-1], function.__name__)
+
+            @functools.wraps(function)
+            def profiled(*function_args, **function_kwargs):
+                _local.profile = {'function': name, 'queries': 0, 'query_ms': 0.0}
+                try:
+                    return function(*function_args, **function_kwargs)
+                finally:
+                    g.callback_profile = _local.profile
+                    _local.profile = None
+
+            return decorator(profiled)
+
+        return wrap
+
+    app.callback = callback
+
+    @app.server.before_request
+    def start_callback_profile():
+        if is_callback_request():
+            g.callback_profile_started = time.perf_counter()
+
+    @app.server.after_request
+    def save_callback_profile(response):
+        profile = g.pop('callback_profile', None)
+        if profile is not None and 'callback_profile_started' in g:
+            callback_profiles.add(callback_name(), wall_ms=(time.perf_counter() - g.callback_profile_started) * 1000,
+                                  payload_bytes=response.calculate_content_length() or 0, **profile)
+        return response
+
+    @app.server.route('/_fitly/perf')
+    def callback_perf():
+        return jsonify(callback_profiles.summary())
@@ -0,0 +1,185 @@
+import os
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import select, delete, func, inspect, text, union_all, Table, MetaData
+from sqlalchemy.exc import DBAPIError
+
+from ..app import app
+from .database import engine, bulk_write, bulk_insert
+from .sqlalchemy_declarative import stravaSummary, stravaSamplesCompact
+from .samples_archive import archive_enabled, archive_path, read_archive, write_archive
+
+# Columns of the frame strava_samples reads returned, in its order (timestamp_local is the index)
+sample_columns = ['timestamp_utc', 'time_interval', 'activity_id', 'date', 'type', 'act_name', 'athlete_id', 'distance',
+                  'velocity_smooth', 'temp', 'altitude', 'latitude', 'longitude', 'heartrate', 'cadence', 'watts',
+                  'moving', 'grade_smooth', 'ftp', 'time', 'power_zone', 'hr_zone', 'hr_lowest']
+stored_columns = [str(column.key) for column in stravaSamplesCompact.__table__.columns]
+# Activities per transaction when moving strava_samples into strava_samples_compact
+compact_batch_activities = 50
+
+
+def compact_samples(df_samples):
+    '''
+    Rows of a samples frame for strava_samples_compact, without the columns that can be derived from strava_summary
+    :param df_samples: Samples of one or more activities, with activity_id and time columns
+    :return: DataFrame of the stored columns
+    '''
+    df = df_samples.reset_index(drop=True).reindex(columns=stored_columns)
+    df = df.dropna(subset=['activity_id', 'time'])
+    df['time'] = df['time'].round().astype('int64')
+    return df.drop_duplicates(subset=['activity_id', 'time'])
+
+
+def load_samples(activity_id=None, sport=None, since=None, columns=None):
+    '''
+    Samples in the shape strava_samples used to return: indexed on timestamp_local, with the per activity columns
+    joined back in from strava_summary. Activities in the samples archive are read from their Arrow files
+    :param activity_id: Only this activity
+    :param sport: Only activities whose type is like this (i.e. 'run', '%ride%')
+    :param since: Only samples from this local time on
+    :param columns: Sample columns to read (all if None), the per activity columns are always included
+    :return: DataFrame of samples
+    '''
+    summary = select(stravaSummary.activity_id, stravaSummary.type, stravaSummary.name.label('act_name'),
+                     stravaSummary.athlete_id, stravaSummary.start_date_local, stravaSummary.start_date_utc)
+    if activity_id is not None:
+        summary = summary.where(stravaSummary.activity_id == activity_id)
+    if sport is not None:
+        summary = summary.where(stravaSummary.type.like(sport))
+    if since is not None:
+        # Activities from the day before can still run past since
+        summary = summary.where(stravaSummary.start_date_local >= since - timedelta(days=1))
+    read = [column for column in stored_columns if column not in ('activity_id', 'time') and (
+            columns is None or column in columns)]
+
+    frames, missing = [], []
+    if archive_enabled:
+        # Activities with an Arrow file are mapped and projected, the rest are read from the db
+        for activity in pd.read_sql(sql=summary, con=engine).to_dict('records'):
+            df = read_archive(activity['activity_id'], read)
+            if df is None:
+                missing.append(activity['activity_id'])
+            else:
+                frames.append(df.assign(**activity))
+        summary = summary.where(stravaSummary.activity_id.in_(missing))
+
+    if not archive_enabled or missing or not frames:
+        summary = summary.subquery()
+        frames.append(read_samples(summary, read))
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    elapsed = pd.to_timedelta(df['time'], unit='s')
+    df['timestamp_local'] = pd.to_datetime(df.pop('start_date_local')) + elapsed
+    df['timestamp_utc'] = pd.to_datetime(df.pop('start_date_utc')) + elapsed
+    df['time_interval'] = pd.Timestamp('1970-01-01') + elapsed
+    df['date'] = df['timestamp_local'].dt.date
+    if since is not None:
+        df = df[df['timestamp_local'] >= since]
+
+    df = df.set_index('timestamp_local').sort_index(kind='stable')
+    return df[[column for column in sample_columns if column in df.columns]]
+
+
+def read_samples(summary, read):
+    '''
+    Samples of the selected activities from strava_samples_compact. Databases that have not been compacted yet also
+    have activities in strava_samples, compact_strava_samples() moves each activity in one transaction so both
+    tables are read in one statement to never miss or double up an activity that is being moved
+    :param summary: Subquery of the selected strava_summary rows
+    :param read: Sample columns to read
+    :return: DataFrame of the summary columns, time and the read columns
+    '''
+    samples = stravaSamplesCompact.__table__.c
+    query = select(summary, samples.time, *[samples[column] for column in read]).join(
+        stravaSamplesCompact, samples.activity_id == summary.c.activity_id)
+    if not legacy_samples_exist():
+        return pd.read_sql(sql=query, con=engine)
+
+    legacy = Table('strava_samples', MetaData(), autoload_with=engine)
+    df = pd.read_sql(sql=union_all(query, select(summary, legacy.c.time, *[legacy.c[column] for column in read]).join(
+        legacy, legacy.c.activity_id == summary.c.activity_id)), con=engine)
+    # Key the legacy rows on (activity_id, time) like strava_samples_compact
+    df = df.dropna(subset=['time'])
+    df['time'] = df['time'].round().astype('int64')
+    return df.drop_duplicates(subset=['activity_id', 'time'])
+
+
+def archive_samples():
+    '''
+    Write Arrow files for the activities in strava_samples_compact that don't have one yet (i.e. after turning the
+    samples archive on)
+    :return: Number of files written
+    '''
+    with engine.connect() as connection:
+        activity_ids = connection.execute(select(stravaSamplesCompact.activity_id).distinct()).scalars().all()
+    written = 0
+    for activity_id in activity_ids:
+        if not os.path.exists(archive_path(activity_id)):
+            write_archive(activity_id, pd.read_sql(
+                sql=select(stravaSamplesCompact).where(stravaSamplesCompact.activity_id == activity_id).order_by(
+                    stravaSamplesCompact.time), con=engine))
+            written += 1
+    return written
+
+
+def table_bytes(table):
+    '''
+    On disk size of a table and its indexes
+    :return: Bytes, or None where the db can't tell
+    '''
+    queries = {
+        # dbstat is only there when sqlite was compiled with it
+        'sqlite': "SELECT SUM(pgsize) FROM dbstat WHERE name = :table OR name IN "
+                  "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table)",
+        'postgresql': "SELECT pg_total_relation_size(:table)",
+        'mysql': "SELECT data_length + index_length FROM information_schema.tables "
+                 "WHERE table_schema = DATABASE() AND table_name = :table"}
+    if engine.dialect.name not in queries:
+        return None
+    try:
+        with engine.connect() as connection:
+            return connection.execute(text(queries[engine.dialect.name]), {'table': table}).scalar()
+    except DBAPIError:
+        return None
+
+
+def legacy_samples_exist():
+    return inspect(engine).has_table('strava_samples')
+
+
+def compact_strava_samples():
+    '''
+    Move the rows of the old strava_samples table into strava_samples_compact, a batch of activities per transaction
+    so an interrupted run picks up where it left off, then drop strava_samples. Values are stored at the precision of
+    the compact columns (float32 / smallint) and rows without an activity are discarded, so back up the db first
+    :return: Tuple of (strava_samples bytes before, strava_samples_compact bytes after), None if there was nothing
+    to move
+    '''
+    if not legacy_samples_exist():
+        return None
+    legacy = Table('strava_samples', MetaData(), autoload_with=engine)
+    before = table_bytes('strava_samples')
+
+    app.server.logger.info('Moving strava_samples into strava_samples_compact...')
+    while True:
+        with bulk_write() as connection:
+            activity_ids = connection.execute(select(legacy.c.activity_id).where(
+                legacy.c.activity_id.isnot(None)).distinct().limit(compact_batch_activities)).scalars().all()
+            if not activity_ids:
+                break
+            df = pd.read_sql(sql=select(legacy).where(legacy.c.activity_id.in_(activity_ids)), con=connection)
+            bulk_insert(compact_samples(df), 'strava_samples_compact', connection, index=False)
+            connection.execute(delete(legacy).where(legacy.c.activity_id.in_(activity_ids)))
+
+    # Rows without an activity can't be keyed, they go with the table
+    with engine.connect() as connection:
+        discarded = connection.execute(select(func.count()).select_from(legacy)).scalar()
+    if discarded:
+        app.server.logger.warning('Discarding {} strava_samples rows without an activity_id'.format(discarded))
+    legacy.drop(engine)
+    after = table_bytes('strava_samples_compact')
+    if before is not None and after is not None:
+        app.server.logger.info('strava_samples {:.1f} MB -> strava_samples_compact {:.1f} MB ({:.0%} smaller)'.format(
+            before / 1024 ** 2, after / 1024 ** 2, 1 - after / before if before else 0))
+    return before, after
@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+from ..app import app
+from ..utils import config
+
+# Optional Arrow file per activity next to strava_samples_compact, read memory mapped by the workout charts
+archive_enabled = config.get('strava', 'samples_archive', fallback='False').lower() == 'true'
+archive_dir = config.get('strava', 'samples_archive_dir', fallback='./config/samples')
+
+if archive_enabled:
+    # Only needed when the archive is turned on (pip install fit.ly[archive])
+    try:
+        import pyarrow as pa
+        from pyarrow import feather
+    except ImportError:
+        app.server.logger.error('[strava] samples_archive is on but pyarrow is not installed, samples will only be '
+                                'read from and written to the db. Install it with pip install fit.ly[archive]')
+        archive_enabled = False
+
+if archive_enabled:
+    os.makedirs(archive_dir, exist_ok=True)
+
+
+def archive_path(activity_id):
+    return os.path.join(archive_dir, '{}.arrow'.format(int(activity_id)))
+
+
+def delete_archive(activity_id):
+    '''
+    Remove an activity's Arrow file (if any), its samples are then read from strava_samples_compact
+    '''
+    try:
+        os.remove(archive_path(activity_id))
+    except FileNotFoundError:
+        pass
+
+
+def clear_archive():
+    '''
+    Remove every Arrow file, i.e. when strava_samples_compact is truncated
+    '''
+    if os.path.isdir(archive_dir):
+        for name in os.listdir(archive_dir):
+            if name.endswith('.arrow'):
+                os.remove(os.path.join(archive_dir, name))
+
+
+def write_archive(activity_id, df):
+    '''
+    Write an activity's samples to its Arrow file. Files are uncompressed so reads can map them without decoding, and
+    nan is stored as is (not as null) so numeric columns convert to numpy without a copy
+    :param activity_id: Activity the samples belong to
+    :param df: strava_samples_compact rows of the activity
+    '''
+    table = pa.table({column: pa.array(df[column].to_numpy(dtype='int64' if column == 'time' else 'float64'),
+                                       from_pandas=False) for column in df.columns if column != 'activity_id'})
+    # Write to a temp file and rename so readers never map a partial file
+    fd, temp_path = tempfile.mkstemp(dir=archive_dir, suffix='.tmp')
+    os.close(fd)
+    try:
+        feather.write_feather(table, temp_path, compression='uncompressed')
+        os.replace(temp_path, archive_path(activity_id))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def read_archive(activity_id, columns):
+    '''
+    Memory map an activity's Arrow file and convert only the requested columns
+    :param activity_id: Activity to read
+    :param columns: Sample columns to read, time is always included
+    :return: DataFrame, or None if the activity has no file
+    '''
+    path = archive_path(activity_id)
+    if not os.path.exists(path):
+        return None
+    table = feather.read_table(path, columns=['time'] + [column for column in columns if column != 'time'],
+                               memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
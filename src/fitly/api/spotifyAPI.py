@@ -5,6 +5,7 @@ from ..utils import config
 from ..app import app
 from ..api.database import engine
 from ..api.sqlalchemy_declarative import apiTokens, spotifyPlayHistory, stravaSummary
+from ..api.intervals import interval_join
 from sqlalchemy import delete, func, extract
 from datetime import datetime, timedelta
 import ast
@@ -201,14 +202,13 @@ def get_played_tracks(workout_intensity='all', sport='all', pop_time_period='all
     df_summary['end_date_utc'] = df_summary['start_date_utc'] + pd.to_timedelta(df_summary['elapsed_time'], 's')
     df_summary.drop(columns=['elapsed_time'], inplace=True)
 
-    # Full Cross Join
-    df_tracks = df_tracks.assign(join_key=1)
-    df_summary = df_summary.assign(join_key=1)
-    df_merge = pd.merge(df_summary, df_tracks, on='join_key').drop('join_key', axis=1)
-    # Filter only on tracks performed during workout times
-    df_merge = df_merge.query('timestamp_utc >= start_date_utc and timestamp_utc <= end_date_utc')
-    # Join back to original date range table and drop key column
-    df = df_tracks.merge(df_merge, on=['timestamp_utc'], how='left').fillna('').drop('join_key', axis=1)
+    # Pair tracks with the workouts they were played during
+    track_positions, workout_positions = interval_join(df_tracks['timestamp_utc'], df_summary['start_date_utc'],
+                                                       df_summary['end_date_utc'])
+    df_merge = pd.concat([df_summary.iloc[workout_positions].reset_index(drop=True),
+                          df_tracks.iloc[track_positions].reset_index(drop=True)], axis=1)
+    # Join back to original date range table
+    df = df_tracks.merge(df_merge, on=['timestamp_utc'], how='left').fillna('')
     # Days with no workout_intensity are rest days
     df.at[df['start_date_utc'] == '', 'workout_intensity'] = 'rest'
     # Cleanup the end resulting df
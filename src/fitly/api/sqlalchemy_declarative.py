@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Float, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Float, BigInteger, SmallInteger, Index
 from .database import Base
 
 
@@ -79,32 +79,28 @@ class annotations(Base):
 
 ##### Strava Tables #####
 
-class stravaSamples(Base):
-    __tablename__ = 'strava_samples'
-    timestamp_local = Column('timestamp_local', DateTime(), index=True, primary_key=True)
-    timestamp_utc = Column('timestamp_utc', DateTime())
-    time_interval = Column('time_interval', DateTime())
-    activity_id = Column('activity_id', BigInteger())
-    date = Column('date', Date())
-    type = Column('type', String(255))
-    act_name = Column('act_name', String(255))
-    athlete_id = Column('athlete_id', BigInteger())
-    distance = Column('distance', Float())
-    velocity_smooth = Column('velocity_smooth', Float())
-    temp = Column('temp', Float())
-    altitude = Column('altitude', Float())
+class stravaSamplesCompact(Base):
+    # 1 second samples keyed on activity and elapsed second. The columns strava_samples repeated on every row (name,
+    # type, athlete, start times) are joined back in from strava_summary by api.samples.load_samples()
+    __tablename__ = 'strava_samples_compact'
+    activity_id = Column('activity_id', BigInteger(), primary_key=True)
+    time = Column('time', Integer(), primary_key=True)
+    distance = Column('distance', Float(precision=24))
+    velocity_smooth = Column('velocity_smooth', Float(precision=24))
+    temp = Column('temp', Float(precision=24))
+    altitude = Column('altitude', Float(precision=24))
+    # Single precision would move gps points by up to a meter
     latitude = Column('latitude', Float())
     longitude = Column('longitude', Float())
-    heartrate = Column('heartrate', Integer())
-    cadence = Column('cadence', Integer())
-    watts = Column('watts', Integer())
-    moving = Column('moving', Integer())
-    grade_smooth = Column('grade_smooth', Float())
-    ftp = Column('ftp', Float())
-    time = Column('time', Integer())
-    power_zone = Column('power_zone', Integer())
-    hr_zone = Column('hr_zone', Integer())
-    hr_lowest = Column('hr_lowest', Integer())
+    heartrate = Column('heartrate', SmallInteger())
+    cadence = Column('cadence', SmallInteger())
+    watts = Column('watts', SmallInteger())
+    moving = Column('moving', SmallInteger())
+    grade_smooth = Column('grade_smooth', Float(precision=24))
+    ftp = Column('ftp', Float(precision=24))
+    power_zone = Column('power_zone', SmallInteger())
+    hr_zone = Column('hr_zone', SmallInteger())
+    hr_lowest = Column('hr_lowest', SmallInteger())
 
 
 class stravaBestSamples(Base):
@@ -122,6 +118,59 @@ class stravaBestSamples(Base):
     act_name = Column('act_name', String(255))
     athlete_id = Column('athlete_id', BigInteger())
 
+    __table_args__ = (
+        # Power curves / profiles filter on interval and a date window. type is filtered with (i)like, which can't
+        # seek an index, so it goes last where it can still be checked without reading the row
+        Index('ix_strava_best_samples_interval_timestamp_local_type', 'interval', 'timestamp_local', 'type'),
+    )
+
+
+class powerCurveBests(Base):
+    # Best strava_best_samples row per interval within each month / year (and all time), maintained on ingest
+    __tablename__ = 'power_curve_bests'
+    athlete_id = Column('athlete_id', BigInteger(), primary_key=True)
+    type = Column('type', String(255), primary_key=True)
+    interval = Column('interval', Integer, primary_key=True)
+    period = Column('period', String(3), primary_key=True)  # 'M', 'Y' or 'all'
+    bucket = Column('bucket', Date(), primary_key=True)  # First day of the period (1970-01-01 for 'all')
+    mmp = Column('mmp', Float())
+    activity_id = Column('activity_id', BigInteger())
+    ftp = Column('ftp', Float())
+    watts_per_kg = Column('watts_per_kg', Float())
+    timestamp_local = Column('timestamp_local', DateTime())
+    time_interval = Column('time_interval', DateTime())
+    date = Column('date', Date())
+    act_name = Column('act_name', String(255))
+
+    __table_args__ = (
+        Index('ix_power_curve_bests_period_bucket_interval', 'period', 'bucket', 'interval'),
+    )
+
+
+class dailyTrainingLoad(Base):
+    # strava_summary stress totals per day and sport with each sport's fitness / fatigue, maintained on ingest
+    __tablename__ = 'daily_training_load'
+    athlete_id = Column('athlete_id', BigInteger(), primary_key=True)
+    date = Column('date', Date(), primary_key=True)
+    type = Column('type', String(255), primary_key=True)
+    activities = Column('activities', Integer())
+    elapsed_time = Column('elapsed_time', BigInteger())
+    distance = Column('distance', Float())
+    tss = Column('tss', Float())
+    hrss = Column('hrss', Float())
+    trimp = Column('trimp', Float())
+    stress_score = Column('stress_score', Float())  # tss, falling back to hrss per activity
+    low_intensity_seconds = Column('low_intensity_seconds', Integer())
+    mod_intensity_seconds = Column('mod_intensity_seconds', Integer())
+    high_intensity_seconds = Column('high_intensity_seconds', Integer())
+    ctl = Column('ctl', Float())
+    atl = Column('atl', Float())
+    tsb = Column('tsb', Float())
+
+    __table_args__ = (
+        Index('ix_daily_training_load_date', 'date'),
+    )
+
 
 class stravaSummary(Base):
     __tablename__ = 'strava_summary'
@@ -172,6 +221,13 @@ class stravaSummary(Base):
     workout_intensity = Column('workout_intensity', String(4))
     weight = Column('weight', Float())
 
+    __table_args__ = (
+        Index('ix_strava_summary_activity_id', 'activity_id'),
+        # Samples since a date (zone_chart) and the activities of a day (activity table)
+        Index('ix_strava_summary_start_date_local', 'start_date_local'),
+        Index('ix_strava_summary_start_day_local', 'start_day_local'),
+    )
+
 
 class strydSummary(Base):
     __tablename__ = 'stryd_summary'
@@ -502,6 +558,41 @@ class dbRefreshStatus(Base):
     strava_status = Column('strava_status', String(255))
     withings_status = Column('withings_status', String(255))
     fitbod_status = Column('fitbod_status', String(255))
+    stryd_status = Column('stryd_status', String(255))
+    strava_api_budget = Column('strava_api_budget', String(255))
+    # Seconds each source took to pull, sources are pulled concurrently so these overlap
+    oura_seconds = Column('oura_seconds', Float())
+    strava_seconds = Column('strava_seconds', Float())
+    withings_seconds = Column('withings_seconds', Float())
+    fitbod_seconds = Column('fitbod_seconds', Float())
+    stryd_seconds = Column('stryd_seconds', Float())
+
+
+class dataGeneration(Base):
+    # Moved forward whenever the processing flag is cleared (refreshes that fail included), see api/cache.py
+    __tablename__ = 'data_generation'
+    id = Column('id', Integer(), primary_key=True)
+    updated_utc = Column('updated_utc', DateTime())
+
+
+class stravaSync(Base):
+    # Where the last strava refresh left off, so refreshes only list activities newer than the cursor
+    __tablename__ = 'strava_sync'
+    athlete_id = Column('athlete_id', BigInteger(), primary_key=True)
+    cursor_utc = Column('cursor_utc', DateTime())  # start of the newest activity listed and stored
+    last_full_sync_utc = Column('last_full_sync_utc', DateTime())
+
+
+class pipelineTiming(Base):
+    # Time spent in each stage of a refresh, recorded by api/pipeline_timings.py
+    __tablename__ = 'pipeline_timings'
+    id = Column('id', Integer(), index=True, primary_key=True, autoincrement=True)
+    run_utc = Column('run_utc', DateTime(), index=True)  # timestamp_utc of the db_refresh record
+    stage = Column('stage', String(255), index=True)
+    parent = Column('parent', String(255))  # stage the span was opened in
+    activity_id = Column('activity_id', BigInteger())
+    started_utc = Column('started_utc', DateTime(), index=True)
+    seconds = Column('seconds', Float())
 
 
 class withings(Base):
@@ -5,14 +5,108 @@ from sqlalchemy import delete
 from ..api.sqlalchemy_declarative import apiTokens
 from ..utils import config
 from ..app import app
+from ..exceptions import StravaRateLimitExceeded
 import ast
 import time
+import threading
+import requests
 
 client_id = config.get('strava', 'client_id')
 client_secret = config.get('strava', 'client_secret')
 redirect_uri = config.get('strava', 'redirect_uri')
 
 
+class StravaRequestScheduler:
+    '''
+    Token bucket for each of strava's rate limit windows, shared by every strava request in the process.
+    The 15 minute window resets on the quarter hour and the daily window resets at midnight UTC
+    (https://developers.strava.com/docs/rate-limits/). Limits and usage are synced from the X-RateLimit-Limit and
+    X-RateLimit-Usage headers of every response, and a token is taken out locally before each request is sent so
+    concurrent callers can't overshoot between responses
+    '''
+
+    def __init__(self, short_limit=100, long_limit=1000, max_retries=3):
+        # Defaults are strava's limits for new apps, they are replaced with the real limits after the first response
+        self.lock = threading.Lock()
+        self.max_retries = max_retries
+        self.windows = {
+            'short': {'limit': short_limit, 'usage': 0, 'reset': self.next_reset('short', time.time())},
+            'long': {'limit': long_limit, 'usage': 0, 'reset': self.next_reset('long', time.time())},
+        }
+
+    @staticmethod
+    def next_reset(window, now):
+        period = 900 if window == 'short' else 86400
+        return (now // period + 1) * period
+
+    def roll_windows(self, now):
+        for name, window in self.windows.items():
+            if now >= window['reset']:
+                window['usage'] = 0
+                window['reset'] = self.next_reset(name, now)
+
+    def acquire(self):
+        # Block until both windows have a token left. Waiting out the daily window would outlast the hourly refresh,
+        # so raise instead and let the next refresh pick up the remaining work
+        while True:
+            with self.lock:
+                now = time.time()
+                self.roll_windows(now)
+                if self.windows['long']['usage'] >= self.windows['long']['limit']:
+                    raise StravaRateLimitExceeded('Strava daily rate limit reached, resets at {} UTC'.format(
+                        datetime.utcfromtimestamp(self.windows['long']['reset'])))
+                if self.windows['short']['usage'] < self.windows['short']['limit']:
+                    self.windows['short']['usage'] += 1
+                    self.windows['long']['usage'] += 1
+                    return
+                wait = self.windows['short']['reset'] - now
+            app.server.logger.info('Strava 15 minute rate limit reached, waiting {:.0f} seconds'.format(wait))
+            time.sleep(wait)
+
+    def update(self, headers, status_code=None):
+        limits, usages = headers.get('X-RateLimit-Limit'), headers.get('X-RateLimit-Usage')
+        with self.lock:
+            self.roll_windows(time.time())
+            if limits and usages:
+                for name, limit, usage in zip(['short', 'long'], limits.split(','), usages.split(',')):
+                    self.windows[name]['limit'] = int(limit)
+                    # Local usage also counts requests still in flight, so only ever move it up
+                    self.windows[name]['usage'] = max(self.windows[name]['usage'], int(usage))
+            if status_code == 429:
+                # Strava says we are over even if our count disagrees, back off until the window resets
+                self.windows['short']['usage'] = self.windows['short']['limit']
+
+    def remaining(self):
+        with self.lock:
+            self.roll_windows(time.time())
+            return {name: max(window['limit'] - window['usage'], 0) for name, window in self.windows.items()}
+
+    def status(self):
+        remaining = self.remaining()
+        return '15 min: {}/{} remaining, daily: {}/{} remaining'.format(
+            remaining['short'], self.windows['short']['limit'], remaining['long'], self.windows['long']['limit'])
+
+
+strava_scheduler = StravaRequestScheduler()
+
+
+class RateLimitedSession(requests.Session):
+    '''
+    requests session handed to stravalib so every strava call (including ones made internally by stravalib)
+    goes through strava_scheduler, and 429s are retried once the window allows it
+    '''
+
+    def request(self, method, url, *args, **kwargs):
+        for attempt in range(strava_scheduler.max_retries + 1):
+            strava_scheduler.acquire()
+            response = super().request(method, url, *args, **kwargs)
+            strava_scheduler.update(response.headers, response.status_code)
+            if response.status_code != 429:
+                break
+            app.server.logger.warning('Strava rate limit exceeded (429), retrying after backoff')
+        return response
+
+
 # Retrieve current tokens from db
 def current_token_dict():
     try:
@@ -35,28 +129,72 @@ def save_strava_token(token_dict):
     app.session.add(apiTokens(date_utc=datetime.utcnow(), service='Strava', tokens=str(token_dict)))
     app.session.commit()
     app.session.remove()
+    # Make the next get_strava_client() call pick up the new tokens
+    strava_client_cache.invalidate()
+
+
+class StravaClientCache:
+    '''
+    One strava client per process, shared by every call site. Tokens are only read from the db when there is no
+    client yet or the access token is within refresh_margin seconds of expires_at, in which case it is refreshed
+    under the lock so concurrent callers don't all refresh at once. Every client shares one RateLimitedSession
+    (and its connection pool)
+    '''
+
+    def __init__(self, refresh_margin=300):
+        self.lock = threading.RLock()
+        self.refresh_margin = refresh_margin
+        self.session = RateLimitedSession()
+        self.client = None
+        self.expires_at = 0
+        self.token_reads = 0
+        self.token_refreshes = 0
+
+    def get(self):
+        with self.lock:
+            if self.client is None or time.time() > self.expires_at - self.refresh_margin:
+                self.load()
+            return self.client
+
+    def load(self):
+        # Always re-read, another gunicorn worker may have already refreshed the tokens
+        token_dict = current_token_dict()
+        self.token_reads += 1
+        client = Client(requests_session=self.session)
+        if token_dict:
+            client.access_token = token_dict['access_token']
+            client.refresh_token = token_dict['refresh_token']
+            # If token is old (or about to be), refresh it
+            if time.time() > token_dict['expires_at'] - self.refresh_margin:
+                app.server.logger.debug('Strava tokens expired, refreshing...')
+                token_dict = client.refresh_access_token(client_id=client_id, client_secret=client_secret,
+                                                         refresh_token=client.refresh_token)
+                self.token_refreshes += 1
+                # Save to db
+                save_strava_token(token_dict)
+                # Update client
+                client.access_token = token_dict['access_token']
+                client.refresh_token = token_dict['refresh_token']
+            self.expires_at = token_dict['expires_at']
+        else:
+            # Not connected yet, check the db again on the next call
+            self.expires_at = 0
+        self.client = client
+
+    def invalidate(self):
+        with self.lock:
+            self.client = None
+            self.expires_at = 0
+
+    def stats(self):
+        return {'token_reads': self.token_reads, 'token_refreshes': self.token_refreshes}
+
+
+strava_client_cache = StravaClientCache()
 
 
 def get_strava_client():
-    token_dict = current_token_dict()
-    if token_dict:
-        client = Client()
-        client.access_token = token_dict['access_token']
-        client.refresh_token = token_dict['refresh_token']
-        # If token is old, refresh it
-        if time.time() > token_dict['expires_at']:
-            app.server.logger.debug('Strava tokens expired, refreshing...')
-            refresh_response = client.refresh_access_token(client_id=client_id, client_secret=client_secret,
-                                                           refresh_token=client.refresh_token)
-            # Save to db
-            save_strava_token(refresh_response)
-            # Update client
-            client.access_token = refresh_response['access_token']
-            client.refresh_token = refresh_response['refresh_token']
-    else:
-        client = Client()
-
-    return client
+    return strava_client_cache.get()
 
 
 # Refreshes tokens with refresh token if available in db
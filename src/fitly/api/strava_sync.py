@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from sqlalchemy import select, delete
+
+from .database import engine
+from .sqlalchemy_declarative import stravaSummary, stravaSync
+from ..utils import config
+
+# Days between passes that list the whole history, catching activities uploaded with a start older than the cursor
+full_sync_days = float(config.get('strava', 'full_sync_days', fallback=7))
+# Incremental passes list from this far before the cursor, for late uploads of activities recorded around the same time
+sync_overlap_hours = float(config.get('strava', 'sync_overlap_hours', fallback=24))
+
+
+def activities_after_date():
+    return pd.to_datetime(config.get('strava', 'activities_after_date'), utc=True).to_pydatetime()
+
+
+def list_new_activities(client, athlete_id=1):
+    '''
+    List strava activities not yet in strava_summary. Only activities starting after the sync cursor (minus the
+    overlap) are listed, unless there is no cursor yet or the last full pass is more than full_sync_days old
+    :param client: Strava client
+    :param athlete_id: Athlete being refreshed
+    :return: Tuple of (new activities oldest first, whether this was a full pass, start of the newest listed activity)
+    '''
+    with engine.connect() as connection:
+        state = connection.execute(select(stravaSync).where(stravaSync.athlete_id == athlete_id)).first()
+
+        after = activities_after_date()
+        full = state is None or state.cursor_utc is None or state.last_full_sync_utc is None or \
+               datetime.utcnow() - state.last_full_sync_utc >= timedelta(days=full_sync_days)
+        if not full:
+            after = max(after, state.cursor_utc.replace(tzinfo=timezone.utc) - timedelta(hours=sync_overlap_hours))
+
+        # Only ids that can show up in the listing are needed for the membership check
+        known = set(connection.execute(select(stravaSummary.activity_id).where(
+            stravaSummary.athlete_id == athlete_id,
+            stravaSummary.start_date_utc >= after.replace(tzinfo=None))).scalars())
+
+    activities = list(client.get_activities(after=after, limit=0))  # Use after to sort from oldest to newest
+    newest = max((act.start_date for act in activities), default=None)
+    return [act for act in activities if act.id not in known], full, newest
+
+
+def save_sync_cursor(connection, newest, full, athlete_id=1):
+    '''
+    Move the cursor up to the newest listed activity, once every listed activity is stored
+    :param connection: Connection to write on
+    :param newest: Start of the newest listed activity (None if nothing was listed)
+    :param full: Whether the listing was a full pass
+    :param athlete_id: Athlete being refreshed
+    '''
+    state = connection.execute(select(stravaSync).where(stravaSync.athlete_id == athlete_id)).first()
+    cursor = state.cursor_utc if state is not None else None
+    if newest is not None:
+        newest = pd.to_datetime(newest, utc=True).tz_localize(None).to_pydatetime()
+        cursor = newest if cursor is None else max(cursor, newest)
+    last_full_sync = datetime.utcnow() if full else state.last_full_sync_utc
+
+    connection.execute(delete(stravaSync).where(stravaSync.athlete_id == athlete_id))
+    connection.execute(stravaSync.__table__.insert().values(athlete_id=athlete_id, cursor_utc=cursor,
+                                                           last_full_sync_utc=last_full_sync))
+
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+# Unit conversions applied to the resampled streams
+stream_scales = {'distance': 3.28084,  # meters to feet
+                 'altitude': 3.28084,  # meters to feet
+                 'velocity_smooth': 2.23694,  # meters per second to mph
+                 'temp': 9 / 5}  # celsius to fahrenheit, before the + 32 offset
+stream_offsets = {'temp': 32}
+
+
+def stream_array(values, length):
+    '''
+    Float array of a stream, cut or padded with nan to the length of the time stream
+    :return: Array, or None if the stream holds no numbers (such streams are dropped)
+    '''
+    try:
+        array = np.asarray(values, dtype='float64')
+    except (TypeError, ValueError):
+        return None
+    if array.ndim != 1 or not np.isfinite(array).any():
+        return None
+    if len(array) < length:
+        array = np.concatenate((array, np.full(length - len(array), np.nan)))
+    return array[:length]
+
+
+def latlng_arrays(values, length):
+    '''
+    Split the latlng stream into latitude and longitude arrays, anything that is not a [lat, lng] pair becomes nan
+    '''
+    try:
+        pairs = np.asarray(values, dtype='float64').reshape(-1, 2)
+    except (TypeError, ValueError):
+        pairs = np.array([x if isinstance(x, list) and len(x) == 2 else (np.nan, np.nan) for x in values],
+                         dtype='float64').reshape(-1, 2)
+    return stream_array(pairs[:, 0], length), stream_array(pairs[:, 1], length)
+
+
+def resample_stream(array, positions, length, ordered):
+    '''
+    Place samples on the 1 second grid, averaging samples that land on the same second and linearly interpolating
+    gaps (edges take the nearest sample)
+    :param array: Samples of the stream
+    :param positions: Second of the grid each sample lands on
+    :param length: Number of seconds in the grid
+    :param ordered: Whether positions are strictly increasing, so each second has at most one sample
+    :return: Array of length seconds
+    '''
+    valid = ~np.isnan(array)
+    if ordered:
+        grid = np.full(length, np.nan)
+        grid[positions] = array
+    else:
+        counts = np.bincount(positions, weights=valid, minlength=length)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grid = np.bincount(positions, weights=np.where(valid, array, 0), minlength=length) / counts
+
+    missing = np.isnan(grid)
+    if missing.any() and not missing.all():
+        known = np.flatnonzero(~missing)
+        grid[missing] = np.interp(np.flatnonzero(missing), known, grid[known])
+    return grid
+
+
+def normalize_streams(data, start_date_local, start_date_utc):
+    '''
+    Build the samples frame of an activity from its strava streams with numpy arrays instead of row wise pandas:
+    streams are resampled to 1 second, interpolated and converted to imperial units
+    :param data: Dict of stream type to its list of samples, must include 'time' (seconds since the start)
+    :param start_date_local: Local start of the activity
+    :param start_date_utc: Utc start of the activity (naive)
+    :return: DataFrame indexed on timestamp_local with the resampled streams, latitude, longitude, timestamp_utc,
+    time_interval and date, or None if the time stream holds no numbers
+    '''
+    time = stream_array(data.get('time', []), len(data.get('time', [])))
+    if time is None:
+        # Without times the other streams can't be placed on the grid
+        return None
+    length = len(time)
+    # Samples without a time can't be placed on the grid, drop them from every stream
+    timed = ~np.isnan(time)
+    offsets = np.trunc(time[timed]).astype('int64')
+    # The grid starts on the first sample, not on the start of the activity
+    first = offsets.min()
+    positions = offsets - first
+    seconds = int(positions.max()) + 1
+    ordered = bool((np.diff(positions) > 0).all())
+
+    columns = {}
+    for item, values in data.items():
+        if item == 'latlng':
+            continue
+        array = stream_array(values, length)
+        if array is not None and not np.isnan(array[timed]).all():
+            columns[item] = resample_stream(array[timed], positions, seconds, ordered)
+
+    latitude, longitude = latlng_arrays(data.get('latlng', []), length)
+    columns['latitude'] = np.full(seconds, np.nan) if latitude is None else resample_stream(latitude[timed],
+                                                                                            positions, seconds,
+                                                                                            ordered)
+    columns['longitude'] = np.full(seconds, np.nan) if longitude is None else resample_stream(longitude[timed],
+                                                                                              positions, seconds,
+                                                                                              ordered)
+
+    for item, scale in stream_scales.items():
+        if item in columns:
+            columns[item] *= scale
+    for item, offset in stream_offsets.items():
+        if item in columns:
+            columns[item] += offset
+
+    index = pd.DatetimeIndex(np.datetime64(start_date_local, 'ns') + np.arange(first, first + seconds).astype(
+        'timedelta64[s]'), name='timestamp_local')
+    elapsed = np.trunc(columns['time']).astype('int64').astype('timedelta64[s]')
+    columns['timestamp_utc'] = np.datetime64(start_date_utc, 'ns') + elapsed
+    if 'altitude' not in columns:
+        # Indoor activity samples wont have altitudes
+        columns['altitude'] = None
+    columns['time_interval'] = np.datetime64('1970-01-01', 'ns') + elapsed
+    columns['date'] = index.date
+
+    # Stream types come in the order they were passed in, ahead of the derived columns
+    order = [item for item in data if item in columns and item != 'latlng']
+    order += [item for item in columns if item not in order]
+    return pd.DataFrame(columns, index=index, columns=order)
@@ -0,0 +1,104 @@
+import pandas as pd
+from sqlalchemy import func, select, delete, and_
+
+from ..app import app
+from .database import engine, bulk_write, bulk_insert
+from .sqlalchemy_declarative import stravaSummary, dailyTrainingLoad
+from .performance_model import fitness, fatigue, form
+from .cache import cached_on_refresh
+
+sum_columns = ['elapsed_time', 'distance', 'tss', 'hrss', 'trimp', 'low_intensity_seconds', 'mod_intensity_seconds',
+               'high_intensity_seconds']
+load_columns = ['athlete_id', 'date', 'type', 'activities'] + sum_columns + ['stress_score', 'ctl', 'atl', 'tsb']
+
+
+def daily_summary_query(athlete_id, from_date=None):
+    '''
+    strava_summary totals per day and sport
+    :param athlete_id: Athlete to aggregate
+    :param from_date: First day to aggregate (all days if None)
+    :return: Select statement
+    '''
+    query = select(
+        stravaSummary.athlete_id, stravaSummary.start_day_local.label('date'), stravaSummary.type,
+        func.count(stravaSummary.activity_id).label('activities'),
+        *[func.sum(stravaSummary.__table__.c[column]).label(column) for column in sum_columns],
+        # If tss not available, use hrss
+        func.sum(func.coalesce(stravaSummary.tss, stravaSummary.hrss, 0)).label('stress_score')).where(
+        stravaSummary.athlete_id == athlete_id, stravaSummary.type.isnot(None))
+    if from_date is not None:
+        query = query.where(stravaSummary.start_day_local >= from_date)
+    return query.group_by(stravaSummary.athlete_id, stravaSummary.start_day_local, stravaSummary.type)
+
+
+def update_daily_training_load(from_date, connection, athlete_id=1):
+    '''
+    Recompute daily_training_load from the day of the earliest changed activity forward. Each sport's fitness and
+    fatigue carry on from its last row before from_date, so earlier days are left alone
+    :param from_date: Day of the earliest changed activity (None rebuilds every day)
+    :param connection: Connection of the transaction the activities are being written on
+    :param athlete_id: Athlete to update
+    '''
+    filters = [dailyTrainingLoad.athlete_id == athlete_id]
+    if from_date is not None:
+        filters.append(dailyTrainingLoad.date >= from_date)
+    connection.execute(delete(dailyTrainingLoad).where(*filters))
+
+    df = pd.read_sql(sql=daily_summary_query(athlete_id, from_date), con=connection)
+    if len(df) == 0:
+        return
+    df['date'] = pd.to_datetime(df['date'])
+
+    seeds = pd.DataFrame(columns=['type', 'date', 'ctl', 'atl'])
+    if from_date is not None:
+        latest = select(dailyTrainingLoad.type, func.max(dailyTrainingLoad.date).label('date')).where(
+            dailyTrainingLoad.athlete_id == athlete_id, dailyTrainingLoad.date < from_date).group_by(
+            dailyTrainingLoad.type).subquery()
+        seeds = pd.read_sql(
+            sql=select(dailyTrainingLoad.type, dailyTrainingLoad.date, dailyTrainingLoad.ctl,
+                       dailyTrainingLoad.atl).join(latest, and_(dailyTrainingLoad.type == latest.c.type,
+                                                                dailyTrainingLoad.date == latest.c.date)).where(
+                dailyTrainingLoad.athlete_id == athlete_id), con=connection)
+    seeds = seeds.set_index('type')
+
+    frames = []
+    for sport, days in df.groupby('type'):
+        days = days.set_index('date')
+        start, initial_ctl, initial_atl = days.index.min(), 0, 0
+        if sport in seeds.index:
+            seed = seeds.loc[sport]
+            start = pd.to_datetime(seed['date']) + pd.Timedelta(days=1)
+            initial_ctl, initial_atl = seed['ctl'], seed['atl']
+        # Days without a workout still decay the load
+        stress = days['stress_score'].reindex(pd.date_range(start, days.index.max(), freq='D'), fill_value=0)
+        ctl = fitness(stress, initial=initial_ctl)
+        atl = fatigue(stress, initial=initial_atl)
+        days['ctl'] = ctl
+        days['atl'] = atl
+        days['tsb'] = form(ctl, atl, initial_ctl, initial_atl)
+        frames.append(days.reset_index())
+
+    df = pd.concat(frames)
+    df['date'] = df['date'].dt.date
+    bulk_insert(df[load_columns], 'daily_training_load', connection, index=False)
+
+
+def rebuild_daily_training_load():
+    '''
+    Recompute daily_training_load from strava_summary, needed whenever strava_summary is truncated
+    '''
+    with bulk_write() as connection:
+        update_daily_training_load(None, connection)
+
+
+@cached_on_refresh
+def daily_training_load(athlete_id=1):
+    '''
+    daily_training_load rows, indexed on date
+    '''
+    df = pd.read_sql(
+        sql=app.session.query(dailyTrainingLoad).filter(dailyTrainingLoad.athlete_id == athlete_id).statement,
+        con=engine, index_col='date')
+    app.session.remove()
+    df.index = pd.to_datetime(df.index)
+    return df.sort_index()
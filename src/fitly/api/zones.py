@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def zone_thresholds(base, multipliers, offset=0):
+    '''
+    Build the upper bound (inclusive) of each zone from an athlete's zone table
+    :param base: Value the zone multipliers are applied to (ftp for power, heartrate reserve for heartrate)
+    :param multipliers: Ordered zone multipliers from the athlete table
+    :param offset: Constant added to each bound (resting heartrate for heartrate zones)
+    :return: List of rounded zone upper bounds
+    '''
+    return [round((base * multiplier) + offset) for multiplier in multipliers]
+
+
+def classify_zones(values, thresholds):
+    '''
+    Assign a 1-based zone to every value in one pass, where zone n covers (thresholds[n-2], thresholds[n-1]].
+    Values above the last threshold (or missing) fall into zone len(thresholds) + 1, same as the original if/elif ladder
+    :param values: Array-like of samples (watts, heartrate, etc.)
+    :param thresholds: Zone upper bounds as returned by zone_thresholds()
+    :return: Float array of zone numbers
+    '''
+    # Running max keeps "first threshold the value is under" semantics even if the zone table is not ascending
+    thresholds = np.maximum.accumulate(np.asarray(thresholds, dtype='float64'))
+    values = np.asarray(values, dtype='float64')
+    # NaN sorts after every threshold, so missing samples land in the top zone like the ladder's final else
+    return np.searchsorted(thresholds, values, side='left').astype('float64') + 1
+
+
+# Intensity bucket of each zone, keyed on (sport family, metric). A family of None applies to every sport.
+# Zones missing from a mapping have no intensity
+zone_intensities = {
+    ('run', 'power'): {1: 'low', 2: 'low', 3: 'med', 4: 'high', 5: 'high'},
+    ('ride', 'power'): {1: 'low', 2: 'low', 3: 'low', 4: 'med', 5: 'high', 6: 'high', 7: 'high'},
+    (None, 'heartrate'): {1: 'low', 2: 'low', 3: 'med', 4: 'high', 5: 'high'},
+}
+
+
+def sport_family(activity_type):
+    '''
+    Collapse a strava activity type into the family used to pick zone tables ('run', 'ride' or None)
+    '''
+    activity_type = str(activity_type).lower()
+    if 'run' in activity_type or 'walk' in activity_type:
+        return 'run'
+    elif 'ride' in activity_type:
+        return 'ride'
+    return None
+
+
+def zone_intensity_seconds(zones, family, metric):
+    '''
+    Count seconds spent at each intensity with one vectorized lookup
+    :param zones: Series of zone numbers (1 Hz, so each row is a second)
+    :param family: Sport family as returned by sport_family()
+    :param metric: 'power' or 'heartrate'
+    :return: Series of seconds indexed by 'low', 'med', 'high' (missing intensities are omitted), or None if
+    there is no intensity mapping for the sport family / metric
+    '''
+    mapping = zone_intensities.get((family, metric), zone_intensities.get((None, metric)))
+    if mapping is None:
+        return None
+    return zones.map(mapping).value_counts()
@@ -27,6 +27,26 @@ app.server.logger.addHandler(handler)
 # Suppress WSGI info logs
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
+# Log db queries per callback
+if config.get('logger', 'callback_query_stats', fallback='False').lower() == 'true':
+    from .api.query_stats import track_callback_queries
+
+    track_callback_queries(server)
+
+# Profile every dash callback, wrapping app.callback before the pages register theirs
+if config.get('logger', 'callback_profiler', fallback='False').lower() == 'true':
+    from .api.query_stats import profile_callbacks
+
+    profile_callbacks(app)
+
+
+def hourly_refresh():
+    # Imported on the first run, so startup doesn't load the ingest dependencies (sweat, stravalib, ...)
+    from .api.datapull import refresh_database
+
+    refresh_database()
+
+
 # Push an application context so we can use Flask's 'current_app'
 with server.app_context():
     # load the rest of our Dash app
@@ -35,10 +55,8 @@ with server.app_context():
     # Enable refresh cron
     if config.get('cron', 'hourly_pull').lower() == 'true':
         try:
-            from .api.datapull import refresh_database
-
             scheduler = BackgroundScheduler()
-            scheduler.add_job(func=refresh_database, trigger="cron", hour='*')
+            scheduler.add_job(func=hourly_refresh, trigger="cron", hour='*')
 
             # Add spotify job on 20 min schedule since API only allows grabbing the last 50 songs
             if spotify_credentials_supplied:
@@ -0,0 +1,237 @@
+"""Before/after timings of the activity import hot paths on synthetic data, run through the fitly-bench-* scripts.
+
+Each benchmark keeps a copy of the code it replaced so both versions run on the same frame in the same interpreter.
+"""
+
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from .api.database import engine, bulk_write, bulk_insert
+from .api.streams import normalize_streams
+from .api.zones import zone_thresholds, classify_zones
+
+
+def timed(func, *args, **kwargs):
+    """Return func's result and the seconds it took."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def synthetic_ride(hours, seed=0):
+    """1 Hz ride samples with a few dropouts, indexed like df_samples."""
+    rng = np.random.default_rng(seed)
+    seconds = int(hours * 3600)
+    df = pd.DataFrame({'time': np.arange(seconds),
+                       'watts': rng.normal(200, 80, seconds).clip(0).round(),
+                       'heartrate': rng.normal(140, 20, seconds).clip(60).round()},
+                      index=pd.date_range('2021-01-01 07:00', periods=seconds, freq='s'))
+    df.loc[df.sample(frac=0.01, random_state=seed).index, ['watts', 'heartrate']] = np.nan
+    return df
+
+
+def ladder_power_zones(df_samples, ftp, power_zones):
+    """FitlyActivity.calculate_power_zones before classify_zones, one sample at a time."""
+    df_samples['power_zone'] = np.nan
+    for i in df_samples.index:
+        watts = df_samples.loc[i].watts
+        if watts is not None:
+            if watts <= round(ftp * power_zones[1]):
+                df_samples.at[i, 'power_zone'] = 1
+            elif watts <= round(ftp * power_zones[2]):
+                df_samples.at[i, 'power_zone'] = 2
+            elif watts <= round(ftp * power_zones[3]):
+                df_samples.at[i, 'power_zone'] = 3
+            elif watts <= round(ftp * power_zones[4]):
+                df_samples.at[i, 'power_zone'] = 4
+            elif watts <= round(ftp * power_zones[5]):
+                df_samples.at[i, 'power_zone'] = 5
+            elif watts <= round(ftp * power_zones[6]):
+                df_samples.at[i, 'power_zone'] = 6
+            else:
+                df_samples.at[i, 'power_zone'] = 7
+    return df_samples['power_zone']
+
+
+def bench_zones(hours=6, ftp=250):
+    """Time the per-sample power zone ladder against classify_zones on one synthetic ride.
+
+    :return: Dict of rows, seconds for each version and whether their zones match
+    """
+    power_zones = {1: 0.55, 2: 0.75, 3: 0.90, 4: 1.05, 5: 1.20, 6: 1.50}
+    df = synthetic_ride(hours)
+    old, old_seconds = timed(ladder_power_zones, df.copy(), ftp, power_zones)
+    thresholds = zone_thresholds(ftp, [power_zones[zone] for zone in range(1, 7)])
+    new, new_seconds = timed(classify_zones, df['watts'], thresholds)
+    return {'rows': len(df), 'before': old_seconds, 'after': new_seconds,
+            'identical': np.array_equal(old.to_numpy(), new)}
+
+
+def synthetic_samples(rows, seed=0):
+    """Frame shaped like an activity's df_samples as write_dfs_to_db appended it to strava_samples."""
+    df = synthetic_ride(rows / 3600, seed)
+    rng = np.random.default_rng(seed)
+    df.index.name = 'timestamp_local'
+    df['timestamp_utc'] = df.index + pd.Timedelta(hours=5)
+    df['time_interval'] = df['timestamp_utc'].dt.floor('10s')
+    df['date'] = df.index.date
+    df['activity_id'] = 1
+    df['athlete_id'] = 1
+    df['type'] = 'Ride'
+    df['act_name'] = 'Benchmark Ride'
+    for column in ['distance', 'velocity_smooth', 'temp', 'altitude', 'latitude', 'longitude', 'grade_smooth']:
+        df[column] = rng.normal(100, 10, len(df))
+    df['cadence'] = rng.integers(60, 100, len(df)).astype('float64')
+    df['moving'] = 1
+    df['ftp'] = 250.0
+    df['power_zone'] = classify_zones(df['watts'], zone_thresholds(250, [0.55, 0.75, 0.90, 1.05, 1.20, 1.50]))
+    df.loc[df.sample(frac=0.05, random_state=seed).index, ['temp', 'cadence']] = np.nan
+    return df
+
+
+def to_sql_append(df, table):
+    """write_dfs_to_db before bulk_insert: pandas' default inserts on an engine.begin() transaction."""
+    with engine.begin() as connection:
+        df.to_sql(table, connection, if_exists='append', index=True)
+
+
+def bulk_append(df, table):
+    with bulk_write() as connection:
+        bulk_insert(df, table, connection)
+
+
+def bench_bulk_insert(rows=10000, repeat=3):
+    """Insert rows/s of the old to_sql append against bulk_write() / bulk_insert() into the configured database.
+
+    Each version writes into its own scratch table, which is dropped again afterwards.
+    :return: Dict of rows, best rows/s for each version and whether the stored rows read back the same
+    """
+    df = synthetic_samples(rows)
+    results = {'rows': len(df)}
+    stored = {}
+    try:
+        for version, insert in [('before', to_sql_append), ('after', bulk_append)]:
+            table = 'benchmark_samples_{}'.format(version)
+            # Create the table up front, so only the inserts are timed
+            df.head(0).to_sql(table, engine, if_exists='replace', index=True)
+            seconds = []
+            for _ in range(repeat):
+                with engine.begin() as connection:
+                    connection.execute(text('DELETE FROM {}'.format(table)))
+                seconds.append(timed(insert, df, table)[1])
+            results[version] = len(df) / min(seconds)
+            stored[version] = pd.read_sql(text('SELECT * FROM {}'.format(table)), engine)
+    finally:
+        with engine.begin() as connection:
+            for version in ['before', 'after']:
+                connection.execute(text('DROP TABLE IF EXISTS benchmark_samples_{}'.format(version)))
+    results['identical'] = stored['before'].equals(stored['after'])
+    return results
+
+
+def synthetic_streams(hours, seed=0):
+    """Strava streams api data of an outdoor ride, as plain lists with a few paused stretches in the time stream."""
+    rng = np.random.default_rng(seed)
+    time = np.arange(int(hours * 3600))
+    # Pauses: drop a few 30 second stretches so the streams need resampling
+    for start in rng.integers(0, len(time), max(int(hours * 4), 1)):
+        time = time[(time < start) | (time >= start + 30)]
+    samples = len(time)
+    return {'time': time.tolist(),
+            'latlng': np.column_stack((40 + rng.random(samples) / 100, -75 + rng.random(samples) / 100)).tolist(),
+            'distance': np.cumsum(rng.random(samples) * 8).tolist(),
+            'altitude': rng.normal(100, 10, samples).tolist(),
+            'velocity_smooth': rng.normal(8, 1, samples).tolist(),
+            'heartrate': rng.integers(100, 170, samples).tolist(),
+            'cadence': rng.integers(60, 100, samples).tolist(),
+            'watts': rng.integers(0, 400, samples).tolist(),
+            'temp': rng.integers(15, 25, samples).tolist(),
+            'moving': [True] * samples,
+            'grade_smooth': rng.normal(0, 2, samples).tolist()}
+
+
+def calctime(time_sec, startdate):
+    try:
+        timestamp = startdate + timedelta(seconds=int(time_sec))
+    except BaseException as e:
+        timestamp = startdate
+    return timestamp
+
+
+def pandas_df_samples(data, start_date_local, start_date_utc):
+    """FitlyActivity.build_df_samples before normalize_streams, on the same stream data."""
+    seconds = 1
+    types = list(data.keys())
+    df_samples = pd.DataFrame(columns=types)
+    for item in types:
+        df_samples[item] = pd.Series(data[item], index=None)
+    df_samples['start_date_local'] = start_date_local
+    df_samples['timestamp_local'] = pd.Series(map(calctime, df_samples['time'], df_samples['start_date_local']))
+    df_samples.set_index('timestamp_local', inplace=True)
+
+    try:
+        df_samples['latitude'] = df_samples['latlng'].apply(lambda x: x[0] if isinstance(x, list) else None).apply(
+            pd.to_numeric, errors='coerce')
+        df_samples['longitude'] = df_samples['latlng'].apply(lambda x: x[1] if isinstance(x, list) else None).apply(
+            pd.to_numeric, errors='coerce')
+    except KeyError:
+        df_samples['latitude'] = None
+        df_samples['longitude'] = None
+
+    # pandas < 2 silently left the latlng lists out of the mean, drop them up front so this still runs on pandas 2+
+    df_samples = df_samples.drop(columns=['latlng']).resample(str(seconds) + 's').mean()
+    df_samples = df_samples.interpolate(limit_direction='both')
+
+    df_samples.reset_index(inplace=True)
+    df_samples['start_date_utc'] = start_date_utc
+    df_samples['timestamp_utc'] = pd.Series(map(calctime, df_samples['time'], df_samples['start_date_utc']))
+    df_samples.drop(columns=['start_date_utc'], inplace=True)
+    df_samples.set_index('timestamp_local', inplace=True)
+
+    try:
+        df_samples['altitude'] = df_samples['altitude'] * 3.28084
+    except KeyError:
+        df_samples['altitude'] = None
+    df_samples['temp'] = (df_samples['temp'] * (9 / 5)) + 32
+    df_samples['velocity_smooth'] = df_samples['velocity_smooth'] * 2.23694
+    df_samples['distance'] = df_samples['distance'] * 3.28084
+
+    epoch = pd.to_datetime('1970-01-01')
+    df_samples['time_interval'] = df_samples['time'].astype('int').apply(lambda x: epoch + timedelta(seconds=x))
+    df_samples['date'] = df_samples.index.date
+    return df_samples
+
+
+def traced(func, *args):
+    """Return func's result, the seconds it took and its tracemalloc peak in bytes."""
+    tracemalloc.start()
+    try:
+        result, seconds = timed(func, *args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def bench_streams(hours=4):
+    """Time and memory of the old pandas build_df_samples steps against normalize_streams on one synthetic ride.
+
+    :return: Dict of samples, (seconds, peak bytes) for each version and whether the frames match
+    """
+    data = synthetic_streams(hours)
+    start_date_local = datetime(2021, 1, 1, 7)
+    start_date_utc = start_date_local + timedelta(hours=5)
+    results = {'samples': len(data['time'])}
+    old, *results['before'] = traced(pandas_df_samples, data, start_date_local, start_date_utc)
+    new, *results['after'] = traced(normalize_streams, data, start_date_local, start_date_utc)
+    try:
+        pd.testing.assert_frame_equal(new, old[new.columns], check_dtype=False, check_freq=False, check_names=False)
+        results['identical'] = True
+    except AssertionError:
+        results['identical'] = False
+    return results
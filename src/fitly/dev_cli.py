@@ -1,8 +1,19 @@
-"""Click command line script for running the development webserver."""
+"""Click command line scripts for running the development webserver and maintenance tasks."""
+
+import os
+import subprocess
+import sys
+from collections import Counter
 
 import click
 
 from .app import app
+from .api.power_curves import rebuild_power_curve_bests
+from .api.training_load import rebuild_daily_training_load
+from .api.samples import compact_strava_samples, archive_samples
+from .api.samples_archive import archive_enabled
+from .api.database import engine
+from . import benchmarks
 
 
 @click.command()
@@ -31,3 +42,104 @@ from .app import app
 )
 def main(port, host, debug):
     app.run_server(port=port, debug=debug, host=host)
+
+
+@click.command()
+def rebuild_power_curves():
+    """Recompute the power_curve_bests table from strava_best_samples (i.e. after a truncate)."""
+    rebuild_power_curve_bests()
+
+
+@click.command()
+def rebuild_training_load():
+    """Recompute the daily_training_load table from strava_summary (i.e. after a truncate)."""
+    rebuild_daily_training_load()
+
+
+@click.command()
+def compact_samples():
+    """Move strava_samples into strava_samples_compact, drop it and report the space saved (VACUUMs sqlite dbs).
+
+    Samples are stored as float32 / smallint and rows without an activity are discarded, back up the db first.
+    """
+    sizes = compact_strava_samples()
+    if sizes is None:
+        click.echo("strava_samples has already been moved to strava_samples_compact")
+    else:
+        click.echo("strava_samples: {} bytes, strava_samples_compact: {} bytes".format(*sizes))
+    if engine.dialect.name == "sqlite":
+        path = engine.url.database
+        before = os.path.getsize(path)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("VACUUM")
+            # In WAL mode the file only shrinks once the vacuumed pages are checkpointed
+            connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        click.echo("{}: {:.1f} MB -> {:.1f} MB".format(path, before / 1024 ** 2, os.path.getsize(path) / 1024 ** 2))
+
+
+@click.command()
+def archive_activity_samples():
+    """Write Arrow files for activities that are not in the samples archive yet (needs [strava] samples_archive)."""
+    if not archive_enabled:
+        raise click.ClickException("The samples archive is off, set [strava] samples_archive and install pyarrow")
+    click.echo("Archived {} activities".format(archive_samples()))
+
+
+@click.command()
+@click.option("--top", default=15, type=int, help="Number of packages to list. Defaults to 15.")
+def import_time(top):
+    """Time loading the app in a fresh interpreter (python -X importtime) and list the slowest packages to import."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import fitly.app"], capture_output=True,
+                            text=True)
+    seconds = Counter()
+    total = None
+    # Lines look like 'import time:  self [us] | cumulative | imported package', nested imports are indented
+    for line in result.stderr.splitlines():
+        fields = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        module = fields[2].strip()
+        seconds[module.split(".")[0]] += int(fields[0]) / 1e6
+        if module == "fitly.app":
+            total = int(fields[1]) / 1e6
+    if result.returncode != 0 or total is None:
+        click.echo(result.stderr[-2000:])
+        raise click.ClickException("Could not import fitly.app")
+    click.echo("import fitly.app: {:.2f} s".format(total))
+    for package, package_seconds in seconds.most_common(top):
+        click.echo("{:>8.3f} s  {}".format(package_seconds, package))
+
+
+@click.command()
+@click.option("--hours", default=6.0, type=float, help="Length of the synthetic 1 Hz ride. Defaults to 6.")
+def bench_zones(hours):
+    """Time the old per-sample power zone ladder against classify_zones on a synthetic ride."""
+    result = benchmarks.bench_zones(hours=hours)
+    click.echo("{} samples".format(result["rows"]))
+    click.echo("if/elif ladder:  {:.4f} s".format(result["before"]))
+    click.echo("classify_zones:  {:.4f} s".format(result["after"]))
+    click.echo("zones identical: {}".format(result["identical"]))
+
+
+@click.command()
+@click.option("--rows", default=10000, type=int, help="Samples in the synthetic activity. Defaults to 10000.")
+@click.option("--repeat", default=3, type=int, help="Inserts per version, the fastest is reported. Defaults to 3.")
+def bench_bulk_insert(rows, repeat):
+    """Compare rows/s of the old to_sql append and bulk_insert() on the configured database (uses scratch tables)."""
+    result = benchmarks.bench_bulk_insert(rows=rows, repeat=repeat)
+    click.echo("{} samples into {}".format(result["rows"], engine.url.render_as_string(hide_password=True)))
+    click.echo("to_sql append: {:>9,.0f} rows/s".format(result["before"]))
+    click.echo("bulk_insert:   {:>9,.0f} rows/s".format(result["after"]))
+    click.echo("rows identical: {}".format(result["identical"]))
+
+
+@click.command()
+@click.option("--hours", default=4.0, type=float, help="Length of the synthetic ride. Defaults to 4.")
+def bench_streams(hours):
+    """Time and memory peak of the old pandas build_df_samples steps against normalize_streams on a synthetic ride."""
+    result = benchmarks.bench_streams(hours=hours)
+    click.echo("{} stream samples".format(result["samples"]))
+    for label, version in [("pandas steps:     ", "before"), ("normalize_streams:", "after")]:
+        seconds, peak = result[version]
+        click.echo("{} {:.3f} s  {:.1f} MB peak".format(label, seconds, peak / 1024 ** 2))
+    click.echo("frames identical: {}".format(result["identical"]))
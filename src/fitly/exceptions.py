@@ -4,3 +4,7 @@ class FitlyBaseException(Exception):
 
 class InvalidLayoutError(FitlyBaseException):
     pass
+
+
+class StravaRateLimitExceeded(FitlyBaseException):
+    pass
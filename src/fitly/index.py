@@ -1,27 +1,80 @@
+import importlib
+import os
+import threading
+
 import dash_html_components as html
 
 from .app import app
-from .utils import DashRouter, DashNavBar
-from .pages import home, lifting, performance, power, music, settings
+from .utils import DashRouter, DashNavBar, config
 from .components import fa
 from dash.dependencies import Input, Output, State
-from .api.sqlalchemy_declarative import dbRefreshStatus, athlete
+from .api.sqlalchemy_declarative import dbRefreshStatus
+
+# off: import the pages (and their analytics dependencies) at startup. request: import them on the first request the
+# process serves. background: like request, but start importing them in a warmup thread as soon as the app loads
+lazy_pages = config.get('dashboard', 'lazy_pages', fallback='off').lower()
+page_modules = ['home', 'lifting', 'performance', 'power', 'music', 'settings']
+pages_loaded = False
+pages_lock = threading.Lock()
+
+
+def load_pages():
+    '''
+    Import the page modules, registering their callbacks. Only the first call imports, any other caller waits for it
+    '''
+    global pages_loaded
+    with pages_lock:
+        if not pages_loaded:
+            # Pages read the flask config when they register their callbacks
+            with app.server.app_context():
+                for page in page_modules:
+                    importlib.import_module('.pages.' + page, __package__)
+            pages_loaded = True
+
+
+def page_layout(page):
+    '''
+    get_layout of a page module, imported when first routed to
+    '''
+
+    def get_layout(**kwargs):
+        load_pages()
+        return importlib.import_module('.pages.' + page, __package__).get_layout(**kwargs)
+
+    get_layout.__module__ = '{}.pages.{}'.format(__package__, page)
+    return get_layout
+
+
+if lazy_pages in ['request', 'background']:
+    def load_pages_before_request():
+        # Callbacks have to be registered before the browser fetches the app's layout and callback dependencies
+        if not pages_loaded:
+            load_pages()
+
+
+    # Ahead of dash's own before_request hooks
+    app.server.before_request_funcs.setdefault(None, []).insert(0, load_pages_before_request)
 
-athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
-use_power = True if athlete_info.use_run_power or athlete_info.use_cycle_power else False
-app.session.remove()
+    if lazy_pages == 'background':
+        warmup = threading.Thread(target=load_pages, name='fitly-page-warmup', daemon=True)
+        warmup.start()
+        # Let the warmup finish before gunicorn (preload_app) forks its workers, a fork mid import would leave the
+        # workers with half imported modules
+        os.register_at_fork(before=warmup.join)
+else:
+    load_pages()
 
 # Ordered iterable of routes: tuples of (route, layout), where 'route' is a
 # string corresponding to path of the route (will be prefixed with Dash's
 # 'routes_pathname_prefix' and 'layout' is a Dash Component.
 urls = (
-    ("", home.get_layout),
-    ("home", home.get_layout),
-    ("performance", performance.get_layout),
-    ("power", power.get_layout),
-    ("lifting", lifting.get_layout),
-    ("music", music.get_layout),
-    ("settings", settings.get_layout),
+    ("", page_layout('home')),
+    ("home", page_layout('home')),
+    ("performance", page_layout('performance')),
+    ("power", page_layout('power')),
+    ("lifting", page_layout('lifting')),
+    ("music", page_layout('music')),
+    ("settings", page_layout('settings')),
 
 )
 
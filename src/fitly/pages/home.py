@@ -12,9 +12,11 @@ import dash_bootstrap_components as dbc
 from sqlalchemy import func
 from datetime import datetime, timedelta
 from ..api.sqlalchemy_declarative import ouraReadinessSummary, ouraActivitySummary, \
-    ouraActivitySamples, ouraSleepSamples, ouraSleepSummary, stravaSummary, athlete, withings
+    ouraActivitySamples, ouraSleepSamples, ouraSleepSummary, stravaSummary, withings
 from ..api.ouraAPI import top_n_correlations
 from ..api.database import engine
+from ..api.athlete_settings import athlete_settings
+from ..api.cache import cached_on_refresh
 from ..utils import calc_next_saturday, calc_prev_sunday, utc_to_local, config, oura_credentials_supplied, \
     withings_credentials_supplied
 
@@ -598,9 +600,8 @@ def calculate_streak(date, series, weekly_goal, sum_metric=None):
     return current_streak, best_streak
 
 
-def generate_content_kpi_trend(df_name, metric):
-    rolling_days = 42
-
+@cached_on_refresh
+def kpi_trend_df(df_name):
     if df_name == 'sleep':
         df = pd.read_sql(sql=app.session.query(ouraSleepSummary).statement, con=engine).set_index('report_date')
     elif df_name == 'readiness':
@@ -616,6 +617,13 @@ def generate_content_kpi_trend(df_name, metric):
     app.session.remove()
 
     df.index = pd.DatetimeIndex(df.index)
+    return df
+
+
+def generate_content_kpi_trend(df_name, metric):
+    rolling_days = 42
+
+    df = kpi_trend_df(df_name)
     metricAvg = df[metric].rolling(window=rolling_days).mean()
 
     # Set Graph Titles
@@ -806,7 +814,7 @@ def update_kpis(date, days=7):
     df_summary = pd.read_sql(
         sql=app.session.query(stravaSummary).filter(stravaSummary.start_date_utc <= date).statement, con=engine,
         index_col='start_date_local')
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_power = True if athlete_info.use_run_power or athlete_info.use_cycle_power else False
 
     ### Oura Donuts ###
@@ -849,8 +857,8 @@ def update_kpis(date, days=7):
             index_col='start_day_local')
 
         if use_power:
-            tss_df['stress_score'] = tss_df.apply(lambda row: row['hrss'] if np.isnan(row['tss']) else row['tss'],
-                                                  axis=1).fillna(0)
+            # If tss not available, use hrss
+            tss_df['stress_score'] = tss_df['tss'].fillna(tss_df['hrss']).fillna(0)
         else:
             tss_df['stress_score'] = tss_df['trimp']
 
@@ -1060,7 +1068,7 @@ def generate_oura_sleep_header_chart(date, days=7, summary=False, resample='D'):
         df = pd.read_sql(sql=app.session.query(ouraSleepSummary).filter(ouraSleepSummary.report_date > date).statement,
                          con=engine, index_col='report_date')[:days]
 
-    daily_sleep_hr_target = app.session.query(athlete).filter(athlete.athlete_id == 1).first().daily_sleep_hr_target
+    daily_sleep_hr_target = athlete_settings().daily_sleep_hr_target
 
     app.session.remove()
 
@@ -11,9 +11,14 @@ import plotly.graph_objs as go
 from dash.dependencies import Input, Output, State
 from sqlalchemy import or_, delete, extract
 from ..app import app
-from ..api.sqlalchemy_declarative import athlete, stravaSummary, stravaSamples, workoutStepLog, ouraSleepSummary, \
+from ..api.sqlalchemy_declarative import athlete, stravaSummary, workoutStepLog, ouraSleepSummary, \
     strydSummary, ouraReadinessSummary, annotations
 from ..api.database import engine
+from ..api.performance_model import fitness, fatigue, form, ramp_rate
+from ..api.training_load import daily_training_load
+from ..api.samples import load_samples
+from ..api.athlete_settings import athlete_settings, invalidate_athlete_settings
+from ..api.cache import cached_on_refresh
 from ..utils import utc_to_local, config, oura_credentials_supplied, stryd_credentials_supplied, \
     peloton_credentials_supplied
 from ..pages.power import power_curve, zone_chart
@@ -43,7 +48,7 @@ oura_low_threshold = 70
 
 
 def get_layout(**kwargs):
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     pmc_switch_settings = json.loads(athlete_info.pmc_switch_settings)
     use_run_power = True if athlete_info.use_run_power else False
     use_cycle_power = True if athlete_info.use_cycle_power else False
@@ -650,63 +655,91 @@ def get_layout(**kwargs):
 #         return 'No Relevant Trends'
 
 
-def zscore(x, y, window):
+def rolling_stats(df, windows):
+    '''
+    Rolling means and standard deviations (ddof=1) of every column for several windows from a single cumulative sum
+    pass, instead of a rolling() call per column, window and statistic. Like rolling(window), a value needs window
+    days without missing values
+    :param df: Daily metrics, one column each
+    :param windows: Window lengths in days
+    :return: Dict of window to a tuple of (mean DataFrame, std DataFrame)
+    '''
+    values = df.to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    # Center each column on its mean so the sums of squares don't lose precision
+    offset = np.nanmean(values, axis=0) if valid.any() else np.zeros(values.shape[1])
+    centered = np.where(valid, values - offset, 0)
+    zeros = np.zeros((1, values.shape[1]))
+    sums = np.concatenate((zeros, np.cumsum(centered, axis=0)))
+    squares = np.concatenate((zeros, np.cumsum(centered ** 2, axis=0)))
+    counts = np.concatenate((zeros, np.cumsum(valid, axis=0)))
+
+    stats = {}
+    for window in windows:
+        mean = np.full(values.shape, np.nan)
+        std = np.full(values.shape, np.nan)
+        if len(values) >= window:
+            total = sums[window:] - sums[:-window]
+            full = (counts[window:] - counts[:-window]) == window
+            variance = np.maximum(squares[window:] - squares[:-window] - total ** 2 / window, 0) / (window - 1)
+            mean[window - 1:] = np.where(full, total / window + offset, np.nan)
+            std[window - 1:] = np.where(full, np.sqrt(variance), np.nan)
+        stats[window] = (pd.DataFrame(mean, index=df.index, columns=df.columns),
+                         pd.DataFrame(std, index=df.index, columns=df.columns))
+    return stats
+
+
+def zscore(x, mean, std, window):
     '''
 
     :param x: metric to compare to mean & std
-    :param y: metric to do the rolling calculation on
-    :param window: number of days to rollback
+    :param mean: rolling mean of the metric the window is computed on
+    :param std: rolling standard deviation (ddof=1) of the metric the window is computed on
+    :param window: number of days in the rolling window
     :return:
     '''
-    r = y.rolling(window=window)
-    m = r.mean()  # .shift(1)
-    s = r.std(ddof=0)  # .shift(1)
-    z = (x - m) / s
-    return z
+    # Population standard deviation of the window
+    return (x - mean) / (std * np.sqrt((window - 1) / window))
+
+
+def between(values, lower, upper):
+    return (lower < values) & (values < upper)
 
 
 def daily_z_recommendation(hrv_z_score, hr_z_score):
     # https://www.myithlete.com/how-to-use-the-ithlete-pro-training-guide/
-    x, y = hrv_z_score, hr_z_score
+    x, y = np.asarray(hrv_z_score, dtype='float64'), np.asarray(hr_z_score, dtype='float64')
 
-    if (x < -1 and y > 1.75) or (x < -1 and y < -2):
-        return 'Rest'
-    elif (x < -1 and -2 < y < 1.75) or (x > -1 and y > 1.75) or (x > -1 and y < -2):
-        return 'Low'
-    elif (-1 < x < 1 and -2 < y < 1.75) or (x > 1 and -2 < y < -1) or (x > 1 and 1 < y < 1.75):
-        return 'Mod'
-    elif (x > 1 and -1 < y < 1):
-        return 'High'
+    return np.select([
+        ((x < -1) & (y > 1.75)) | ((x < -1) & (y < -2)),
+        ((x < -1) & between(y, -2, 1.75)) | ((x > -1) & (y > 1.75)) | ((x > -1) & (y < -2)),
+        (between(x, -1, 1) & between(y, -2, 1.75)) | ((x > 1) & between(y, -2, -1)) | ((x > 1) & between(y, 1, 1.75)),
+        (x > 1) & between(y, -1, 1)],
+        ['Rest', 'Low', 'Mod', 'High'], default=None)
 
 
 def daily_z_desc(hrv_z_score, hr_z_score):
     # https://www.myithlete.com/how-to-use-the-ithlete-pro-training-guide/
-    x, y = hrv_z_score, hr_z_score
-
-    if x < -1 and y > 1.75:
-        return 'Stress / Illness'
-    elif x < -1 and -2 < y < 1.75:
-        return 'Impaired Recovery'
-    elif -1 < x < 1 and -2 < y < 1.75:
-        return 'Normal Training'
-    elif x > 1 and -1 < y < 1:
-        return 'Intensive Training'
-    elif x > 0 and y < -2:
-        return 'Low Energy / Activation'
-    else:
-        return 'No Trend Detected'
+    x, y = np.asarray(hrv_z_score, dtype='float64'), np.asarray(hr_z_score, dtype='float64')
+
+    return np.select([
+        (x < -1) & (y > 1.75),
+        (x < -1) & between(y, -2, 1.75),
+        between(x, -1, 1) & between(y, -2, 1.75),
+        (x > 1) & between(y, -1, 1),
+        (x > 0) & (y < -2)],
+        ['Stress / Illness', 'Impaired Recovery', 'Normal Training', 'Intensive Training', 'Low Energy / Activation'],
+        default='No Trend Detected')
 
 
 def z_adaptation(hrv7_z_score, hr7_z_score):
-    x, y = hrv7_z_score, hr7_z_score
-    if -1 < x < 0 and 0 < y < 1.75:
-        return 'Competition Ready'
-    elif 0 < x < 1.5 and -2 < y < 0:
-        return 'Coping Well'
-    elif -2.25 < x < -1 and 0 < y < 1.75:
-        return 'Not Coping Well'
-    else:
-        return 'No Trend Detected'
+    x, y = np.asarray(hrv7_z_score, dtype='float64'), np.asarray(hr7_z_score, dtype='float64')
+
+    return np.select([
+        between(x, -1, 0) & between(y, 0, 1.75),
+        between(x, 0, 1.5) & between(y, -2, 0),
+        between(x, -2.25, -1) & between(y, 0, 1.75)],
+        ['Competition Ready', 'Coping Well', 'Not Coping Well'], default='No Trend Detected')
 
 
 def z_color(z_trend):
@@ -849,6 +882,7 @@ def z_recommendation_chart(hrv_z_score, hr_z_score, hrv7_z_score, hr7_z_score, h
     ])
 
 
+@cached_on_refresh
 def get_hrv_df():
     hrv_df = pd.read_sql(
         sql=app.session.query(ouraSleepSummary.report_date, ouraSleepSummary.summary_date, ouraSleepSummary.rmssd,
@@ -860,6 +894,7 @@ def get_hrv_df():
         sql=app.session.query(ouraReadinessSummary.report_date, ouraReadinessSummary.score).statement,
         con=engine, index_col='report_date'), how='left', left_index=True, right_index=True)
 
+    # Per workout trimp, the daily resample below averages the workouts of a day
     trimp_df = pd.read_sql(sql=app.session.query(stravaSummary.start_day_local, stravaSummary.trimp).statement,
                            con=engine, index_col='start_day_local').sort_index(ascending=True)
     app.session.remove()
@@ -876,22 +911,26 @@ def get_hrv_df():
     hrv_df.set_index(pd.to_datetime(hrv_df.index), inplace=True)
     hrv_df = hrv_df.resample('D').mean()
 
+    # 7/30/60 day means and stdevs in one pass
+    stats = rolling_stats(hrv_df[['rmssd', 'ln_rmssd', 'hr_average']], [7, 30, 60])
+    (mean_7, _), (mean_30, std_30), (mean_60, std_60) = stats[7], stats[30], stats[60]
+
     # HRV baseline
-    hrv_df['rmssd_7'] = hrv_df['rmssd'].rolling(7).mean()
+    hrv_df['rmssd_7'] = mean_7['rmssd']
     # Daily HRV change for KPI
     hrv_df['rmssd_yesterday'] = hrv_df['rmssd'].shift(1)
     # HR baseline
     hrv_df['hr_average_yesterday'] = hrv_df['hr_average'].shift(1)
-    hrv_df['hr_average_7'] = hrv_df['hr_average'].rolling(7).mean()
+    hrv_df['hr_average_7'] = mean_7['hr_average']
 
     # Natural Log calculations
-    hrv_df['ln_rmssd_7'] = hrv_df['ln_rmssd'].rolling(7).mean()
+    hrv_df['ln_rmssd_7'] = mean_7['ln_rmssd']
 
     # 30/60 day Stdev and means
-    hrv_df['ln_rmssd_30'] = hrv_df['ln_rmssd'].rolling(30).mean()
-    hrv_df['ln_rmssd_60'] = hrv_df['ln_rmssd'].rolling(60).mean()
-    hrv_df['ln_rmssd_30_stdev'] = hrv_df['ln_rmssd'].rolling(30).std()
-    hrv_df['ln_rmssd_60_stdev'] = hrv_df['ln_rmssd'].rolling(60).std()
+    hrv_df['ln_rmssd_30'] = mean_30['ln_rmssd']
+    hrv_df['ln_rmssd_60'] = mean_60['ln_rmssd']
+    hrv_df['ln_rmssd_30_stdev'] = std_30['ln_rmssd']
+    hrv_df['ln_rmssd_60_stdev'] = std_60['ln_rmssd']
 
     # Normal value (SWC) thresholds for 7 day hrv baseline trends to analyze physiological changes
     hrv_df['swc_baseline_upper'] = hrv_df['ln_rmssd_60'] + hrv_df['ln_rmssd_60_stdev']
@@ -914,17 +953,19 @@ def get_hrv_df():
     # Z Score Method
 
     # TODO: Update these z scores so be normalized by CV
-    hrv_df['hrv_z_score'] = zscore(x=hrv_df['ln_rmssd'], y=hrv_df['ln_rmssd'], window=30)
-    hrv_df['hr_z_score'] = zscore(x=hrv_df['hr_average'], y=hrv_df['hr_average'], window=30)
-    hrv_df["z_recommendation"] = hrv_df[["hrv_z_score", "hr_z_score"]].apply(lambda x: daily_z_recommendation(*x),
-                                                                             axis=1)
-    hrv_df["z_desc"] = hrv_df[["hrv_z_score", "hr_z_score"]].apply(lambda x: daily_z_desc(*x), axis=1)
+    hrv_df['hrv_z_score'] = zscore(x=hrv_df['ln_rmssd'], mean=mean_30['ln_rmssd'], std=std_30['ln_rmssd'], window=30)
+    hrv_df['hr_z_score'] = zscore(x=hrv_df['hr_average'], mean=mean_30['hr_average'], std=std_30['hr_average'],
+                                  window=30)
+    hrv_df["z_recommendation"] = daily_z_recommendation(hrv_df["hrv_z_score"], hrv_df["hr_z_score"])
+    hrv_df["z_desc"] = daily_z_desc(hrv_df["hrv_z_score"], hrv_df["hr_z_score"])
 
     # ithlete uses daily hr and hrv normalized by CV, use 7 day averages over 30 days instead?
-    hrv_df['hrv7_z_score'] = zscore(x=hrv_df['ln_rmssd_7'], y=hrv_df['ln_rmssd'], window=60)
-    hrv_df['hr7_z_score'] = zscore(x=hrv_df['hr_average_7'], y=hrv_df['hr_average'], window=60)
+    hrv_df['hrv7_z_score'] = zscore(x=hrv_df['ln_rmssd_7'], mean=mean_60['ln_rmssd'], std=std_60['ln_rmssd'],
+                                    window=60)
+    hrv_df['hr7_z_score'] = zscore(x=hrv_df['hr_average_7'], mean=mean_60['hr_average'], std=std_60['hr_average'],
+                                   window=60)
     # Detect training adaptations based on 7day z scores
-    hrv_df["detected_trend"] = hrv_df[["hrv7_z_score", "hr7_z_score"]].apply(lambda x: z_adaptation(*x), axis=1)
+    hrv_df["detected_trend"] = z_adaptation(hrv_df["hrv7_z_score"], hrv_df["hr7_z_score"])
 
     # Threshold Flags
     # hrv_df['under_low_threshold'] = hrv_df['ln_rmssd_7'] < hrv_df['swc_baseline_lower']
@@ -947,7 +988,7 @@ def get_hrv_df():
 
 
 def get_trend_controls(selected=None, sport='Run'):
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_run_power = True if athlete_info.use_run_power else False
     use_cycle_power = True if athlete_info.use_cycle_power else False
     use_power = True if use_run_power or use_cycle_power else False
@@ -1007,8 +1048,8 @@ def get_trend_chart(metric, sport='Run', days=90, intensity='all'):
     date = datetime.now().date() - timedelta(days=days)
     df = pd.read_sql(
         sql=app.session.query(stravaSummary).filter(
-            stravaSummary.type.like(sport), stravaSummary.elapsed_time > app.session.query(athlete).filter(
-                athlete.athlete_id == 1).first().min_non_warmup_workout_time).statement, con=engine)
+            stravaSummary.type.like(sport),
+            stravaSummary.elapsed_time > athlete_settings().min_non_warmup_workout_time).statement, con=engine)
     if intensity != 'all':
         df = df[df['workout_intensity'] == intensity]
 
@@ -1213,7 +1254,7 @@ def recommendation_color(recommendaion_desc):
 
 def create_daily_recommendations(plan_rec):
     if plan_rec:
-        recovery_metric = app.session.query(athlete).filter(athlete.athlete_id == 1).first().recovery_metric
+        recovery_metric = athlete_settings().recovery_metric
         if recovery_metric == 'hrv':
             recovery_metric_label = 'HRV'
             recovery_metric_tooltip = 'Workflow steps based on daily rmssd changes within 60 day mean +/- 1.5 stdev'
@@ -1813,18 +1854,20 @@ def create_yoy_chart(metric, sport='all'):
 
     # weekly_tss_goal = app.session.query(athlete).filter(athlete.athlete_id == 1).first().weekly_tss_goal
 
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_power = True if athlete_info.use_run_power or athlete_info.use_cycle_power else False
 
+    # Only the metric is needed, this is filtered on warmup length so daily_training_load can't be used
+    columns = [stravaSummary.start_date_utc, getattr(stravaSummary, metric)]
     if sport != 'all':
         df = pd.read_sql(
-            sql=app.session.query(stravaSummary).filter(
+            sql=app.session.query(*columns).filter(
                 stravaSummary.elapsed_time > athlete_info.min_non_warmup_workout_time,
                 stravaSummary.type.like(sport),
             ).statement, con=engine, index_col='start_date_utc').sort_index(ascending=True)
     else:
         df = pd.read_sql(
-            sql=app.session.query(stravaSummary).filter(
+            sql=app.session.query(*columns).filter(
                 stravaSummary.elapsed_time > athlete_info.min_non_warmup_workout_time,
                 # or_(
                 #     extract('year', stravaSummary.start_date_utc) == datetime.utcnow().year,
@@ -1972,10 +2015,12 @@ def get_workout_types(df_summary, run_status, ride_status, all_status):
 
 
 def create_fitness_chart(run_status, ride_status, all_status, power_status, hr_status, atl_status):
-    df_summary = pd.read_sql(sql=app.session.query(stravaSummary).statement, con=engine,
-                             index_col='start_date_local').sort_index(ascending=True)
+    # Only ftp changes are needed per workout, stress comes pre-aggregated from daily_training_load
+    df_summary = pd.read_sql(
+        sql=app.session.query(stravaSummary.start_date_local, stravaSummary.type, stravaSummary.ftp).statement,
+        con=engine, index_col='start_date_local').sort_index(ascending=True)
 
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     rr_max_threshold = athlete_info.rr_max_goal
     rr_min_threshold = athlete_info.rr_min_goal
 
@@ -2007,6 +2052,8 @@ def create_fitness_chart(run_status, ride_status, all_status, power_status, hr_s
 
     app.session.remove()
 
+    df_daily = daily_training_load()
+
     chart_annotations = [go.layout.Annotation(
         x=pd.to_datetime(x),
         y=0,
@@ -2058,66 +2105,48 @@ def create_fitness_chart(run_status, ride_status, all_status, power_status, hr_s
 
     # Create df of ftp tests to plot
     forecast_days = 13
-    atl_days = 7
-    initial_atl = 0
-    atl_exp = np.exp(-1 / atl_days)
-    ctl_days = 42
-    initial_ctl = 0
-    ctl_exp = np.exp(-1 / ctl_days)
-
-    # Insert dummy row with current date+forecast_days to ensure resample gets all dates
-    df_summary.loc[utc_to_local(datetime.utcnow()) + timedelta(days=forecast_days)] = None
+    # Current date+forecast_days so the daily frames get all dates
+    forecast_end = pd.to_datetime((utc_to_local(datetime.utcnow()) + timedelta(days=forecast_days)).date())
 
     if power_status and hr_status:
-        # If tss not available, use hrss
-        df_summary['stress_score'] = df_summary.apply(lambda row: row['hrss'] if np.isnan(row['tss']) else row['tss'],
-                                                      axis=1).fillna(0)
+        # tss, falling back to hrss per workout when not available
+        df_daily['stress_score'] = df_daily['stress_score'].fillna(0)
     elif power_status:
-        df_summary['stress_score'] = df_summary['tss']
+        df_daily['stress_score'] = df_daily['tss']
     elif hr_status:
-        df_summary['stress_score'] = df_summary['hrss']
+        df_daily['stress_score'] = df_daily['hrss']
     else:
-        df_summary['stress_score'] = 0
+        df_daily['stress_score'] = 0
 
     # Calculate Metrics
     # Fitness and Form will change based off booleans that are selected
     # ATL should always be based off of ALL sports so toggle defaults to true
     # However if user wants to just see ATL for toggled sports they can disable toggle
-    workout_types = get_workout_types(df_summary, run_status, ride_status, all_status)
-
-    # Sample to daily level and sum stress scores to aggregate multiple workouts per day
-    if not atl_status:
-        atl_df = df_summary
-        atl_df.at[~atl_df['type'].isin(workout_types), 'stress_score'] = 0
-        atl_df.at[~atl_df['type'].isin(workout_types), 'tss'] = 0
-        atl_df.at[~atl_df['type'].isin(workout_types), 'hrss'] = 0
-        atl_df = atl_df[['stress_score', 'tss', 'hrss']].resample('D').sum()
-    else:
-        atl_df = df_summary[['stress_score', 'tss', 'hrss']].resample('D').sum()
+    workout_types = get_workout_types(df_daily, run_status, ride_status, all_status)
 
-    atl_df['ATL'] = np.nan
-    atl_df['ATL'].iloc[0] = (atl_df['stress_score'].iloc[0] * (1 - atl_exp)) + (initial_atl * atl_exp)
-    for i in range(1, len(atl_df)):
-        atl_df['ATL'].iloc[i] = (atl_df['stress_score'].iloc[i] * (1 - atl_exp)) + (atl_df['ATL'].iloc[i - 1] * atl_exp)
+    # Sum sports to the daily level, ATL covers every day since the first workout of any sport
+    atl_df = df_daily if atl_status else df_daily[df_daily['type'].isin(workout_types)]
+    atl_df = atl_df[['stress_score', 'tss', 'hrss']].groupby(level=0).sum()
+    # Before the first workout (fresh install) only the forecast end is charted
+    atl_df = atl_df.reindex(pd.date_range(df_daily.index.min() if len(df_daily) > 0 else forecast_end, forecast_end,
+                                          freq='D'), fill_value=0)
+
+    atl_df['ATL'] = fatigue(atl_df['stress_score'])
     atl_df['atl_tooltip'] = ['Fatigue: <b>{:.1f} ({}{:.1f})</b>'.format(x, '+' if x - y > 0 else '', x - y) for (x, y)
                              in zip(atl_df['ATL'], atl_df['ATL'].shift(1))]
 
     atl_df = atl_df.drop(columns=['stress_score', 'tss', 'hrss'])
 
-    # Sample to daily level and sum stress scores to aggregate multiple workouts per day
-
-    pmd = df_summary[df_summary['type'].isin(workout_types)]
+    # Sum selected sports to the daily level, starting at the first selected workout
+    pmd = df_daily[df_daily['type'].isin(workout_types)]
+    pmd = pmd[['stress_score', 'tss', 'hrss', 'low_intensity_seconds', 'mod_intensity_seconds',
+               'high_intensity_seconds']].groupby(level=0).sum()
+    pmd['tss_flag'] = df_summary.loc[df_summary['type'].isin(workout_types), 'tss_flag'].resample('D').sum()
     # Make sure df goes to same max date as ATL df
-    pmd.at[atl_df.index.max(), 'name'] = None
+    pmd = pmd.reindex(pd.date_range(pmd.index.min() if len(pmd) > 0 else atl_df.index.max(), atl_df.index.max(),
+                                    freq='D')).fillna(0)
 
-    pmd = pmd[
-        ['stress_score', 'tss', 'hrss', 'low_intensity_seconds', 'mod_intensity_seconds', 'high_intensity_seconds',
-         'tss_flag']].resample('D').sum()
-
-    pmd['CTL'] = np.nan
-    pmd['CTL'].iloc[0] = (pmd['stress_score'].iloc[0] * (1 - ctl_exp)) + (initial_ctl * ctl_exp)
-    for i in range(1, len(pmd)):
-        pmd['CTL'].iloc[i] = (pmd['stress_score'].iloc[i] * (1 - ctl_exp)) + (pmd['CTL'].iloc[i - 1] * ctl_exp)
+    pmd['CTL'] = fitness(pmd['stress_score'])
 
     # Merge pmd into ATL df
     pmd = pmd.merge(atl_df, how='right', right_index=True, left_index=True)
@@ -2128,8 +2157,8 @@ def create_fitness_chart(run_status, ride_status, all_status, power_status, hr_s
     pmd['l90d_percent_high_intensity'] = pmd['l90d_high_intensity'] / (
             pmd['l90d_high_intensity'] + pmd['l90d_low_intensity'])
 
-    pmd['TSB'] = pmd['CTL'].shift(1) - pmd['ATL'].shift(1)
-    pmd['Ramp_Rate'] = pmd['CTL'] - pmd['CTL'].shift(7)
+    pmd['TSB'] = form(pmd['CTL'], pmd['ATL'])
+    pmd['Ramp_Rate'] = ramp_rate(pmd['CTL'])
 
     # Tooltips
     pmd['ctl_tooltip'] = ['Fitness: <b>{:.1f} ({}{:.1f})</b>'.format(x, '+' if x - y > 0 else '', x - y) for (x, y)
@@ -2758,8 +2787,7 @@ def create_fitness_chart(run_status, ride_status, all_status, power_status, hr_s
 
 
 def workout_distribution(sport='Run', days=90, intensity='all'):
-    min_non_warmup_workout_time = app.session.query(athlete).filter(
-        athlete.athlete_id == 1).first().min_non_warmup_workout_time
+    min_non_warmup_workout_time = athlete_settings().min_non_warmup_workout_time
 
     df_summary = pd.read_sql(
         sql=app.session.query(stravaSummary).filter(
@@ -2774,8 +2802,7 @@ def workout_distribution(sport='Run', days=90, intensity='all'):
     if intensity != 'all':
         df_summary = df_summary[df_summary['workout_intensity'] == intensity]
 
-    athlete_bookmarks = json.loads(app.session.query(athlete.peloton_auto_bookmark_ids).filter(
-        athlete.athlete_id == 1).first().peloton_auto_bookmark_ids)
+    athlete_bookmarks = json.loads(athlete_settings().peloton_auto_bookmark_ids)
 
     app.session.remove()
 
@@ -2851,7 +2878,7 @@ def workout_distribution(sport='Run', days=90, intensity='all'):
 
 
 def workout_summary_kpi(df_samples):
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_power = True if athlete_info.use_run_power or athlete_info.use_cycle_power else False
     app.session.remove()
     height = '25%' if use_power else '33%'
@@ -2892,7 +2919,7 @@ def workout_details(df_samples, start_seconds=None, end_seconds=None):
     :param df_samples filtered on 1 activity
     :return: metric trend charts
     '''
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_power = True if athlete_info.use_run_power or athlete_info.use_cycle_power else False
     app.session.remove()
 
@@ -3252,10 +3279,12 @@ def refresh_fitness_chart(ride_switch, run_switch, all_switch, power_switch, hr_
     pmc_switch_settings = {'ride_status': ride_status, 'run_status': run_status, 'all_status': all_status,
                            'power_status': power_status, 'hr_status': hr_status, 'atl_status': atl_status}
     ### Save Switch settings in DB ###
-    app.session.query(athlete).filter(athlete.athlete_id == 1).update(
-        {athlete.pmc_switch_settings: json.dumps(pmc_switch_settings)})
-    app.session.commit()
-    app.session.remove()
+    if athlete_settings().pmc_switch_settings != json.dumps(pmc_switch_settings):
+        app.session.query(athlete).filter(athlete.athlete_id == 1).update(
+            {athlete.pmc_switch_settings: json.dumps(pmc_switch_settings)})
+        app.session.commit()
+        app.session.remove()
+        invalidate_athlete_settings()
 
     pmc_figure, hoverData = create_fitness_chart(ride_status=ride_status, run_status=run_status,
                                                  all_status=all_status, power_status=power_status, hr_status=hr_status,
@@ -3310,7 +3339,7 @@ def refresh_fitness_chart(ride_switch, run_switch, all_switch, power_switch, hr_
      ]
 )
 def update_trend_chart(*args):
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_run_power = True if athlete_info.use_run_power else False
     use_cycle_power = True if athlete_info.use_cycle_power else False
     use_power = True if use_run_power or use_cycle_power else False
@@ -3371,7 +3400,7 @@ def update_trend_chart(*args):
      Input('performance-intensity-selector-low', 'n_clicks_timestamp')]
 )
 def update_icon(*args):
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_power = True if athlete_info.use_run_power or athlete_info.use_cycle_power else False
     app.session.remove()
 
@@ -3560,12 +3589,7 @@ def modal_workout_trends(activity, is_open):
     if activity and is_open:
         activity_id = activity.split('|')[0]
 
-        df_samples = pd.read_sql(
-            sql=app.session.query(stravaSamples).filter(stravaSamples.activity_id == activity_id).statement,
-            con=engine,
-            index_col=['timestamp_local'])
-
-        app.session.remove()
+        df_samples = load_samples(activity_id=activity_id)
         return workout_summary_kpi(df_samples), workout_details(df_samples), calculate_splits(df_samples)
     else:
         return None, None, None
@@ -6,15 +6,17 @@ import plotly.graph_objs as go
 import dash_daq as daq
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
-from ..api.sqlalchemy_declarative import stravaSummary, stravaSamples, stravaBestSamples, athlete, withings
+from ..api.sqlalchemy_declarative import stravaSummary, stravaBestSamples, withings
+from ..api.samples import load_samples
 from ..api.database import engine
+from ..api.athlete_settings import athlete_settings
 from ..app import app
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from ..utils import config, stryd_credentials_supplied
-from sqlalchemy import func, or_
-import math
+from sqlalchemy import func
 from ..api.strydAPI import get_training_distribution
+from ..api.power_curves import PowerCurveSamples, interval_bests
 
 # pre_style = {"backgroundColor": "#ddd", "fontSize": 20, "padding": "10px", "margin": "10px"}
 hidden_style = {"display": "none"}
@@ -84,32 +86,21 @@ def create_power_curve_kpis(interval, all, L90D, l6w, last, pr):
 
 
 def get_workout_title(activity_id=None):
-    min_non_warmup_workout_time = app.session.query(athlete).filter(
-        athlete.athlete_id == 1).first().min_non_warmup_workout_time
+    min_non_warmup_workout_time = athlete_settings().min_non_warmup_workout_time
     activity_id = app.session.query(stravaSummary.activity_id).filter(stravaSummary.type.ilike('%ride%'),
                                                                       stravaSummary.elapsed_time > min_non_warmup_workout_time).order_by(
         stravaSummary.start_date_utc.desc()).first()[0] if not activity_id else activity_id
-    df_samples = pd.read_sql(
-        sql=app.session.query(stravaSamples).filter(stravaSamples.activity_id == activity_id).statement,
-        con=engine,
-        index_col=['timestamp_local'])
-
     app.session.remove()
+    df_samples = load_samples(activity_id=activity_id, columns=[])
 
     return [html.H6(datetime.strftime(df_samples['date'][0], "%A %b %d, %Y"), style={'height': '50%'}),
             html.H6(df_samples['act_name'][0], style={'height': '50%'})]
 
 
 def power_profiles(interval, activity_type='ride', power_unit='mmp', group='M'):
-    activity_type = '%' + activity_type + '%'
-
-    # Filter on interval passed
-    df_best_samples = pd.read_sql(
-        sql=app.session.query(stravaBestSamples).filter(stravaBestSamples.type.ilike(activity_type),
-                                                        stravaBestSamples.interval == interval).statement, con=engine,
-        index_col=['timestamp_local'])
+    # Best rows of the interval, months and years of watts are already reduced to one row each
+    df_best_samples = interval_bests(interval, activity_type=activity_type, period=group, power_unit=power_unit)
 
-    app.session.remove()
     if len(df_best_samples) < 1:
         return {}
 
@@ -346,36 +337,20 @@ def power_curve(activity_type='ride', power_unit='mmp', last_id=None, height=400
                 intensity='all'):
     # TODO: Add power curve model once sweatpy has been finished
     # https://sweatpy.gssns.io/features/Power%20duration%20modelling/#comparison-of-power-duration-models
-    activity_type = '%' + activity_type + '%'
-
-    max_interval = app.session.query(
-        func.max(stravaBestSamples.interval).label('interval')).filter(
-        stravaBestSamples.type.ilike(activity_type)).first()[0]
-
-    act_dict = pd.read_sql(
-        sql=app.session.query(stravaBestSamples.activity_id, stravaBestSamples.act_name).distinct().statement,
-        con=engine,
-        index_col='activity_id').to_dict()
+    # Every window is fetched with one combined statement
+    windows = [(None, 'all'), (90, 'all'), (42, 'all'), (30, 'all')]
+    if time_comparison:
+        windows += [(time_comparison, intensity), (None, intensity)]
+    curves = PowerCurveSamples(activity_type=activity_type, windows=windows, last_id=last_id)
 
     # Data points for Power Curve Training Disribution
-    # Join in weight at the time of workout for calculating FTP_W/kg at point in time (of workout)
-    TD_df_L90D = pd.read_sql(
-        sql=app.session.query(
-            func.max(stravaBestSamples.mmp).label('mmp'), stravaBestSamples.activity_id, stravaBestSamples.ftp,
-            stravaBestSamples.interval, stravaBestSamples.time_interval,
-            stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-            stravaSummary.weight
-        ).join(stravaSummary, stravaBestSamples.activity_id == stravaSummary.activity_id, isouter=True).group_by(
-            stravaBestSamples.interval).filter(stravaBestSamples.type.ilike(activity_type),
-                                               stravaBestSamples.timestamp_local >= (
-                                                       datetime.now() - timedelta(days=90))
-                                               ).statement, con=engine, index_col='interval')
+    # Weight at the time of workout is joined in for calculating FTP_W/kg at point in time (of workout)
+    TD_df_L90D = curves.best(days=90, curve_only=False)
 
     # Don't show TD date when plotting a small chart ( <400 height)
     td_data_exists = len(TD_df_L90D) > 0 and height >= 400
     # If training distribution data exists
     if td_data_exists:
-        TD_df_L90D['act_name'] = TD_df_L90D['activity_id'].map(act_dict['act_name'])
         TD_df_L90D['ftp_wkg'] = TD_df_L90D['ftp'] / (TD_df_L90D['weight'] * 0.453592)
 
         ### Calculations for L90D workouts based on todays weights for stryd comparisons ###
@@ -393,138 +368,25 @@ def power_curve(activity_type='ride', power_unit='mmp', last_id=None, height=400
         # Muscle power is just best 10 second power
         muscle_power = TD_df_L90D.loc[10][power_unit]
 
-        TD_df_at = pd.read_sql(
-            sql=app.session.query(
-                func.max(stravaBestSamples.mmp).label('mmp'), stravaBestSamples.activity_id, stravaBestSamples.ftp,
-                stravaBestSamples.interval, stravaBestSamples.time_interval,
-                stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-            ).group_by(stravaBestSamples.interval).filter(stravaBestSamples.type.ilike(activity_type),
-                                                          or_(stravaBestSamples.interval == 10,
-                                                              stravaBestSamples.interval == int(fatigue_df.name),
-                                                              stravaBestSamples.interval == int(endurance_df.name)),
-                                                          ).statement, con=engine, index_col='interval')
+        TD_df_at = curves.all_time_best([10, fatigue_df.name, endurance_df.name])
 
         muscle_power_best = True if TD_df_at.loc[10][power_unit] == muscle_power else False
         endurance_best = True if TD_df_at.loc[endurance_df.name][power_unit] == endurance_df[power_unit] else False
         fatigue_best = True if TD_df_at.loc[fatigue_df.name][power_unit] == fatigue_df[power_unit] else False
 
-    # 1 second intervals from 0-60 seconds
-    interval_lengths = [i for i in range(1, 61)]
-    # 5 second intervals from 1:15 - 20:00 mins
-    interval_lengths += [i for i in range(65, 1201, 5)]
-    # 30 second intervals for everything after 20 mins
-    interval_lengths += [i for i in range(1230, (int(math.floor(max_interval / 10.0)) * 10) + 1, 30)]
-
-    all_best_interval_df = pd.read_sql(
-        sql=app.session.query(
-            func.max(stravaBestSamples.mmp).label('mmp'),
-            stravaBestSamples.activity_id, stravaBestSamples.interval, stravaBestSamples.time_interval,
-            stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-        ).group_by(stravaBestSamples.interval).filter(stravaBestSamples.interval.in_(interval_lengths),
-                                                      stravaBestSamples.type.ilike(activity_type)).statement,
-        con=engine, index_col='interval')
-    all_best_interval_df['act_name'] = all_best_interval_df['activity_id'].map(act_dict['act_name'])
-
-    L90D_best_interval_df = pd.read_sql(
-        sql=app.session.query(
-            func.max(stravaBestSamples.mmp).label('mmp'), stravaBestSamples.activity_id, stravaBestSamples.ftp,
-            stravaBestSamples.interval, stravaBestSamples.time_interval,
-            stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-        ).group_by(stravaBestSamples.interval).filter(stravaBestSamples.interval.in_(interval_lengths),
-                                                      stravaBestSamples.type.ilike(activity_type),
-                                                      stravaBestSamples.timestamp_local >= (
-                                                              datetime.now() - timedelta(days=90))
-                                                      ).statement, con=engine, index_col='interval')
-
-    L90D_best_interval_df['act_name'] = L90D_best_interval_df['activity_id'].map(act_dict['act_name'])
-
-    L6W_best_interval_df = pd.read_sql(
-        sql=app.session.query(
-            func.max(stravaBestSamples.mmp).label('mmp'), stravaBestSamples.activity_id,
-            stravaBestSamples.interval, stravaBestSamples.time_interval,
-            stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-        ).group_by(stravaBestSamples.interval).filter(stravaBestSamples.interval.in_(interval_lengths),
-                                                      stravaBestSamples.type.ilike(activity_type),
-                                                      stravaBestSamples.timestamp_local >= (
-                                                              datetime.now() - timedelta(days=42))
-                                                      ).statement, con=engine, index_col='interval')
-    L6W_best_interval_df['act_name'] = L6W_best_interval_df['activity_id'].map(act_dict['act_name'])
-
-    L30D_best_interval_df = pd.read_sql(
-        sql=app.session.query(
-            func.max(stravaBestSamples.mmp).label('mmp'), stravaBestSamples.activity_id,
-            stravaBestSamples.interval, stravaBestSamples.time_interval,
-            stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-        ).group_by(stravaBestSamples.interval).filter(stravaBestSamples.interval.in_(interval_lengths),
-                                                      stravaBestSamples.type.ilike(activity_type),
-                                                      stravaBestSamples.timestamp_local >= (
-                                                              datetime.now() - timedelta(days=30))
-                                                      ).statement, con=engine, index_col='interval')
-    L30D_best_interval_df['act_name'] = L30D_best_interval_df['activity_id'].map(act_dict['act_name'])
+    all_best_interval_df = curves.best()
+    L90D_best_interval_df = curves.best(days=90)
+    L6W_best_interval_df = curves.best(days=42)
+    L30D_best_interval_df = curves.best(days=30)
 
     if last_id:
-        recent_best_interval_df = pd.read_sql(
-            sql=app.session.query(
-                func.max(stravaBestSamples.mmp).label('mmp'), stravaBestSamples.activity_id,
-                stravaBestSamples.interval, stravaBestSamples.time_interval,
-                stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-            ).group_by(stravaBestSamples.interval).filter(stravaBestSamples.activity_id == last_id,
-                                                          stravaBestSamples.interval.in_(interval_lengths),
-                                                          ).statement, con=engine, index_col='interval')
-        recent_best_interval_df['act_name'] = recent_best_interval_df['activity_id'].map(act_dict['act_name'])
+        recent_best_interval_df = curves.best(activity_id=last_id)
 
     if time_comparison:
-        if intensity == 'all':
-            time_comparison_best_interval_df = pd.read_sql(
-                sql=app.session.query(
-                    func.max(stravaBestSamples.mmp).label('mmp'), stravaBestSamples.activity_id, stravaBestSamples.ftp,
-                    stravaBestSamples.interval, stravaBestSamples.time_interval,
-                    stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-                ).group_by(stravaBestSamples.interval).filter(stravaBestSamples.interval.in_(interval_lengths),
-                                                              stravaBestSamples.type.ilike(activity_type),
-                                                              stravaBestSamples.timestamp_local >= (
-                                                                      datetime.now() - timedelta(days=time_comparison))
-                                                              ).statement, con=engine, index_col='interval')
-            time_comparison_best_interval_df['act_name'] = time_comparison_best_interval_df['activity_id'].map(
-                act_dict['act_name'])
-        else:
-            # Join in intensity data from strava summary
-
-            pd.read_sql(
-                sql=app.session.query(stravaSummary.activity_id, stravaSummary.workout_intensity).statement,
-                con=engine)
-
-            time_comparison_best_interval_df = pd.read_sql(
-                sql=app.session.query(
-                    func.max(stravaBestSamples.mmp).label('mmp'), stravaBestSamples.activity_id, stravaBestSamples.ftp,
-                    stravaBestSamples.interval, stravaBestSamples.time_interval,
-                    stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-                ).join(stravaSummary, stravaBestSamples.activity_id == stravaSummary.activity_id,
-                       isouter=True).group_by(stravaBestSamples.interval).filter(
-                    stravaSummary.workout_intensity == intensity,
-                    stravaBestSamples.interval.in_(interval_lengths),
-                    stravaBestSamples.type.ilike(activity_type),
-                    stravaBestSamples.timestamp_local >= (
-                            datetime.now() - timedelta(days=time_comparison))
-                ).statement, con=engine, index_col='interval')
-            time_comparison_best_interval_df['act_name'] = time_comparison_best_interval_df['activity_id'].map(
-                act_dict['act_name'])
-
-            all_best_interval_df = pd.read_sql(
-                sql=app.session.query(
-                    func.max(stravaBestSamples.mmp).label('mmp'), stravaBestSamples.activity_id, stravaBestSamples.ftp,
-                    stravaBestSamples.interval, stravaBestSamples.time_interval,
-                    stravaBestSamples.date, stravaBestSamples.timestamp_local, stravaBestSamples.watts_per_kg,
-                ).join(stravaSummary, stravaBestSamples.activity_id == stravaSummary.activity_id,
-                       isouter=True).group_by(stravaBestSamples.interval).filter(
-                    stravaSummary.workout_intensity == intensity,
-                    stravaBestSamples.interval.in_(interval_lengths),
-                    stravaBestSamples.type.ilike(activity_type)
-                ).statement, con=engine, index_col='interval')
-            all_best_interval_df['act_name'] = all_best_interval_df['activity_id'].map(
-                act_dict['act_name'])
-
-    app.session.remove()
+        time_comparison_best_interval_df = curves.best(days=time_comparison, intensity=intensity)
+        if intensity != 'all':
+            # Compare against the all time best of the same intensity
+            all_best_interval_df = curves.best(intensity=intensity)
 
     if len(all_best_interval_df) < 1:
         return {}
@@ -945,29 +807,14 @@ def zone_chart(activity_id=None, sport='run', metrics=['power_zone', 'hr_zone'],
     # If activity_id passed, filter only that workout, otherwise show distribution across last 6 weeks
 
     if activity_id:
-        df_samples = pd.read_sql(
-            sql=app.session.query(stravaSamples).filter(stravaSamples.activity_id == activity_id).statement,
-            con=engine,
-            index_col=['timestamp_local'])
+        df_samples = load_samples(activity_id=activity_id, columns=metrics)
 
     else:
         if intensity == 'all':
-            df_samples = pd.read_sql(
-                sql=app.session.query(stravaSamples).filter(stravaSamples.type.like(sport),
-                                                            stravaSamples.timestamp_local >= (
-                                                                    datetime.now() - timedelta(
-                                                                days=days))).statement,
-                con=engine,
-                index_col=['timestamp_local'])
+            df_samples = load_samples(sport=sport, since=datetime.now() - timedelta(days=days), columns=metrics)
         else:
             # Join intensity from strava summary to samples and filter on intensity if passed as an argument
-            df_samples = pd.read_sql(
-                sql=app.session.query(stravaSamples).filter(stravaSamples.type.like(sport),
-                                                            stravaSamples.timestamp_local >= (
-                                                                    datetime.now() - timedelta(
-                                                                days=days))).statement,
-                con=engine,
-                index_col=['timestamp_local'])
+            df_samples = load_samples(sport=sport, since=datetime.now() - timedelta(days=days), columns=metrics)
             df_samples = df_samples.merge(pd.read_sql(
                 sql=app.session.query(stravaSummary.activity_id, stravaSummary.workout_intensity).statement,
                 con=engine), how='left', left_on='activity_id', right_on='activity_id')
@@ -1354,7 +1201,7 @@ def update_power_profiles(activity_type, power_unit, day_n_clicks, week_n_clicks
 
 
 def get_layout(**kwargs):
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_power = True if athlete_info.use_run_power or athlete_info.use_cycle_power else False
     app.session.remove()
 
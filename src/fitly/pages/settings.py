@@ -3,6 +3,7 @@ import dash_html_components as html
 from dash.dependencies import Input, Output, State
 import dash_core_components as dcc
 import dash_bootstrap_components as dbc
+import dash_table
 import dash_daq as daq
 from oura import OuraOAuth2Client
 from ..api.ouraAPI import oura_connected, connect_oura_link, save_oura_token
@@ -14,7 +15,9 @@ from withings_api import WithingsAuth, AuthScope
 import tekore as tk
 from ..api.sqlalchemy_declarative import stravaSummary, ouraSleepSummary, athlete, workoutStepLog, dbRefreshStatus
 from ..api.database import engine
+from ..api.athlete_settings import athlete_settings, invalidate_athlete_settings
 from ..api.datapull import refresh_database
+from ..api.pipeline_timings import stage_percentiles
 from sqlalchemy import delete
 import pandas as pd
 from dateutil.relativedelta import relativedelta
@@ -129,7 +132,7 @@ def generate_cycle_power_zone_card():
                                                                   stravaSummary.name.like('%ftp test%')).statement,
         con=engine)
     cftp = round(int(cftp.loc[cftp.index.max()].fillna(0)['average_watts']) * .95) if len(cftp) > 0 else 0
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_cycle_power = athlete_info.use_cycle_power
     app.session.remove()
 
@@ -190,7 +193,7 @@ def generate_run_power_zone_card():
     rftp = pd.read_sql(
         sql=app.session.query(stravaSummary.ftp).filter(stravaSummary.type.like('run')).statement, con=engine)
     rftp = int(rftp.loc[rftp.index.max()].fillna(0)['ftp']) if len(rftp) > 0 else 0
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     use_run_power = athlete_info.use_run_power
     app.session.remove()
 
@@ -232,7 +235,7 @@ def generate_run_power_zone_card():
 
 
 def athlete_card():
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
 
     app.session.remove()
     color = '' if athlete_info.name and athlete_info.birthday and athlete_info.sex and athlete_info.weight_lbs and athlete_info.resting_hr and athlete_info.run_ftp and athlete_info.ride_ftp else 'border-danger'
@@ -339,7 +342,7 @@ def generate_hr_zone_card():
         sql=app.session.query(ouraSleepSummary.hr_lowest).statement,
         con=engine)
     rhr = int(rhr.loc[rhr.index.max()]['hr_lowest']) if len(rhr) > 0 else 0
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     birthday = athlete_info.birthday
 
     app.session.remove()
@@ -390,7 +393,7 @@ def generate_db_setting(id, title, value, placeholder=None, input_type='text'):
 
 
 def goal_parameters():
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
 
     app.session.remove()
     use_readiness = True if athlete_info.weekly_workout_goal == 99 else False
@@ -447,8 +450,83 @@ def get_logs():
         children=[logs])
 
 
+def generate_pipeline_timings_table(days=30):
+    df = stage_percentiles(days)
+    for col in ['p50 (s)', 'p95 (s)', 'Max (s)']:
+        df[col] = df[col].map('{:,.2f}'.format)
+    df['Slowest activity'] = df['Slowest activity'].map(lambda x: '' if pd.isnull(x) else '{:.0f}'.format(x))
+    return dash_table.DataTable(
+        id='pipeline-timings-table',
+        columns=[{"name": i, "id": i} for i in df.columns],
+        data=df.to_dict('records'),
+        style_as_list_view=True,
+        fixed_rows={'headers': True, 'data': 0},
+        style_table={'height': '100%', 'overflowY': 'auto'},
+        style_header={
+            'backgroundColor': 'rgba(66, 66, 66, 0)',
+            'borderBottom': '1px solid rgb(220, 220, 220)',
+            'borderTop': '0px',
+            'textAlign': 'center',
+            'fontSize': 12,
+            'fontWeight': 'bold',
+            'fontFamily': '"Open Sans", "HelveticaNeue", "Helvetica Neue", Helvetica, Arial, sans-serif',
+        },
+        style_cell={
+            'backgroundColor': 'rgba(66, 66, 66, 0)',
+            'color': 'rgb(220, 220, 220)',
+            'borderBottom': '1px solid rgb(73, 73, 73)',
+            'textAlign': 'center',
+            'fontSize': 12,
+            'fontFamily': '"Open Sans", "HelveticaNeue", "Helvetica Neue", Helvetica, Arial, sans-serif',
+        },
+        page_action="none",
+    )
+
+
+def generate_callback_profile_table():
+    # Only imported when profiling, the query_stats module hooks into every db query
+    from ..api.query_stats import callback_profiles
+    df = pd.DataFrame(callback_profiles.summary(), columns=['function', 'callback', 'invocations', 'wall_ms_p50',
+                                                           'wall_ms_p95', 'wall_ms_max', 'queries_mean',
+                                                           'query_ms_mean', 'payload_bytes_max'])
+    df.columns = ['Function', 'Outputs', 'Calls', 'p50 (ms)', 'p95 (ms)', 'Max (ms)', 'Queries', 'Query (ms)',
+                  'Max Payload (KB)']
+    df['Max Payload (KB)'] = df['Max Payload (KB)'] / 1024
+    for col in ['p50 (ms)', 'p95 (ms)', 'Max (ms)', 'Query (ms)', 'Max Payload (KB)']:
+        df[col] = df[col].map('{:,.0f}'.format)
+    df['Queries'] = df['Queries'].map('{:,.1f}'.format)
+    return dash_table.DataTable(
+        id='callback-profile-table',
+        columns=[{"name": i, "id": i} for i in df.columns],
+        data=df.to_dict('records'),
+        style_as_list_view=True,
+        fixed_rows={'headers': True, 'data': 0},
+        style_table={'height': '100%', 'overflowY': 'auto'},
+        style_header={
+            'backgroundColor': 'rgba(66, 66, 66, 0)',
+            'borderBottom': '1px solid rgb(220, 220, 220)',
+            'borderTop': '0px',
+            'textAlign': 'center',
+            'fontSize': 12,
+            'fontWeight': 'bold',
+            'fontFamily': '"Open Sans", "HelveticaNeue", "Helvetica Neue", Helvetica, Arial, sans-serif',
+        },
+        style_cell={
+            'backgroundColor': 'rgba(66, 66, 66, 0)',
+            'color': 'rgb(220, 220, 220)',
+            'borderBottom': '1px solid rgb(73, 73, 73)',
+            'textAlign': 'center',
+            'textOverflow': 'ellipsis',
+            'maxWidth': 200,
+            'fontSize': 12,
+            'fontFamily': '"Open Sans", "HelveticaNeue", "Helvetica Neue", Helvetica, Arial, sans-serif',
+        },
+        page_action="none",
+    )
+
+
 def generate_settings_dashboard():
-    athlete_info = app.session.query(athlete).filter(athlete.athlete_id == 1).first()
+    athlete_info = athlete_settings()
     app.session.remove()
     # Only display reset hrv plan button if there is hrv data (from oura)
     if oura_credentials_supplied:
@@ -585,6 +663,19 @@ def generate_settings_dashboard():
                      children=[html.Div(id='goals', children=goal_parameters())]),
         ]),
         html.Div(id='settings-shelf-3', className='row align-items-start text-center mt-2 mb-2', children=[
+            # Callback profiles are only collected when [logger] callback_profiler is on
+            html.Div(id='callback-profile-container', className='col-lg-12', children=[
+                dbc.Card(className='mb-2', style={'height': '25vh'}, children=[
+                    dbc.CardHeader(html.H4(className='text-left mb-0', children='Callback Profiles')),
+                    dbc.CardBody(style={'overflowY': 'auto'}, children=[generate_callback_profile_table()])
+                ])
+            ]) if config.get('logger', 'callback_profiler', fallback='False').lower() == 'true' else html.Div(),
+            html.Div(id='pipeline-timings-container', className='col-lg-12', children=[
+                dbc.Card(className='mb-2', style={'height': '25vh'}, children=[
+                    dbc.CardHeader(html.H4(className='text-left mb-0', children='Refresh Timings (Last 30 Days)')),
+                    dbc.CardBody(style={'overflowY': 'auto'}, children=[generate_pipeline_timings_table()])
+                ])
+            ]),
             html.Div(id='logs-container', className='col-lg-12',
                      children=[
                          dbc.Card(style={'height': '25vh'}, children=[
@@ -624,6 +715,7 @@ def update_athlete_db_value(value, value_name):
     # Execute the insert
     try:
         app.session.commit()
+        invalidate_athlete_settings()
         success = True
         app.server.logger.debug(f'Updated {value_name} to {value}')
     except BaseException as e:
@@ -933,6 +1025,7 @@ def set_playlist_settings(spotify_playlists_switch):
         app.server.logger.info('Updating auto-generate spotify playlists = {}'.format(spotify_playlists_switch))
         athlete_info.spotify_playlists_switch = spotify_playlists_switch
         app.session.commit()
+        invalidate_athlete_settings()
     except BaseException as e:
         app.server.logger.error(e)
     app.session.remove()
@@ -950,6 +1043,7 @@ def set_playlist_intensity_settings(spotify_use_rec_intensity):
         app.server.logger.info('Updating spotify_use_rec_intensity = {}'.format(spotify_use_rec_intensity))
         athlete_info.spotify_use_rec_intensity = spotify_use_rec_intensity
         app.session.commit()
+        invalidate_athlete_settings()
     except BaseException as e:
         app.server.logger.error(e)
     app.session.remove()
@@ -998,6 +1092,7 @@ def user_power_data(run_dummy, cycle_dummy, run, cycle):
         athlete_info.use_run_power = run
         athlete_info.use_cycle_power = cycle
         app.session.commit()
+        invalidate_athlete_settings()
         app.server.logger.debug(f'use-run-power set to {run}, use-cycle-power set to {cycle}')
     except BaseException as e:
         app.server.logger.error(e)
@@ -1031,6 +1126,7 @@ def set_fitness_goals(readiness_dummy, hrv_dummy, readiness_switch, hrv_switch):
                 weekly_workout_goal if weekly_workout_goal != 99 or weekly_workout_goal != 100 else 'readiness score based'))
             athlete_info.weekly_workout_goal = weekly_workout_goal
             app.session.commit()
+            invalidate_athlete_settings()
     except BaseException as e:
         app.server.logger.error(e)
 
@@ -1089,8 +1185,7 @@ def reset_hrv_plan(n_clicks, metric_n_clicks, hrv_date):
                 query.completed = 0
                 app.session.commit()
             # Run the workflow
-            athlete_info = app.session.query(athlete).filter(
-                athlete.athlete_id == 1).first()
+            athlete_info = athlete_settings()
             training_workflow(min_non_warmup_workout_time=athlete_info.min_non_warmup_workout_time,
                               metric=athlete_info.recovery_metric)
             app.session.remove()
@@ -1273,8 +1368,7 @@ def query_peloton_bookmark_settings(fitness_discipline, effort):
     if fitness_discipline and effort:
         fitness_discipline = fitness_discipline.replace(' ', '_').lower()
         # Query athlete table for current peloton settings to show in value of dropdown
-        athlete_bookmarks = json.loads(app.session.query(athlete.peloton_auto_bookmark_ids).filter(
-            athlete.athlete_id == 1).first().peloton_auto_bookmark_ids)
+        athlete_bookmarks = json.loads(athlete_settings().peloton_auto_bookmark_ids)
 
         app.session.remove()
         if athlete_bookmarks:
@@ -1335,6 +1429,7 @@ def save_peloton_bookmark_settings(n_clicks, fitness_discipline, effort, options
 
             # write back to database
             app.session.commit()
+            invalidate_athlete_settings()
 
             app.session.remove()
             return {'color': 'green', 'fontSize': '150%'}
@@ -0,0 +1,17 @@
+"""Run the tests against a scratch copy of config/config.ini.example and an empty sqlite db.
+
+fitly reads ./config/config.ini when it is imported, so the working directory is switched before any test module
+imports it.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "src"))
+
+workdir = tempfile.mkdtemp(prefix="fitly-tests-")
+os.makedirs(os.path.join(workdir, "config"))
+shutil.copy(os.path.join(root, "config", "config.ini.example"), os.path.join(workdir, "config", "config.ini"))
+os.chdir(workdir)
@@ -0,0 +1,28 @@
+from sqlalchemy import inspect
+
+import fitly.app
+from fitly.api.database import engine
+from fitly import benchmarks
+
+
+def test_bench_zones():
+    result = benchmarks.bench_zones(hours=0.1)
+
+    assert result['rows'] == 360
+    assert result['identical']
+
+
+def test_bench_bulk_insert():
+    result = benchmarks.bench_bulk_insert(rows=500, repeat=1)
+
+    assert result['rows'] == 500
+    assert result['identical']
+    assert not inspect(engine).has_table('benchmark_samples_before')
+    assert not inspect(engine).has_table('benchmark_samples_after')
+
+
+def test_bench_streams():
+    result = benchmarks.bench_streams(hours=0.25)
+
+    assert result['samples'] < 900
+    assert result['identical']
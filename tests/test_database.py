@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+import fitly.app
+from fitly.api.database import engine, bulk_write, bulk_insert
+
+batch = 2000
+
+
+def best_samples(activity_id):
+    return pd.DataFrame({'activity_id': activity_id, 'interval': range(1, batch + 1), 'mmp': 200.0, 'type': 'Ride'})
+
+
+def test_journal_mode_is_wal():
+    with engine.connect() as connection:
+        assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+
+
+def test_dashboard_reads_during_refresh():
+    # A refresh writing activities one transaction at a time while a dashboard callback keeps reading
+    writing = threading.Event()
+    done = threading.Event()
+    errors = []
+
+    def refresh():
+        try:
+            for activity_id in range(1, 6):
+                with bulk_write() as connection:
+                    bulk_insert(best_samples(activity_id), 'strava_best_samples', connection, index=False)
+                    writing.set()
+                    # Hold the write transaction open like a long activity would
+                    time.sleep(0.2)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    writer = threading.Thread(target=refresh)
+    writer.start()
+    writing.wait(5)
+    reads, slowest = [], 0
+    try:
+        while not done.is_set():
+            start = time.perf_counter()
+            with engine.connect() as connection:
+                reads.append(connection.execute(text('SELECT COUNT(*) FROM strava_best_samples')).scalar())
+            slowest = max(slowest, time.perf_counter() - start)
+    finally:
+        writer.join()
+        with engine.begin() as connection:
+            connection.execute(text('DELETE FROM strava_best_samples'))
+
+    assert not errors
+    assert len(reads) > 10
+    # Readers never wait on the writer and only ever see whole activities
+    assert slowest < 0.1
+    assert all(count % batch == 0 for count in reads)
+    assert reads == sorted(reads)
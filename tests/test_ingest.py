@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+import fitly.app
+from fitly.api import datapull
+from fitly.utils import config
+
+
+class Activity:
+    # Stands in for a FitlyActivity: scraping is stubbed, writing records the order activities land in
+
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+
+    def write_dfs_to_db(self):
+        self.log.write(self)
+
+
+class Log:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+        self.unwritten = 0
+        self.max_unwritten = 0
+        self.writer_threads = set()
+        self.batches = []
+
+    def scrape(self, fitly_act, athlete_id):
+        with self.lock:
+            self.events.append(('scrape', fitly_act.name))
+            self.running += 1
+            self.unwritten += 1
+            self.max_running = max(self.max_running, self.running)
+            self.max_unwritten = max(self.max_unwritten, self.unwritten)
+        # Later activities finish first, so the writer sees them out of order
+        time.sleep(0.02 if fitly_act.name.endswith('0') else 0.005)
+        with self.lock:
+            self.running -= 1
+        if 'fail' in fitly_act.name:
+            raise ValueError('strava streams unavailable')
+        fitly_act.df_samples = True
+        return fitly_act
+
+    def write(self, fitly_act):
+        with self.lock:
+            self.events.append(('write', fitly_act.name))
+            self.unwritten -= 1
+            self.writer_threads.add(threading.current_thread())
+
+    def position(self, kind, name):
+        return self.events.index((kind, name))
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    def run(names, workers=3):
+        monkeypatch.setitem(config['strava'], 'ingest_workers', str(workers))
+        log = run.log = Log()
+        write_activities = datapull.write_activities
+
+        def record_batch(futures):
+            futures = list(futures)
+            log.batches.append(len(futures))
+            return write_activities(futures)
+
+        monkeypatch.setattr(datapull, 'scrape_activity', log.scrape)
+        monkeypatch.setattr(datapull, 'write_activities', record_batch)
+        datapull.ingest_activities([Activity(name, log) for name in names], athlete_id=1)
+        return log
+
+    return run
+
+
+def test_every_activity_is_written_once_by_the_calling_thread(ingest):
+    names = ['ride {}'.format(i) for i in range(25)]
+    log = ingest(names, workers=3)
+
+    assert sorted(name for kind, name in log.events if kind == 'write') == sorted(names)
+    assert log.writer_threads == {threading.current_thread()}
+    # Scrapes ran concurrently, on no more threads than the pool has
+    assert 1 < log.max_running <= 3
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4])
+def test_pending_activities_are_capped(ingest, workers):
+    log = ingest(['run {}'.format(i) for i in range(30)], workers=workers)
+
+    assert log.max_unwritten <= workers * 2
+    assert all(batch <= workers * 2 for batch in log.batches)
+
+
+def test_ftp_test_is_written_before_later_activities_are_scraped(ingest):
+    before = ['ride {}'.format(i) for i in range(5)]
+    after = ['ride {}'.format(i) for i in range(6, 12)]
+    log = ingest(before + ['Ramp FTP Test'] + after, workers=4)
+
+    last_write = max(log.position('write', name) for name in before + ['Ramp FTP Test'])
+    first_scrape = min(log.position('scrape', name) for name in after)
+    assert last_write < first_scrape
+
+
+def test_failed_scrapes_are_counted_after_the_rest_are_written(ingest):
+    names = ['ride 1', 'fail 2', 'ride 3', 'fail 4', 'ride 5']
+    with pytest.raises(Exception, match='2 strava activities failed to import'):
+        ingest(names, workers=2)
+
+    assert sorted(name for kind, name in ingest.log.events if kind == 'write') == ['ride 1', 'ride 3', 'ride 5']
+
+
+def test_interrupts_are_not_swallowed_by_the_writer(ingest, monkeypatch):
+    def interrupt(self):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(Activity, 'write_dfs_to_db', interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        ingest(['ride 1', 'ride 2'], workers=1)
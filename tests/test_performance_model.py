@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fitly.api.performance_model import fitness, fatigue, form, ramp_rate
+
+forecast_days = 13
+
+
+def loop_load(stress, time_constant, initial=0):
+    # The recursion create_fitness_chart used to run row by row
+    decay = np.exp(-1 / time_constant)
+    load = pd.Series(np.nan, index=stress.index)
+    load.iloc[0] = (stress.iloc[0] * (1 - decay)) + (initial * decay)
+    for i in range(1, len(load)):
+        load.iloc[i] = (stress.iloc[i] * (1 - decay)) + (load.iloc[i - 1] * decay)
+    return load
+
+
+@pytest.fixture
+def daily_stress():
+    # Workouts with rest days in between (missing days), doubles, a workout without a stress score and the forecast
+    # tail, summed to days like the chart does
+    workouts = pd.Series([80.0, 45.0, 30.0, np.nan, 120.0, 60.0, 95.0, 0.0, 150.0, 70.0],
+                         index=pd.to_datetime(['2021-01-01 07:00', '2021-01-01 18:00', '2021-01-02 07:00',
+                                               '2021-01-04 07:00', '2021-01-09 07:00', '2021-01-10 07:00',
+                                               '2021-02-14 07:00', '2021-02-15 07:00', '2021-03-01 07:00',
+                                               '2021-03-01 17:00']))
+    forecast_end = workouts.index.max().normalize() + pd.Timedelta(days=forecast_days)
+    stress = workouts.groupby(workouts.index.normalize()).sum()
+    return stress.reindex(pd.date_range(stress.index.min(), forecast_end, freq='D'), fill_value=0)
+
+
+def test_daily_stress_fixture(daily_stress):
+    # Same days as the old resample of the workouts plus a dummy forecast row
+    workouts = pd.Series([80.0, np.nan], index=pd.to_datetime(['2021-01-01 07:00', '2021-01-04 07:00']))
+    workouts[pd.Timestamp('2021-01-08')] = None
+    pd.testing.assert_series_equal(workouts.resample('D').sum(),
+                                   workouts.groupby(workouts.index.normalize()).sum().reindex(
+                                       pd.date_range('2021-01-01', '2021-01-08', freq='D'), fill_value=0),
+                                   check_freq=False)
+
+    assert len(daily_stress) == 73
+    assert daily_stress['2021-01-03'] == 0
+    assert daily_stress['2021-01-04'] == 0
+    assert daily_stress['2021-01-01'] == 125
+
+
+@pytest.mark.parametrize('initial', [0, 35.5])
+def test_loads_match_loop(daily_stress, initial):
+    ctl = fitness(daily_stress, initial=initial)
+    atl = fatigue(daily_stress, initial=initial)
+
+    pd.testing.assert_series_equal(ctl, loop_load(daily_stress, 42, initial), check_names=False)
+    pd.testing.assert_series_equal(atl, loop_load(daily_stress, 7, initial), check_names=False)
+
+
+@pytest.mark.parametrize('time_constant', [1, 14, 90])
+def test_other_time_constants_match_loop(daily_stress, time_constant):
+    pd.testing.assert_series_equal(fitness(daily_stress, time_constant=time_constant),
+                                   loop_load(daily_stress, time_constant), check_names=False)
+
+
+def test_form_and_ramp_rate_match_loop(daily_stress):
+    ctl = loop_load(daily_stress, 42)
+    atl = loop_load(daily_stress, 7)
+
+    pd.testing.assert_series_equal(form(fitness(daily_stress), fatigue(daily_stress)), ctl.shift(1) - atl.shift(1),
+                                   check_names=False)
+    pd.testing.assert_series_equal(ramp_rate(fitness(daily_stress)), ctl - ctl.shift(7), check_names=False)
+
+
+def test_zero_seed_without_stress():
+    stress = pd.Series(0.0, index=pd.date_range('2021-01-01', periods=20, freq='D'))
+
+    assert (fitness(stress) == 0).all()
+    assert (fatigue(stress) == 0).all()
+    assert form(fitness(stress), fatigue(stress)).iloc[1:].eq(0).all()
+    assert np.isnan(form(fitness(stress), fatigue(stress)).iloc[0])
+
+
+def test_pinned_values(daily_stress):
+    # Values of the old loop on the last actual day and at the end of the forecast
+    ctl = fitness(daily_stress)
+    atl = fatigue(daily_stress)
+    tsb = form(ctl, atl)
+
+    assert ctl['2021-03-01'] == pytest.approx(8.9069, abs=1e-4)
+    assert atl['2021-03-01'] == pytest.approx(30.7925, abs=1e-4)
+    assert tsb['2021-03-01'] == pytest.approx(2.0838, abs=1e-4)
+    assert ctl.iloc[-1] == pytest.approx(6.5359, abs=1e-4)
+    assert atl.iloc[-1] == pytest.approx(4.8073, abs=1e-4)
+    assert tsb.iloc[-1] == pytest.approx(1.1479, abs=1e-4)
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import fitly.app
+from fitly.api.database import engine
+from fitly.api.power_curves import rebuild_power_curve_bests
+from fitly.pages.power import power_profiles
+
+
+@pytest.fixture
+def weight_change():
+    # Same month: the first ride has the higher watts, the second (after losing weight) the higher W/kg
+    best_samples = pd.DataFrame({'activity_id': [1, 2], 'interval': 60, 'mmp': [400.0, 390.0], 'ftp': 250.0,
+                                 'watts_per_kg': [4.4, 4.8],
+                                 'timestamp_local': [datetime(2021, 3, 2, 8), datetime(2021, 3, 20, 8)],
+                                 'time_interval': datetime(1970, 1, 1), 'type': 'Ride',
+                                 'date': [datetime(2021, 3, 2).date(), datetime(2021, 3, 20).date()],
+                                 'act_name': 'Ride', 'athlete_id': 1})
+    best_samples.to_sql('strava_best_samples', engine, if_exists='append', index=False)
+    rebuild_power_curve_bests()
+    yield
+    with engine.begin() as connection:
+        connection.exec_driver_sql('DELETE FROM strava_best_samples')
+        connection.exec_driver_sql('DELETE FROM power_curve_bests')
+
+
+@pytest.mark.parametrize('group', ['D', 'W', 'M', 'Y'])
+@pytest.mark.parametrize('power_unit, best, activity_id', [('mmp', 400.0, 1), ('watts_per_kg', 4.8, 2)])
+def test_power_profile_best_per_unit(weight_change, group, power_unit, best, activity_id):
+    bar = power_profiles(60, activity_type='ride', power_unit=power_unit, group=group)['data'][0]
+
+    assert max(bar.y) == best
+    assert bar.customdata[list(bar.y).index(best)].startswith('{}_60_'.format(activity_id))
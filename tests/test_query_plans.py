@@ -0,0 +1,132 @@
+"""EXPLAIN QUERY PLAN checks for the keyed page queries.
+
+Each test runs a page query on a small sqlite db, captures the statements it sends and fails if sqlite plans a full
+SCAN of strava_summary, strava_best_samples or strava_samples_compact for any of them. Queries that load every
+activity of a sport (the PMC, the ftp / yoy charts) read the whole table by design and are not covered.
+"""
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from sqlalchemy import event, inspect
+
+# The api modules import the app, create it (and the schema) first like fitly.wsgi does
+import fitly.app
+from fitly.api.database import engine
+from fitly.api.migrations import migrate
+from fitly.api.power_curves import PowerCurveSamples, interval_bests, rebuild_power_curve_bests
+from fitly.api.samples import load_samples
+from fitly.api.sqlalchemy_declarative import Base
+from fitly.pages.performance import create_activity_table
+from fitly.pages.power import get_workout_title
+
+scanned_tables = ('strava_summary', 'strava_best_samples', 'strava_samples_compact')
+full_scan = re.compile(r'^SCAN (TABLE )?({})\b'.format('|'.join(scanned_tables)))
+
+activity_id = 1001
+start = datetime.now().replace(microsecond=0) - timedelta(days=3)
+
+
+@pytest.fixture(scope='module', autouse=True)
+def activity():
+    summary = pd.DataFrame({'start_date_utc': [start + timedelta(hours=4)], 'activity_id': [activity_id],
+                            'athlete_id': [1], 'name': ['Morning Ride'], 'type': ['Ride'], 'elapsed_time': [3600],
+                            'distance': [20.0], 'start_date_local': [start], 'start_day_local': [start.date()],
+                            'weight': [150.0], 'workout_intensity': ['mod']})
+    samples = pd.DataFrame({'activity_id': activity_id, 'time': range(3600), 'watts': 200, 'heartrate': 140})
+    best_samples = pd.DataFrame({'activity_id': activity_id, 'interval': range(1, 3601), 'mmp': 200.0, 'ftp': 250.0,
+                                 'watts_per_kg': 2.9, 'timestamp_local': start, 'time_interval': datetime(1970, 1, 1),
+                                 'type': 'Ride', 'date': start.date(), 'act_name': 'Morning Ride', 'athlete_id': 1})
+    summary.to_sql('strava_summary', engine, if_exists='append', index=False)
+    samples.to_sql('strava_samples_compact', engine, if_exists='append', index=False)
+    best_samples.to_sql('strava_best_samples', engine, if_exists='append', index=False)
+    rebuild_power_curve_bests()
+    yield
+    with engine.begin() as connection:
+        for table in scanned_tables + ('power_curve_bests',):
+            connection.exec_driver_sql('DELETE FROM {}'.format(table))
+
+
+@contextmanager
+def captured_selects():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+
+def assert_no_full_scans(statements):
+    assert statements, 'No statements were captured'
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            scans = [row[-1] for row in plan if full_scan.match(row[-1])]
+            assert not scans, '{}\n{}'.format(statement, '\n'.join(row[-1] for row in plan))
+
+
+def test_workout_samples():
+    # Workout modal and the single workout zone chart
+    with captured_selects() as statements:
+        assert len(load_samples(activity_id=activity_id)) == 3600
+    assert_no_full_scans(statements)
+
+
+def test_samples_since():
+    # zone_chart over the last n days
+    with captured_selects() as statements:
+        assert len(load_samples(sport='ride', since=datetime.now() - timedelta(days=7),
+                                columns=['watts', 'heartrate'])) == 3600
+    assert_no_full_scans(statements)
+
+
+def test_power_curve():
+    with captured_selects() as statements:
+        curves = PowerCurveSamples(activity_type='ride', windows=[(None, 'all'), (90, 'all'), (42, 'all'),
+                                                                  (30, 'all'), (90, 'mod')], last_id=activity_id)
+        assert len(curves.best(days=90)) > 0
+        curves.all_time_best([10, 60, 1200])
+    assert_no_full_scans(statements)
+
+
+@pytest.mark.parametrize('power_unit', ['mmp', 'watts_per_kg'])
+@pytest.mark.parametrize('period', ['D', 'W', 'M', 'Y'])
+def test_power_profiles(period, power_unit):
+    with captured_selects() as statements:
+        assert len(interval_bests(60, activity_type='ride', period=period, power_unit=power_unit)) > 0
+    assert_no_full_scans(statements)
+
+
+def test_workout_title():
+    with captured_selects() as statements:
+        get_workout_title(activity_id)
+    assert_no_full_scans(statements)
+
+
+def test_activity_table():
+    with captured_selects() as statements:
+        create_activity_table(start.date())
+    assert_no_full_scans(statements)
+
+
+def test_migrate_adds_missing_indexes():
+    # Databases from before the indexes were declared get them on startup
+    indexes = {index.name: table for table in scanned_tables for index in Base.metadata.tables[table].indexes}
+    with engine.begin() as connection:
+        for name in indexes:
+            connection.exec_driver_sql('DROP INDEX {}'.format(name))
+
+    migrate(engine)
+    migrate(engine)
+
+    inspector = inspect(engine)
+    for name, table in indexes.items():
+        assert name in [index['name'] for index in inspector.get_indexes(table)]
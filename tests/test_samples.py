@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from sqlalchemy import Column, MetaData, Table, BigInteger, Date, DateTime, Float, Integer, String, inspect
+
+import fitly.app
+from fitly.api.database import engine
+from fitly.api.migrations import migrate
+from fitly.api.samples import load_samples, compact_strava_samples, legacy_samples_exist
+
+start = datetime.now().replace(microsecond=0) - timedelta(days=2)
+legacy_id, compact_id = 2001, 2002
+
+# strava_samples as databases from before strava_samples_compact have it
+legacy_samples = Table(
+    'strava_samples', MetaData(),
+    Column('timestamp_local', DateTime(), index=True, primary_key=True), Column('timestamp_utc', DateTime()),
+    Column('time_interval', DateTime()), Column('activity_id', BigInteger()), Column('date', Date()),
+    Column('type', String(255)), Column('act_name', String(255)), Column('athlete_id', BigInteger()),
+    *[Column(column, Float()) for column in ['distance', 'velocity_smooth', 'temp', 'altitude', 'latitude',
+                                             'longitude', 'grade_smooth', 'ftp']],
+    *[Column(column, Integer()) for column in ['heartrate', 'cadence', 'watts', 'moving', 'time', 'power_zone',
+                                               'hr_zone', 'hr_lowest']])
+
+
+def samples(activity_id, offset):
+    return pd.DataFrame({'activity_id': activity_id, 'time': range(600), 'watts': range(offset, offset + 600),
+                         'heartrate': 130})
+
+
+@pytest.fixture
+def uncompacted_db():
+    pd.DataFrame({'start_date_utc': [start, start + timedelta(hours=5)], 'activity_id': [legacy_id, compact_id],
+                  'athlete_id': 1, 'name': ['Old Ride', 'New Ride'], 'type': 'Ride', 'elapsed_time': 600,
+                  'start_date_local': [start, start + timedelta(hours=1)]}).to_sql(
+        'strava_summary', engine, if_exists='append', index=False)
+    samples(compact_id, 200).to_sql('strava_samples_compact', engine, if_exists='append', index=False)
+    legacy_samples.create(engine)
+    legacy = samples(legacy_id, 100)
+    legacy['timestamp_local'] = start + pd.to_timedelta(legacy['time'], unit='s')
+    legacy['type'] = 'Ride'
+    legacy.to_sql('strava_samples', engine, if_exists='append', index=False)
+    yield
+    legacy_samples.drop(engine, checkfirst=True)
+    with engine.begin() as connection:
+        connection.exec_driver_sql('DELETE FROM strava_summary')
+        connection.exec_driver_sql('DELETE FROM strava_samples_compact')
+
+
+def test_legacy_samples_are_read_until_compacted(uncompacted_db):
+    migrate(engine)
+    assert 'ix_strava_samples_activity_id' in [index['name'] for index in inspect(engine).get_indexes('strava_samples')]
+
+    legacy = load_samples(activity_id=legacy_id)
+    assert len(legacy) == 600
+    assert legacy['watts'].tolist() == list(range(100, 700))
+    assert legacy.index[0] == pd.Timestamp(start)
+    assert (legacy['act_name'] == 'Old Ride').all()
+
+    recent = load_samples(sport='ride', since=start, columns=['watts'])
+    assert sorted(recent['activity_id'].unique()) == [legacy_id, compact_id]
+    assert len(recent) == 1200
+
+    compact_strava_samples()
+    assert not legacy_samples_exist()
+    pd.testing.assert_frame_equal(load_samples(activity_id=legacy_id), legacy, check_dtype=False)
+    pd.testing.assert_frame_equal(load_samples(sport='ride', since=start, columns=['watts']), recent,
+                                  check_dtype=False)
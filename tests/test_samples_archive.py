@@ -0,0 +1,20 @@
+import importlib
+import sys
+
+import fitly.app
+from fitly.api import samples_archive
+from fitly.utils import config
+
+
+def test_archive_stays_off_without_pyarrow(monkeypatch, caplog):
+    monkeypatch.setitem(config['strava'], 'samples_archive', 'True')
+    # None in sys.modules makes the import raise ImportError whether or not pyarrow is installed
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    try:
+        importlib.reload(samples_archive)
+        assert samples_archive.archive_enabled is False
+        assert 'pyarrow is not installed' in caplog.text
+    finally:
+        monkeypatch.undo()
+        importlib.reload(samples_archive)
+    assert samples_archive.archive_enabled is False
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from fitly.api.streams import normalize_streams
+
+start_local = datetime(2021, 5, 1, 8, 0, 0)
+start_utc = datetime(2021, 5, 1, 12, 0, 0)
+
+
+def test_grid_starts_on_first_sample():
+    df = normalize_streams({'time': [5, 6, 7, 9], 'watts': [100, 110, 120, 140]}, start_local, start_utc)
+
+    assert len(df) == 5
+    assert df['time'].tolist() == [5, 6, 7, 8, 9]
+    assert df['time'].is_unique
+    assert df['watts'].tolist() == [100, 110, 120, 130, 140]
+    assert df.index[0] == pd.Timestamp('2021-05-01 08:00:05')
+    assert df.index[-1] == pd.Timestamp('2021-05-01 08:00:09')
+    assert df['timestamp_utc'].iloc[0] == pd.Timestamp('2021-05-01 12:00:05')
+    assert df['time_interval'].iloc[0] == pd.Timestamp('1970-01-01 00:00:05')
+
+
+def test_samples_without_a_time_are_dropped():
+    df = normalize_streams({'time': [None, 3, 4, np.nan, 6], 'heartrate': [90, 100, 101, 150, 103]}, start_local,
+                           start_utc)
+
+    assert df['time'].tolist() == [3, 4, 5, 6]
+    # The untimed 90 and 150 bpm samples don't leak into the grid
+    assert df['heartrate'].tolist() == [100, 101, 102, 103]
+
+
+def test_stream_only_sampled_without_times_is_dropped():
+    df = normalize_streams({'time': [None, 1, 2], 'watts': [200, None, None], 'latlng': [[40.0, -74.0], None, None]},
+                           start_local, start_utc)
+
+    assert 'watts' not in df.columns
+    assert df['latitude'].isna().all()
+
+
+def test_empty_time_stream():
+    assert normalize_streams({'time': [], 'watts': []}, start_local, start_utc) is None
+    assert normalize_streams({'time': [None, None], 'watts': [1, 2]}, start_local, start_utc) is None
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fitly.api.zones import classify_zones, zone_thresholds, sport_family, zone_intensity_seconds
+
+ride_thresholds = zone_thresholds(250, [0.55, 0.75, 0.90, 1.05, 1.20, 1.50])
+run_thresholds = zone_thresholds(300, [0.80, 0.90, 1.00, 1.15, 99, 99])
+hr_thresholds = zone_thresholds(130, [0.60, 0.70, 0.80, 0.90], offset=55)
+
+
+def ladder_zone(value, thresholds):
+    # The if/elif ladder calculate_power_zones / calculate_heartate_zones ran per sample
+    for zone, threshold in enumerate(thresholds, start=1):
+        if value <= threshold:
+            return zone
+    return len(thresholds) + 1
+
+
+def ladder_intensity(zone, activity_type, metric):
+    # The nested ternaries calculate_zone_intensities ran per sample
+    if metric == 'power':
+        if 'run' in activity_type.lower() or 'walk' in activity_type.lower():
+            return 'low' if zone in [1, 2] else 'med' if zone == 3 else 'high' if zone in [4, 5] else None
+        elif 'ride' in activity_type.lower():
+            return 'low' if zone in [1, 2, 3] else 'med' if zone == 4 else 'high' if zone in [5, 6, 7] else None
+    elif metric == 'heartrate':
+        return 'low' if zone in [1, 2] else 'med' if zone == 3 else 'high' if zone in [4, 5] else None
+
+
+def boundary_values(thresholds):
+    # Each threshold, either side of it, and values outside the table
+    values = [-1, 0, max(thresholds) + 1000, np.nan]
+    for threshold in thresholds:
+        values += [threshold - 1, threshold - 0.5, threshold, threshold + 0.5, threshold + 1]
+    return values
+
+
+@pytest.mark.parametrize('thresholds', [
+    ride_thresholds,
+    run_thresholds,
+    hr_thresholds,
+    # Not ascending: zone tables edited out of order
+    [100, 200, 150, 250],
+    [300, 100, 200],
+    [150, 150, 120, 180, 180],
+])
+def test_classify_zones_matches_ladder(thresholds):
+    values = boundary_values(thresholds)
+
+    np.testing.assert_array_equal(classify_zones(values, thresholds),
+                                  [ladder_zone(value, thresholds) for value in values])
+
+
+@pytest.mark.parametrize('zone', range(1, 8))
+def test_value_on_threshold_is_in_lower_zone(zone):
+    thresholds = ride_thresholds
+    if zone <= len(thresholds):
+        assert classify_zones([thresholds[zone - 1]], thresholds)[0] == zone
+    assert classify_zones([thresholds[zone - 2] + 1 if zone > 1 else 0], thresholds)[0] == zone
+
+
+@pytest.mark.parametrize('activity_type, metric, thresholds', [
+    ('Ride', 'power', ride_thresholds),
+    ('VirtualRide', 'power', ride_thresholds),
+    ('Run', 'power', run_thresholds),
+    ('Walk', 'power', run_thresholds),
+    ('Run', 'heartrate', hr_thresholds),
+    ('Swim', 'heartrate', hr_thresholds),
+    ('Swim', 'power', ride_thresholds),
+])
+def test_intensity_seconds_match_ladder(activity_type, metric, thresholds):
+    rng = np.random.default_rng(7)
+    samples = pd.Series(rng.integers(0, int(max(thresholds[:4]) * 1.6), 3600).astype('float64'))
+    samples[rng.integers(0, 3600, 50)] = np.nan
+    zones = pd.Series(classify_zones(samples, thresholds))
+
+    expected = pd.Series([ladder_intensity(ladder_zone(value, thresholds), activity_type, metric)
+                          for value in samples]).value_counts()
+    seconds = zone_intensity_seconds(zones, family=sport_family(activity_type), metric=metric)
+
+    if activity_type == 'Swim' and metric == 'power':
+        # No zones to intensity mapping, the ladder left every sample without an intensity too
+        assert seconds is None and len(expected) == 0
+    else:
+        assert seconds.sort_index().to_dict() == expected.sort_index().to_dict()